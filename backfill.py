@@ -0,0 +1,228 @@
+"""历史排行榜回填"""
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from typing import TYPE_CHECKING, Dict, List, Optional, Set, Tuple
+
+import requests
+
+from config import BACKFILL_CONFIG, BackfillConfig
+from pixiv_download import PixivDownloader
+from pixiv_pipeline import DownloadPipeline
+from work_queue import WorkQueue
+
+if TYPE_CHECKING:
+    from pixiv_spider import PixivSpider
+
+# (排行榜类型, 日期YYYYMMDD)
+Ranking = Tuple[str, str]
+
+# 每次批量查询完成状态的作品数
+_SYNC_BATCH = 500
+
+
+class RankingBackfill:
+    """
+    按日期范围回填排行榜
+
+    每批日期的排行榜页并发获取，合并为去重后的作品集合再进入下载流水线，
+    连续多天上榜的作品只下载一次。每批完成后把没有失败作品的排行榜写入
+    Redis断点，中断后重新运行会跳过已完成的日期。
+    """
+
+    def __init__(
+        self,
+        spider: 'PixivSpider',
+        downloader: PixivDownloader,
+        config: BackfillConfig = BACKFILL_CONFIG
+    ):
+        """
+        初始化回填任务
+
+        参数:
+            spider: 提供排行榜请求、进度条和日志的爬虫实例
+            downloader: 图片下载器
+            config: 回填配置
+        """
+        self.spider = spider
+        self.downloader = downloader
+        self.redis = spider.redis
+        self.log = spider._update_log
+        self.config = config
+        self.failure_causes: Dict[str, str] = {}
+
+    @staticmethod
+    def _member(ranking: Ranking) -> str:
+        """断点集合中的成员名"""
+        mode, day = ranking
+        return f"{mode}:{day}"
+
+    def pending_rankings(self, start: date, end: date, modes: List[str]) -> List[Ranking]:
+        """
+        获取尚未完成回填的排行榜，按日期升序
+
+        参数:
+            start: 起始日期(包含)
+            end: 结束日期(包含)
+            modes: 排行榜类型列表
+
+        返回:
+            list: 待回填的排行榜
+        """
+        done = self.redis.get_backfill_done()
+        rankings = []
+        day = start
+        while day <= end:
+            for mode in modes:
+                ranking = (mode, day.strftime('%Y%m%d'))
+                if self._member(ranking) not in done:
+                    rankings.append(ranking)
+            day += timedelta(days=1)
+        return rankings
+
+    def _fetch_page(self, ranking: Ranking, page: int) -> Optional[List[Dict]]:
+        """
+        获取单个排行榜页
+
+        超出排行榜页数时接口返回带错误信息的JSON而没有contents，只有第2页
+        之后才按排行榜结束处理；第1页没有contents(尚未发布、cookie失效、
+        被限流等)或error为true的响应都视为获取失败。
+
+        返回:
+            list: 作品数据，超出排行榜页数时为空列表；获取失败返回None
+        """
+        mode, day = ranking
+        try:
+            data = self.spider.get_ranking_data(page, mode=mode, date=day)
+        except (requests.RequestException, ValueError) as e:
+            self.log(f'[red]获取{mode}排行榜 {day} 第{page}页时发生错误：{str(e)}[/red]')
+            return None
+        if isinstance(data, dict) and isinstance(data.get('contents'), list):
+            return data['contents']
+        error = data.get('error') if isinstance(data, dict) else None
+        if page > 1 and isinstance(error, str) and error:
+            return []
+        self.log(f'[red]获取{mode}排行榜 {day} 第{page}页时返回异常数据：{str(data)[:200]}[/red]')
+        return None
+
+    def _collect(
+        self,
+        rankings: List[Ranking]
+    ) -> Tuple[Dict[str, str], Dict[Ranking, Set[str]], Set[Ranking]]:
+        """
+        并发获取一批排行榜的所有页并合并去重
+
+        返回:
+            tuple: (作品ID到作者ID的映射, 每个排行榜包含的作品, 获取失败的排行榜)
+        """
+        jobs = [
+            (ranking, page)
+            for ranking in rankings
+            for page in range(1, self.config.max_pages + 1)
+        ]
+        works: Dict[str, str] = {}
+        members: Dict[Ranking, Set[str]] = {ranking: set() for ranking in rankings}
+        broken: Set[Ranking] = set()
+
+        with ThreadPoolExecutor(max_workers=self.config.fetch_workers) as pool:
+            results = pool.map(lambda job: self._fetch_page(*job), jobs)
+            for (ranking, _), items in zip(jobs, results):
+                if items is None:
+                    broken.add(ranking)
+                    continue
+                for item in items:
+                    work_id = str(item['illust_id'])
+                    works.setdefault(work_id, str(item['user_id']))
+                    members[ranking].add(work_id)
+        return works, members, broken
+
+    def _filter_pending(self, works: Dict[str, str]) -> List[str]:
+        """批量写入作者ID并筛选出未完成的作品"""
+        pending = []
+        pids = list(works)
+        for i in range(0, len(pids), _SYNC_BATCH):
+            batch = {pid: works[pid] for pid in pids[i:i + _SYNC_BATCH]}
+            states = self.redis.sync_ranking_works(batch)
+            pending.extend(pid for pid, complete in states.items() if not complete)
+        return pending
+
+    def run(self, start: date, end: date, modes: List[str]) -> List[str]:
+        """
+        执行回填
+
+        参数:
+            start: 起始日期(包含)
+            end: 结束日期(包含)
+            modes: 排行榜类型列表
+
+        返回:
+            list: 失败的作品ID列表
+        """
+        rankings = self.pending_rankings(start, end, modes)
+        total = ((end - start).days + 1) * len(modes)
+        if len(rankings) < total:
+            self.log(f'[cyan]跳过 {total - len(rankings)} 个已完成的排行榜[/cyan]')
+
+        chunk_size = max(1, self.config.chunk_days) * len(modes)
+        failed_works: List[str] = []
+        for i in range(0, len(rankings), chunk_size):
+            chunk = rankings[i:i + chunk_size]
+            works, members, broken = self._collect(chunk)
+            pending = self._filter_pending(works)
+            entries = sum(len(ids) for ids in members.values())
+            self.log(
+                f'[cyan]{chunk[0][1]} ~ {chunk[-1][1]}：上榜 {entries} 次，'
+                f'去重后 {len(works)} 个作品，待下载 {len(pending)} 个[/cyan]'
+            )
+
+            self.spider.progress.reset(self.spider.main_task_id, total=len(pending))
+            pipeline = DownloadPipeline(
+                self.downloader,
+                self.spider.progress,
+                self.spider.main_task_id,
+                self.spider.fetch_ranking,
+                self.log
+            )
+            failed = set(pipeline.run(works=pending))
+            failed_works.extend(failed)
+            self.failure_causes.update(pipeline.failure_causes)
+
+            # 只有全部页获取成功、包含作品且没有失败作品的排行榜才写入断点
+            finished = [
+                self._member(ranking) for ranking in chunk
+                if ranking not in broken and members[ranking] and not members[ranking] & failed
+            ]
+            if finished:
+                self.redis.add_backfill_done(finished)
+
+        return failed_works
+
+    def publish(self, start: date, end: date, modes: List[str], work_queue: WorkQueue) -> int:
+        """
+        回填的分布式版本：合并去重后把未完成的作品发布到任务队列
+
+        发布即视为交接，排行榜在发布成功后写入断点，下载失败由工作进程重试。
+
+        参数:
+            start: 起始日期(包含)
+            end: 结束日期(包含)
+            modes: 排行榜类型列表
+            work_queue: 分布式任务队列
+
+        返回:
+            int: 发布的作品数
+        """
+        work_queue.ensure_group()
+        rankings = self.pending_rankings(start, end, modes)
+        chunk_size = max(1, self.config.chunk_days) * len(modes)
+        published = 0
+        for i in range(0, len(rankings), chunk_size):
+            chunk = rankings[i:i + chunk_size]
+            works, members, broken = self._collect(chunk)
+            published += work_queue.publish(self._filter_pending(works), 'backfill')
+            finished = [
+                self._member(ranking) for ranking in chunk
+                if ranking not in broken and members[ranking]
+            ]
+            if finished:
+                self.redis.add_backfill_done(finished)
+        return published
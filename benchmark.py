@@ -0,0 +1,620 @@
+#!/usr/bin/env python3
+"""
+离线性能基准测试
+
+在子进程中启动模拟Pixiv的本地HTTP服务(排行榜、作品页面接口和图片主机)，
+把配置指向该服务后用一个临时Redis数据库端到端运行PixivSpider，
+输出吞吐、单图延迟、每个作品的Redis往返次数、单次状态查询延迟和峰值内存，
+结果可写入JSON并与基线比较以发现版本间的性能回退。
+
+用法: python benchmark.py --db 5 --latency 50 --output result.json --baseline base.json
+对比状态存储后端: python benchmark.py --state sqlite --baseline redis.json
+对比图片下载协议: python benchmark.py --transport http2 --baseline http1.json (需安装httpx[http2])
+"""
+import argparse
+import asyncio
+import io
+import json
+import math
+import multiprocessing
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+from rich.console import Console
+
+from config import DOWNLOAD_CONFIG, HTTP_CONFIG, PIXIV_CONFIG, REDIS_CONFIG, STATE_CONFIG
+
+# 每个排行榜页的作品数，与Pixiv一致
+_RANKING_PAGE_SIZE = 50
+# 模拟带宽时每次写入的块大小
+_WRITE_CHUNK = 64 * 1024
+
+# 结果指标：数值越大越好的和越小越好的
+_HIGHER_IS_BETTER = ('images_per_sec', 'mb_per_sec')
+_LOWER_IS_BETTER = (
+    'latency_p50_ms', 'latency_p99_ms', 'cpu_seconds', 'redis_round_trips_per_work', 'peak_rss_mb',
+    'check_p50_us', 'check_p99_us'
+)
+# 测量单次状态查询延迟的采样数
+_CHECK_SAMPLES = 2000
+
+
+@dataclass
+class StubConfig:
+    """模拟服务配置"""
+    latency_ms: float = 20.0          # 平均首字节延迟，实际延迟在0.5~1.5倍间均匀分布
+    bandwidth_kbps: float = 0.0       # 每个连接的带宽(KiB/s)，0为不限
+    error_rate: float = 0.0           # 返回503的概率
+    rate_429: float = 0.0             # 返回429的概率
+    retry_after: int = 1              # 429响应的Retry-After(秒)
+    image_kb: float = 256.0           # 图片大小中位数(KiB)，按对数正态分布
+    image_sigma: float = 0.6          # 对数正态分布的sigma
+    image_max_kb: float = 8192.0      # 图片大小上限(KiB)
+    multi_page_rate: float = 0.15     # 多页作品比例
+    max_pages: int = 5                # 多页作品的最大页数
+    seed: int = 1
+
+
+# 模拟服务的响应: (状态码, 响应体, 响应头)
+_Reply = Tuple[int, bytes, Dict[str, str]]
+
+
+def _json_reply(data: Any) -> _Reply:
+    return 200, json.dumps(data).encode(), {'Content-Type': 'application/json'}
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    """模拟Pixiv接口的HTTP/1.1请求处理器"""
+    protocol_version = 'HTTP/1.1'
+    server: '_StubServer'
+
+    def log_message(self, format: str, *args: Any) -> None:
+        """不输出访问日志"""
+
+    def _send(self, status: int, body: bytes = b'', headers: Optional[Dict[str, str]] = None) -> None:
+        """发送响应，按配置限制带宽"""
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+
+        rate = self.server.config.bandwidth_kbps * 1024
+        if not rate:
+            self.wfile.write(body)
+            return
+        start = time.monotonic()
+        for offset in range(0, len(body), _WRITE_CHUNK):
+            self.wfile.write(body[offset:offset + _WRITE_CHUNK])
+            # 按已发送字节数计算应到达的时间点，避免逐块误差累积
+            delay = start + (offset + _WRITE_CHUNK) / rate - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+    def do_GET(self) -> None:
+        """分发请求"""
+        if urlsplit(self.path).path.startswith('/img-original/') and not getattr(self, '_image_connection', False):
+            # 同一连接上的多个请求由同一个处理器实例处理
+            self._image_connection = True
+            self.server.count('image_connections')
+        self._send(*self.server.respond(self.path))
+
+
+class _StubServer(ThreadingHTTPServer):
+    """模拟服务，作品页数和图片大小由随机种子确定"""
+    daemon_threads = True
+
+    def __init__(self, config: StubConfig):
+        super().__init__(('127.0.0.1', 0), _StubHandler)
+        self.config = config
+        self.work_base = 100_000_000 + config.seed * 1000
+        self.blob = random.Random(config.seed).randbytes(int(config.image_max_kb * 1024))
+        self.image_base = f"http://localhost:{self.server_address[1]}"
+        self._stats: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def count(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self._stats[name] = self._stats.get(name, 0) + value
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._stats)
+
+    def page_count(self, work_id: int) -> int:
+        cfg = self.config
+        rng = random.Random(cfg.seed * 1_000_003 + work_id)
+        if cfg.max_pages > 1 and rng.random() < cfg.multi_page_rate:
+            return rng.randint(2, cfg.max_pages)
+        return 1
+
+    def image_size(self, path: str) -> int:
+        cfg = self.config
+        size = random.Random(f"{cfg.seed}:{path}").lognormvariate(0, cfg.image_sigma) * cfg.image_kb
+        return max(1, int(min(size, cfg.image_max_kb) * 1024))
+
+    def respond(self, target: str) -> _Reply:
+        """按请求路径生成响应，包括模拟的错误和首字节延迟(两种协议共用)"""
+        cfg = self.config
+        url = urlsplit(target)
+        if url.path == '/__stats':
+            return _json_reply(self.snapshot())
+
+        self.count('requests')
+        roll = random.random()
+        if roll < cfg.error_rate:
+            self.count('503')
+            return 503, b'', {}
+        if roll < cfg.error_rate + cfg.rate_429:
+            self.count('429')
+            return 429, b'', {'Retry-After': str(cfg.retry_after)}
+        time.sleep(cfg.latency_ms / 1000 * random.uniform(0.5, 1.5))
+
+        if url.path == '/ranking.php':
+            return self._ranking(parse_qs(url.query))
+        if url.path.startswith('/ajax/illust/'):
+            return self._pages(url.path.split('/')[3])
+        if url.path.startswith('/img-original/'):
+            return self._image(url.path)
+        return 404, b'', {}
+
+    def _ranking(self, query: Dict[str, List[str]]) -> _Reply:
+        """排行榜页：每页50个作品，超过10页时与Pixiv一样返回error"""
+        page = int(query.get('p', ['1'])[0])
+        if not 1 <= page <= 10:
+            return _json_reply({'error': '指定されたページは存在しません'})
+        base = self.work_base + (page - 1) * _RANKING_PAGE_SIZE
+        return _json_reply({'contents': [
+            {'illust_id': pid, 'user_id': pid % 100_000}
+            for pid in range(base, base + _RANKING_PAGE_SIZE)
+        ]})
+
+    def _pages(self, work_id: str) -> _Reply:
+        """作品页面接口"""
+        self.count('ajax')
+        return _json_reply({'error': False, 'body': [
+            {'urls': {'original': f"{self.image_base}/img-original/img/2024/01/01/00/00/00/{work_id}_p{page}.png"}}
+            for page in range(self.page_count(int(work_id)))
+        ]})
+
+    def _image(self, path: str) -> _Reply:
+        """图片：大小由路径确定，重复请求返回相同内容"""
+        size = self.image_size(path)
+        self.count('images')
+        self.count('bytes', size)
+        return 200, self.blob[:size], {'Content-Type': 'image/png', 'ETag': f'"{size}"'}
+
+
+class _H2StubProtocol(asyncio.Protocol):
+    """
+    模拟图片主机的h2c连接(先验知识的明文HTTP/2)
+
+    每个流的响应在线程池中生成(模拟延迟是阻塞的sleep)，
+    响应体按流量控制窗口分块发送，每个流按HTTP/1.1中每个连接的带宽限速。
+    """
+
+    def __init__(self, server: _StubServer, executor: ThreadPoolExecutor):
+        import h2.config
+        import h2.connection
+
+        self.server = server
+        self.executor = executor
+        self.conn = h2.connection.H2Connection(
+            h2.config.H2Configuration(client_side=False, header_encoding='utf-8')
+        )
+        self.transport: Optional[asyncio.Transport] = None
+        self._window = asyncio.Event()
+        self._closed = False
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        self.transport = transport
+        self.server.count('image_connections')
+        self.conn.initiate_connection()
+        self.transport.write(self.conn.data_to_send())
+
+    def connection_lost(self, exc: Optional[Exception]) -> None:
+        self._closed = True
+        self._window.set()
+
+    def data_received(self, data: bytes) -> None:
+        import h2.events
+        import h2.exceptions
+
+        try:
+            events = self.conn.receive_data(data)
+        except h2.exceptions.ProtocolError:
+            self.transport.write(self.conn.data_to_send())
+            self.transport.close()
+            return
+        for event in events:
+            if isinstance(event, h2.events.RequestReceived):
+                path = dict(event.headers)[':path']
+                asyncio.get_running_loop().create_task(self._respond(event.stream_id, path))
+            elif isinstance(event, (h2.events.WindowUpdated, h2.events.StreamReset)):
+                # 唤醒所有等待窗口的流，各自重新检查
+                self._window.set()
+                self._window = asyncio.Event()
+        self.transport.write(self.conn.data_to_send())
+
+    async def _respond(self, stream_id: int, path: str) -> None:
+        import h2.exceptions
+
+        loop = asyncio.get_running_loop()
+        status, body, headers = await loop.run_in_executor(self.executor, self.server.respond, path)
+        if self._closed:
+            return
+        try:
+            self.conn.send_headers(stream_id, [
+                (':status', str(status)),
+                ('content-length', str(len(body))),
+                *((name.lower(), value) for name, value in headers.items())
+            ], end_stream=not body)
+            self.transport.write(self.conn.data_to_send())
+            await self._send_body(stream_id, body)
+        except h2.exceptions.StreamClosedError:
+            pass
+
+    async def _send_body(self, stream_id: int, body: bytes) -> None:
+        rate = self.server.config.bandwidth_kbps * 1024
+        start = time.monotonic()
+        offset = 0
+        while offset < len(body) and not self._closed:
+            size = min(
+                self.conn.local_flow_control_window(stream_id),
+                self.conn.max_outbound_frame_size,
+                _WRITE_CHUNK,
+                len(body) - offset
+            )
+            if size <= 0:
+                await self._window.wait()
+                continue
+            offset += size
+            self.conn.send_data(stream_id, body[offset - size:offset], end_stream=offset == len(body))
+            self.transport.write(self.conn.data_to_send())
+            if rate:
+                delay = start + offset / rate - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+
+def _start_h2(server: _StubServer) -> int:
+    """在后台线程的事件循环中启动h2c图片主机，返回端口"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.bind(('127.0.0.1', 0))
+    sock.listen(128)
+    executor = ThreadPoolExecutor(max_workers=64)
+    loop = asyncio.new_event_loop()
+
+    def run() -> None:
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(loop.create_server(lambda: _H2StubProtocol(server, executor), sock=sock))
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    return sock.getsockname()[1]
+
+
+def _serve(config: StubConfig, conn: Any, http2: bool = False) -> None:
+    """子进程入口：启动模拟服务并把(接口端口, 图片主机端口)发回父进程"""
+    server = _StubServer(config)
+    image_port = server.server_address[1]
+    if http2:
+        image_port = _start_h2(server)
+        server.image_base = f"http://localhost:{image_port}"
+    conn.send((server.server_address[1], image_port))
+    conn.close()
+    server.serve_forever()
+
+
+class _RoundTripCounter:
+    """统计Redis往返次数：每次向服务器发送命令(单条命令或整个流水线)计为一次"""
+
+    def __init__(self):
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def connection_class(self, base: type) -> type:
+        """生成在发送命令时计数的连接类"""
+        counter = self
+
+        class CountingConnection(base):
+            def send_packed_command(self, command, check_health=True):
+                with counter._lock:
+                    counter.count += 1
+                return super().send_packed_command(command, check_health)
+
+        return CountingConnection
+
+
+def _peak_rss_mb() -> Optional[float]:
+    """当前进程的峰值常驻内存(MiB)，不支持的平台返回None"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux单位为KiB，macOS为字节
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 1024
+
+
+def _percentile(values: List[float], percent: float) -> float:
+    """最近秩法百分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, math.ceil(percent / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def _check_latency(client: Any) -> List[float]:
+    """逐个查询已下载图片页的状态，返回每次查询的耗时(秒)"""
+    pages = []
+    for pid, downloaded in client.iter_downloaded_pages():
+        pages.extend((pid, page) for page in downloaded)
+        if len(pages) >= _CHECK_SAMPLES:
+            break
+    latencies = []
+    for pid, page in pages[:_CHECK_SAMPLES]:
+        start = time.perf_counter()
+        client.is_image_downloaded(pid, page)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def _git_revision() -> Optional[str]:
+    """当前代码版本，便于对比不同版本的结果"""
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(
+    stub: StubConfig,
+    db: int,
+    force: bool = False,
+    keep: bool = False,
+    show_ui: bool = False,
+    headless: bool = False,
+    state: str = 'redis',
+    transport: str = 'http1'
+) -> Dict[str, Any]:
+    """
+    启动模拟服务并端到端运行一次爬虫
+
+    参数:
+        stub: 模拟服务配置
+        db: 临时使用的Redis数据库编号
+        force: 数据库非空时是否仍然清空并使用
+        keep: 结束后是否保留数据库内容
+        show_ui: 是否显示爬虫界面或事件输出
+        headless: 使用无界面模式，用于对比界面开销
+        state: 状态存储后端 redis / sqlite(使用临时文件)
+        transport: 图片下载协议 http1 / http2(图片主机改为本地h2c服务)
+
+    返回:
+        dict: 基准测试结果
+    """
+    from http_client import HttpClient
+    from pixiv_download import PixivDownloader
+    from pixiv_spider import PixivSpider
+    from state_backend import get_state_client
+    from storage import MANIFEST_NAME
+
+    if transport == 'http2':
+        HttpClient.require_http2()
+    parent_conn, child_conn = multiprocessing.Pipe()
+    server = multiprocessing.Process(target=_serve, args=(stub, child_conn, transport == 'http2'), daemon=True)
+    server.start()
+    port, image_port = parent_conn.recv()
+    api_host, image_host = f"127.0.0.1:{port}", f"localhost:{image_port}"
+    img_dir = tempfile.mkdtemp(prefix='pixiv-bench-')
+    state_dir = tempfile.mkdtemp(prefix='pixiv-bench-state-')
+
+    # 两个主机名分别沿用pixiv.net和pximg.net的连接池与并发配置
+    PIXIV_CONFIG.top_url = f"http://{api_host}/ranking.php"
+    PIXIV_CONFIG.ajax_url = f"http://{api_host}/ajax/illust/{{}}/pages"
+    HTTP_CONFIG.pool_sizes[api_host] = HTTP_CONFIG.pool_sizes.get('www.pixiv.net', HTTP_CONFIG.default_pool_size)
+    HTTP_CONFIG.pool_sizes[image_host] = HTTP_CONFIG.pool_sizes.get('i.pximg.net', HTTP_CONFIG.default_pool_size)
+    HTTP_CONFIG.host_concurrency[api_host] = HTTP_CONFIG.host_concurrency.get('www.pixiv.net', HTTP_CONFIG.default_concurrency)
+    HTTP_CONFIG.host_concurrency[image_host] = HTTP_CONFIG.host_concurrency.get('i.pximg.net', HTTP_CONFIG.default_concurrency)
+    PIXIV_CONFIG.image_transport = transport
+    DOWNLOAD_CONFIG.img_dir = img_dir
+    STATE_CONFIG.backend = state
+    STATE_CONFIG.sqlite_dir = state_dir
+
+    redis = get_state_client()
+    counter = _RoundTripCounter()
+    if state == 'redis':
+        # 在建立连接前替换连接类，之后该数据库的所有连接都会计数
+        pool = redis._get_pool(db)
+        pool.connection_class = counter.connection_class(pool.connection_class)
+
+    # 逐图记录下载耗时
+    latencies: List[float] = []
+    latency_lock = threading.Lock()
+    download_image = PixivDownloader.download_image
+
+    def timed_download(self, url: str, *args: Any, **kwargs: Any) -> bool:
+        start = time.perf_counter()
+        ok = download_image(self, url, *args, **kwargs)
+        if ok:
+            with latency_lock:
+                latencies.append(time.perf_counter() - start)
+        return ok
+
+    PixivDownloader.download_image = timed_download
+    try:
+        if not redis.select_db(db):
+            raise ValueError(f"无效的Redis数据库编号: {db}")
+        if redis.get_db_size() and not force:
+            raise RuntimeError(f"数据库 {db} 非空，使用 --force 清空后测试")
+        redis.clear_db()
+        redis.set_cookie('benchmark')
+
+        spider = PixivSpider(db, headless=headless)
+        if not show_ui:
+            if headless:
+                spider.events.stream = io.StringIO()
+            else:
+                spider.console = Console(file=io.StringIO())
+        counter.count = 0
+        start = time.perf_counter()
+        cpu_start = time.process_time()
+        spider.run()
+        elapsed = time.perf_counter() - start
+        cpu_seconds = time.process_time() - cpu_start
+        round_trips = counter.count
+
+        stats = redis.get_db_stats()
+        server_stats = requests.get(f"http://{api_host}/__stats", timeout=5).json()
+        total_bytes = sum(
+            os.path.getsize(os.path.join(directory, name))
+            for directory, _, names in os.walk(img_dir)
+            for name in names
+            if name != MANIFEST_NAME
+        )
+        works = stats['works'] + len(spider.failed_works)
+        checks = _check_latency(redis)
+        if not keep:
+            redis.clear_db()
+    finally:
+        PixivDownloader.download_image = download_image
+        server.terminate()
+        shutil.rmtree(img_dir, ignore_errors=True)
+        if state == 'sqlite':
+            redis.close()
+        if not (keep and state == 'sqlite'):
+            shutil.rmtree(state_dir, ignore_errors=True)
+
+    return {
+        'revision': _git_revision(),
+        'python': sys.version.split()[0],
+        'stub': asdict(stub),
+        'ui': 'headless' if headless else 'rich',
+        'state': state,
+        'transport': transport,
+        'seconds': round(elapsed, 3),
+        'cpu_seconds': round(cpu_seconds, 3),
+        'works': works,
+        'failed_works': len(spider.failed_works),
+        'images': stats['images'],
+        'bytes': total_bytes,
+        'images_per_sec': round(stats['images'] / elapsed, 2),
+        'mb_per_sec': round(total_bytes / 2**20 / elapsed, 2),
+        'latency_p50_ms': round(_percentile(latencies, 50) * 1000, 1),
+        'latency_p99_ms': round(_percentile(latencies, 99) * 1000, 1),
+        'redis_round_trips': round_trips,
+        'redis_round_trips_per_work': round(round_trips / works, 2) if works else 0.0,
+        'check_p50_us': round(_percentile(checks, 50) * 1e6, 1),
+        'check_p99_us': round(_percentile(checks, 99) * 1e6, 1),
+        'peak_rss_mb': round(_peak_rss_mb() or 0.0, 1),
+        'server': server_stats
+    }
+
+
+def compare(result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """
+    与基线比较
+
+    参数:
+        result: 本次结果
+        baseline: 基线结果
+        tolerance: 允许的相对变化(如0.1为10%)
+
+    返回:
+        list: 超出容差的指标说明，为空表示没有回退
+    """
+    regressions = []
+    for key in _HIGHER_IS_BETTER + _LOWER_IS_BETTER:
+        old, new = baseline.get(key), result.get(key)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        if (key in _HIGHER_IS_BETTER and change < -tolerance) or (key in _LOWER_IS_BETTER and change > tolerance):
+            regressions.append(f"{key}: {old} -> {new} ({change:+.1%})")
+    return regressions
+
+
+def _parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    defaults = StubConfig()
+    parser = argparse.ArgumentParser(description='PixivSpider离线性能基准测试')
+    parser.add_argument('--db', type=int, default=REDIS_CONFIG.db_range[1], help='临时使用的Redis数据库编号')
+    parser.add_argument('--force', action='store_true', help='数据库非空时仍然清空并使用')
+    parser.add_argument('--keep', action='store_true', help='结束后保留数据库内容')
+    parser.add_argument('--show-ui', action='store_true', help='显示爬虫界面或事件输出')
+    parser.add_argument('--headless', action='store_true', help='以无界面模式运行，用于测量界面开销')
+    parser.add_argument('--state', choices=('redis', 'sqlite'), default='redis', help='状态存储后端')
+    parser.add_argument('--transport', choices=('http1', 'http2'), default='http1', help='图片下载协议')
+    parser.add_argument('--latency', type=float, default=defaults.latency_ms, help='平均首字节延迟(毫秒)')
+    parser.add_argument('--bandwidth', type=float, default=defaults.bandwidth_kbps, help='每连接带宽(KiB/s)，0为不限')
+    parser.add_argument('--error-rate', type=float, default=defaults.error_rate, help='503响应概率')
+    parser.add_argument('--rate-429', type=float, default=defaults.rate_429, help='429响应概率')
+    parser.add_argument('--image-kb', type=float, default=defaults.image_kb, help='图片大小中位数(KiB)')
+    parser.add_argument('--image-sigma', type=float, default=defaults.image_sigma, help='图片大小对数正态分布的sigma')
+    parser.add_argument('--multi-page-rate', type=float, default=defaults.multi_page_rate, help='多页作品比例')
+    parser.add_argument('--seed', type=int, default=defaults.seed, help='随机种子')
+    parser.add_argument('--output', help='结果JSON文件')
+    parser.add_argument('--baseline', help='基线结果JSON文件，指标回退超过容差时返回非零状态')
+    parser.add_argument('--tolerance', type=float, default=0.1, help='与基线比较的容差')
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """命令行入口"""
+    args = _parse_args(argv)
+    stub = StubConfig(
+        latency_ms=args.latency,
+        bandwidth_kbps=args.bandwidth,
+        error_rate=args.error_rate,
+        rate_429=args.rate_429,
+        image_kb=args.image_kb,
+        image_sigma=args.image_sigma,
+        multi_page_rate=args.multi_page_rate,
+        seed=args.seed
+    )
+    result = run_benchmark(
+        stub,
+        args.db,
+        force=args.force,
+        keep=args.keep,
+        show_ui=args.show_ui,
+        headless=args.headless,
+        state=args.state,
+        transport=args.transport
+    )
+
+    text = json.dumps(result, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    print(text)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        for line in regressions:
+            print(f"回退 {line}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,5 +1,5 @@
 """配置管理"""
-from typing import Dict, Any
+from typing import Dict, Any, Optional, Tuple
 from dataclasses import dataclass
 
 @dataclass
@@ -9,12 +9,50 @@ class RedisConfig:
     port: int = 6379
     max_connections: int = 10
     db_range: tuple = (0, 5)  # 支持的数据库范围(包含)
+    read_legacy: bool = True  # 是否同时读取旧格式键(迁移完成后可关闭)
+    local_cache: str = 'none'  # 进程内去重缓存: none / set(精确集合) / bloom(布隆过滤器)
+    local_cache_capacity: int = 10_000_000  # 布隆过滤器预计容量
+    local_cache_fp_rate: float = 0.001      # 布隆过滤器误判率
+
+@dataclass
+class HttpConfig:
+    """HTTP传输层配置"""
+    pool_sizes: Dict[str, int] = None        # 每个主机的连接池大小
+    host_concurrency: Dict[str, int] = None  # 每个主机的最大并发请求数(自适应调整的上限)
+    default_pool_size: int = 4               # 未单独配置主机的连接池大小
+    default_concurrency: int = 4             # 未单独配置主机的最大并发数
+    min_concurrency: int = 1                 # 自适应并发的下限
+    initial_concurrency: int = 2             # 自适应并发的初始值
+    decrease_factor: float = 0.5             # 遇到限流或错误时的并发乘数
+    latency_factor: float = 3.0              # 延迟超过基线多少倍视为过载
+    decrease_cooldown: float = 1.0           # 两次降速的最小间隔(秒)
+    max_retries: int = 3                     # 失败后的最大重试次数
+    backoff_base: float = 0.5                # 退避基准时间(秒)
+    backoff_max: float = 30.0                # 单次退避上限(秒)
+    connect_timeout: float = 5.0
+    read_timeout: float = 15.0
+    retry_statuses: tuple = (429, 500, 502, 503, 504)
+
+    def __post_init__(self):
+        """初始化默认主机配置"""
+        if self.pool_sizes is None:
+            self.pool_sizes = {
+                'www.pixiv.net': 8,
+                'i.pximg.net': 16
+            }
+        if self.host_concurrency is None:
+            self.host_concurrency = {
+                'www.pixiv.net': 6,
+                'i.pximg.net': 12
+            }
 
 @dataclass
 class PixivConfig:
     """Pixiv API配置"""
     ajax_url: str = 'https://www.pixiv.net/ajax/illust/{}/pages'
     top_url: str = 'https://www.pixiv.net/ranking.php'
+    meta_cache_ttl: int = 7 * 24 * 3600  # 作品页面元数据缓存时间(秒)，0为不缓存
+    image_transport: str = 'http1'       # 图片下载协议 http1(requests) / http2(httpx多路复用，需安装httpx[http2])
     user_agent: str = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/77.0.3865.75 Safari/537.36'
     headers: Dict[str, str] = None
 
@@ -30,15 +68,126 @@ class PixivConfig:
             'user-agent': self.user_agent
         }
 
+@dataclass
+class DownloadConfig:
+    """图片下载配置"""
+    img_dir: str = './img'
+    layout: Optional[str] = None  # 目录布局 flat / id(按作品ID分组) / date(按上传日期) / user(按作者)，
+                                  # None时沿用图片目录清单中记录的布局(新目录为flat)
+    dedup: str = 'none'           # 按内容去重 none / hardlink(文件名硬链接到唯一副本) / manifest(只在清单中记录)
+    chunk_size: int = 64 * 1024   # 流式写入的块大小(字节)
+    fsync_policy: str = 'file'    # none: 不同步 / file: 重命名前同步文件 / full: 同时同步目录
+    max_inflight_bytes: int = 64 * 1024 * 1024   # 所有下载线程的在途字节预算(按Content-Length预留的上限，不是进程内存上限)
+    max_open_files: int = 16                     # 同时写入的文件数上限
+    unknown_size_bytes: int = 8 * 1024 * 1024    # 响应没有Content-Length时预留的字节数
+
+@dataclass
+class PipelineConfig:
+    """下载流水线配置"""
+    ranking_workers: int = 2      # 排行榜页获取线程数
+    metadata_workers: int = 4     # 作品元数据获取线程数
+    download_workers: int = 8     # 图片下载线程数
+    work_queue_size: int = 100    # 待获取元数据的作品队列上限
+    image_queue_size: int = 200   # 待下载图片页数上限，作品的所有页放得下时才整体接收
+    schedule_policy: str = 'ranking'  # 图片页调度策略: ranking(按排行顺序) / smallest(页数少的作品优先) / fair(各作品轮流)，
+                                      # 在调度器中所有待下载作品之间选择，不受接收顺序影响
+
+@dataclass
+class PostprocessConfig:
+    """图片下载后处理配置"""
+    hooks: Tuple[str, ...] = ()    # 启用的钩子: phash / thumbnail / webp / avif，为空时不启动进程池(需要Pillow)
+    workers: int = 0               # 进程数，0为CPU核数
+    queue_size: int = 1024         # 等待处理的图片上限，已满时跳过，不阻塞下载线程
+    output_dir: str = './derived'  # 缩略图和重新编码图片的输出目录
+    thumbnail_size: int = 512      # 缩略图最长边(像素)
+    quality: int = 80              # 缩略图和重新编码的质量
+
+@dataclass
+class BackfillConfig:
+    """历史排行榜回填配置"""
+    fetch_workers: int = 8   # 并发获取排行榜页的线程数
+    chunk_days: int = 7      # 每批合并去重的天数，每批完成后写入断点
+    max_pages: int = 10      # 每个排行榜的最大页数
+
+@dataclass
+class QueueConfig:
+    """分布式任务队列配置"""
+    consumer: str = ''          # 消费者名称，默认为 主机名-进程号
+    lease_ms: int = 300_000     # 任务租约时长，超时未确认的任务会被其他工作进程接管
+    claim_count: int = 16       # 每次领取的任务数
+    block_ms: int = 5000        # 队列为空时的阻塞等待时间
+    max_attempts: int = 3       # 单个作品的最大尝试次数
+
+@dataclass
+class MetricsConfig:
+    """运行指标配置"""
+    enabled: bool = False           # 是否记录各阶段耗时和计数
+    host: str = '127.0.0.1'         # 本地指标服务监听地址
+    port: int = 0                   # /metrics端口，0为不启动服务
+    summary_dir: str = './metrics'  # 运行结束时写入JSON汇总的目录，空字符串为不写入
+
+@dataclass
+class RetryConfig:
+    """失败作品重试队列配置"""
+    max_attempts: int = 5           # 累计失败次数达到后移入死信列表
+    backoff_base: float = 600.0     # 首次失败后的重试延迟(秒)，之后每次翻倍
+    backoff_max: float = 86400.0    # 单次重试延迟上限(秒)
+    dead_letter_limit: int = 10000  # 死信列表保留的最大条数
+
+@dataclass
+class StateConfig:
+    """下载状态存储配置"""
+    backend: str = 'redis'          # redis / sqlite(单机内嵌数据库，无需Redis服务)
+    sqlite_dir: str = './state'     # sqlite数据库文件目录，每个数据库编号一个文件
+    sqlite_timeout: float = 30.0    # 等待其他写入事务的超时(秒)
+    batch_size: int = 1000          # 导入导出时每批的作品数
+
 # 全局配置实例
 REDIS_CONFIG = RedisConfig()
+HTTP_CONFIG = HttpConfig()
 PIXIV_CONFIG = PixivConfig()
+DOWNLOAD_CONFIG = DownloadConfig()
+PIPELINE_CONFIG = PipelineConfig()
+POSTPROCESS_CONFIG = PostprocessConfig()
+BACKFILL_CONFIG = BackfillConfig()
+QUEUE_CONFIG = QueueConfig()
+METRICS_CONFIG = MetricsConfig()
+RETRY_CONFIG = RetryConfig()
+STATE_CONFIG = StateConfig()
 
 # Redis键模式
 class RedisKeys:
     """Redis键定义"""
     COOKIE = 'cookie'
+    WORK = 'work:{pid}'                           # 作品状态哈希
+    STATS = 'stats'                               # 统计计数哈希
+    META = 'meta:{pid}'                           # 作品原图URL缓存(带TTL)
+    
+    # 统计计数哈希字段
+    STAT_WORKS = 'works'                          # 已完成作品数
+    STAT_IMAGES = 'images'                        # 已下载图片数
+    STAT_BYTES = 'bytes'                          # 已下载图片总字节数
+    STAT_STORED = 'stored'                        # 去重后实际占用字节数
+    
+    # 作品状态哈希字段
+    FIELD_PAGE = 'p{page}'                        # 已下载的图片页
+    FIELD_TOTAL = 't'                             # 作品总页数
+    FIELD_COMPLETE = 'c'                          # 作品已完成
+    FIELD_USER = 'u'                              # 作品作者ID
+    FIELD_PHASH = 'h{page}'                       # 图片页的感知哈希(后处理结果)
+    
+    # 旧格式(每项一个键)，仅用于兼容读取和迁移
     DOWNLOADED_IMAGE = 'downloaded:{pid}_p{page}'  # 已下载的图片页
     DOWNLOADED_WORK = 'downloaded:{pid}'           # 已完成的作品
     TOTAL_PAGES = 'total_pages:{pid}'             # 作品总页数
     USER_ID = '{illust_id}'                       # 作品作者ID
+    
+    BACKFILL_DONE = 'backfill:done'               # 已完成回填的排行榜(集合，成员为 模式:日期)
+    
+    RETRY_DUE = 'retry:due'                       # 失败作品重试队列(有序集合，分数为下次重试时间)
+    RETRY_INFO = 'retry:info'                     # 失败作品的尝试次数和原因(哈希，值为 次数|原因)
+    RETRY_DEAD = 'retry:dead'                     # 超过最大尝试次数的作品(列表，元素为JSON)
+    
+    QUEUE_STREAM = 'queue:works'                  # 分布式作品任务流
+    QUEUE_GROUP = 'crawlers'                      # 工作进程消费者组
+    WORK_LOCK = 'lock:{pid}'                      # 作品处理锁(值为持有者)
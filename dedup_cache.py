@@ -0,0 +1,151 @@
+"""进程内作品去重缓存"""
+import math
+import sys
+import threading
+import time
+from typing import Iterable, Optional
+
+_MASK64 = (1 << 64) - 1
+
+
+def _mix64(value: int) -> int:
+    """splitmix64混合函数，将作品ID打散为64位哈希"""
+    value = (value + 0x9E3779B97F4A7C15) & _MASK64
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & _MASK64
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & _MASK64
+    return value ^ (value >> 31)
+
+
+class ExactSet:
+    """精确集合，命中即确定已完成"""
+    exact = True
+
+    def __init__(self):
+        """初始化集合"""
+        self._items: set[int] = set()
+
+    def add(self, pid: str) -> None:
+        """加入作品ID"""
+        self._items.add(int(pid))
+
+    def update(self, pids: Iterable[str]) -> None:
+        """批量加入作品ID"""
+        self._items.update(map(int, pids))
+
+    def discard(self, pid: str) -> None:
+        """移除作品ID"""
+        self._items.discard(int(pid))
+
+    def __contains__(self, pid: str) -> bool:
+        return int(pid) in self._items
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    @property
+    def memory_bytes(self) -> int:
+        """估算内存占用(集合表 + 整数对象)"""
+        return sys.getsizeof(self._items) + len(self._items) * sys.getsizeof(2 ** 40)
+
+
+class BloomFilter:
+    """布隆过滤器，未命中即确定未完成，命中需向Redis确认"""
+    exact = False
+
+    def __init__(self, capacity: int, fp_rate: float):
+        """
+        按容量和误判率计算位数组大小与哈希函数个数
+
+        参数:
+            capacity: 预计元素数量
+            fp_rate: 目标误判率
+        """
+        capacity = max(1, capacity)
+        self.size = max(8, int(-capacity * math.log(fp_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self._bits = bytearray((self.size + 7) // 8)
+        self._count = 0
+        self._lock = threading.Lock()  # 置位是读改写操作，多线程写入需加锁
+
+    def _positions(self, pid: str) -> range:
+        """双重哈希：64位哈希的高低32位作为两个基础哈希，返回k个位位置的等差序列"""
+        value = _mix64(int(pid))
+        step = (value >> 32) | 1
+        start = value & 0xFFFFFFFF
+        return range(start, start + self.hashes * step, step)
+
+    def add(self, pid: str) -> None:
+        """加入作品ID"""
+        self.update((pid,))
+
+    def update(self, pids: Iterable[str]) -> None:
+        """批量加入作品ID(载入时使用，避免逐个调用的开销)"""
+        bits = self._bits
+        size = self.size
+        positions = self._positions
+        count = 0
+        with self._lock:
+            for pid in pids:
+                for pos in positions(pid):
+                    pos %= size
+                    bits[pos >> 3] |= 1 << (pos & 7)
+                count += 1
+            self._count += count
+
+    def discard(self, pid: str) -> None:
+        """布隆过滤器不支持删除，保持命中并由Redis确认"""
+
+    def __contains__(self, pid: str) -> bool:
+        bits = self._bits
+        size = self.size
+        for pos in self._positions(pid):
+            pos %= size
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+    def __len__(self) -> int:
+        return self._count
+
+    @property
+    def memory_bytes(self) -> int:
+        """位数组内存占用"""
+        return sys.getsizeof(self._bits)
+
+
+def create_cache(kind: str, capacity: int, fp_rate: float) -> Optional[object]:
+    """
+    按配置创建去重缓存
+
+    参数:
+        kind: none / set / bloom
+        capacity: 布隆过滤器预计容量
+        fp_rate: 布隆过滤器误判率
+
+    返回:
+        缓存实例，kind为none时返回None
+    """
+    if kind == 'none':
+        return None
+    if kind == 'set':
+        return ExactSet()
+    if kind == 'bloom':
+        return BloomFilter(capacity, fp_rate)
+    raise ValueError(f"未知的去重缓存类型: {kind}")
+
+
+def _benchmark(count: int, fp_rate: float) -> None:
+    """测量两种缓存载入count个ID的耗时和内存"""
+    for kind in ('set', 'bloom'):
+        cache = create_cache(kind, count, fp_rate)
+        start = time.perf_counter()
+        cache.update(map(str, range(10_000_000, 10_000_000 + count)))
+        elapsed = time.perf_counter() - start
+        print(f"{kind:>5}: {count} 个ID 载入 {elapsed:.1f}s, 内存 {cache.memory_bytes / 2**20:.1f} MiB")
+
+
+if __name__ == '__main__':
+    _benchmark(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 10_000_000,
+        float(sys.argv[2]) if len(sys.argv) > 2 else 0.001
+    )
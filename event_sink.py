@@ -0,0 +1,124 @@
+"""无界面模式的结构化事件输出"""
+import itertools
+import json
+import queue
+import sys
+import threading
+import time
+from typing import Any, Dict, Optional, TextIO
+
+from rich.text import Text
+
+# 日志颜色标记到级别的映射
+_LEVELS = (('[red]', 'error'), ('[yellow]', 'warning'))
+
+
+class EventSink:
+    """
+    JSON-lines事件输出，替代Rich的Layout/Progress/Live
+
+    提供下载流水线用到的Progress接口子集(add_task/update/remove_task/reset)。
+    调用方线程只把事件放入无锁队列，序列化和写出由后台线程完成；
+    总体进度按间隔节流输出，子任务不输出。
+    """
+
+    def __init__(self, stream: Optional[TextIO] = None, progress_interval: float = 1.0):
+        """
+        初始化事件输出
+
+        参数:
+            stream: 输出流，默认标准输出
+            progress_interval: 总体进度事件的最小间隔(秒)
+        """
+        self.stream = stream or sys.stdout
+        self.progress_interval = progress_interval
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._task_ids = itertools.count()
+        self._main_task: Optional[int] = None
+        self._total: Optional[float] = None
+        self._completed = 0
+        self._count_lock = threading.Lock()
+        self._fields: Dict[str, Any] = {}
+        self._next_emit = 0.0
+        self._writer = threading.Thread(target=self._write_loop, name="event-sink", daemon=True)
+        self._writer.start()
+
+    def _write_loop(self) -> None:
+        """后台写出事件，队列暂时为空时刷新输出流"""
+        while True:
+            event = self._queue.get()
+            if isinstance(event, threading.Event):
+                self.stream.flush()
+                event.set()
+                continue
+            self.stream.write(json.dumps(event, ensure_ascii=False) + '\n')
+            if self._queue.empty():
+                self.stream.flush()
+
+    def emit(self, event: str, **fields: Any) -> None:
+        """
+        输出一个事件
+
+        参数:
+            event: 事件类型
+            **fields: 事件字段
+        """
+        self._queue.put({'ts': round(time.time(), 3), 'event': event, **fields})
+
+    def log(self, message: str) -> None:
+        """输出日志事件，去除Rich标记并按颜色推断级别"""
+        level = next((name for tag, name in _LEVELS if message.startswith(tag)), 'info')
+        self.emit('log', level=level, message=Text.from_markup(message).plain)
+
+    def _emit_progress(self) -> None:
+        self.emit('progress', completed=self._completed, total=self._total, **self._fields)
+
+    def add_task(self, description: str, total: Optional[float] = None, **fields: Any) -> int:
+        """添加任务，第一个任务作为总体进度"""
+        task_id = next(self._task_ids)
+        if self._main_task is None:
+            self._main_task = task_id
+            self._total = total
+        return task_id
+
+    def update(
+        self,
+        task_id: int,
+        advance: Optional[float] = None,
+        total: Optional[float] = None,
+        **fields: Any
+    ) -> None:
+        """更新任务进度，只有总体进度会按间隔输出"""
+        if task_id != self._main_task:
+            return
+        if total is not None:
+            self._total = total
+        if advance:
+            with self._count_lock:
+                self._completed += advance
+        if fields:
+            self._fields = fields
+        now = time.monotonic()
+        if now >= self._next_emit:
+            self._next_emit = now + self.progress_interval
+            self._emit_progress()
+
+    def remove_task(self, task_id: int) -> None:
+        """移除任务(无需输出)"""
+
+    def reset(self, task_id: int, total: Optional[float] = None, **fields: Any) -> None:
+        """重置总体进度"""
+        if task_id != self._main_task:
+            return
+        with self._count_lock:
+            self._completed = 0
+        self._total = total
+        self._emit_progress()
+
+    def flush(self) -> None:
+        """输出当前总体进度并等待此前的事件全部写出"""
+        if self._main_task is not None:
+            self._emit_progress()
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait()
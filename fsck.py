@@ -0,0 +1,199 @@
+"""图片目录与Redis下载状态的一致性检查与修复"""
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterable, Iterator, List, Set, Tuple
+
+from config import DOWNLOAD_CONFIG
+from redis_client import RedisClient
+from storage import BLOB_DIR, IMAGE_NAME, ImageStore, file_sha256, get_store
+
+# 报告中列出的样例数量
+_SAMPLES = 10
+
+# 每个检查任务处理的文件数，也是修复时每批写入Redis的页数
+_BATCH = 1000
+
+Page = Tuple[str, int]
+
+
+def _scan_dir(path: str) -> Tuple[List[Tuple[Page, str]], List[str]]:
+    """
+    列出单个目录中的图片文件和子目录(不递归)
+
+    返回:
+        tuple: ([(页, 文件路径)], [子目录路径])
+    """
+    images: List[Tuple[Page, str]] = []
+    subdirs: List[str] = []
+    try:
+        entries = os.scandir(path)
+    except FileNotFoundError:
+        return images, subdirs
+    with entries:
+        for entry in entries:
+            if entry.name == BLOB_DIR:
+                continue
+            if entry.is_dir(follow_symlinks=False):
+                subdirs.append(entry.path)
+                continue
+            match = IMAGE_NAME.match(entry.name)
+            if match and entry.is_file():
+                images.append(((match.group(1), int(match.group(2))), entry.path))
+    return images, subdirs
+
+
+def _check_files(
+    store: ImageStore,
+    files: List[Tuple[Page, str]],
+    checksum: bool
+) -> List[Tuple[Page, int, Any, str]]:
+    """
+    检查一批文件的大小(和校验值)
+
+    有清单记录时与记录的大小和SHA-256比较，否则只检查文件非空。
+
+    返回:
+        list: (页, 字节数, 文件标识(设备号, inode), 状态)，状态为 ok / truncated / corrupt / missing
+    """
+    results = []
+    for page, path in files:
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            results.append((page, 0, None, 'missing'))
+            continue
+        entry = store.manifest.get(*page)
+        if stat.st_size == 0 or (entry and stat.st_size != entry.size):
+            status = 'truncated'
+        elif checksum and entry and file_sha256(path).hexdigest() != entry.sha256:
+            status = 'corrupt'
+        else:
+            status = 'ok'
+        results.append((page, stat.st_size, (stat.st_dev, stat.st_ino), status))
+    return results
+
+
+def _chunks(items: List[Any], size: int) -> Iterator[List[Any]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _read_recorded(redis_client: RedisClient) -> Set[Page]:
+    """读取当前数据库记录的全部已下载页"""
+    recorded: Set[Page] = set()
+    for pid, pages in redis_client.iter_downloaded_pages(batch_size=_BATCH):
+        recorded.update((pid, page) for page in pages)
+    return recorded
+
+
+def _samples(pages: Iterable[Page]) -> List[str]:
+    return [f"{pid}_p{page}" for pid, page in sorted(pages)[:_SAMPLES]]
+
+
+def verify_store(
+    redis_client: RedisClient,
+    img_dir: str = '',
+    jobs: int = 8,
+    checksum: bool = False,
+    repair: bool = False
+) -> Dict[str, Any]:
+    """
+    对比图片目录和当前数据库的已下载记录
+
+    Redis记录的读取与目录遍历同时进行：线程池并行列出各分片目录，
+    并按批检查文件大小和可选的SHA-256。修复时按批写入Redis：
+    补记有文件无记录的页，撤销文件缺失、截断或损坏的页(下次运行会重新下载)。
+
+    参数:
+        redis_client: 已选择数据库的Redis客户端
+        img_dir: 图片目录，默认使用下载配置
+        jobs: 并行线程数
+        checksum: 是否按清单校验SHA-256
+        repair: 是否修复Redis记录，默认只读
+
+    返回:
+        dict: 文件数、记录数、不一致项的数量与样例、修复数量和吞吐量
+    """
+    img_dir = img_dir or DOWNLOAD_CONFIG.img_dir
+    store = get_store(img_dir)
+    start = time.perf_counter()
+
+    checked: List[Tuple[Page, int, Any, str]] = []
+    # 读取Redis占用一个线程，其余线程遍历目录
+    with ThreadPoolExecutor(max_workers=max(jobs, 1) + 1) as pool:
+        recorded_future = pool.submit(_read_recorded, redis_client)
+
+        def check(chunk: List[Tuple[Page, str]]) -> Future:
+            return pool.submit(_check_files, store, chunk, checksum)
+
+        pending: Set[Future] = {pool.submit(_scan_dir, img_dir)}
+        # manifest去重方式下图片只以清单记录指向内容副本的形式存在
+        if store.dedup == 'manifest':
+            blobs = [
+                ((entry.pid, entry.page), store.path(entry.path))
+                for entry in store.manifest if entry.path.startswith(BLOB_DIR)
+            ]
+            pending.update(map(check, _chunks(blobs, _BATCH)))
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                if isinstance(result, tuple):
+                    images, subdirs = result
+                    pending.update(pool.submit(_scan_dir, path) for path in subdirs)
+                    pending.update(map(check, _chunks(images, _BATCH)))
+                else:
+                    checked.extend(result)
+        recorded = recorded_future.result()
+
+    files: Dict[Page, Tuple[int, Any]] = {}
+    damaged: Dict[str, Set[Page]] = {'truncated': set(), 'corrupt': set()}
+    total_bytes = 0
+    for page, size, inode, status in checked:
+        total_bytes += size
+        if status == 'ok':
+            files[page] = (size, inode)
+        elif status in damaged:
+            damaged[status].add(page)
+
+    untracked = files.keys() - recorded
+    missing = recorded - files.keys()
+    marked = unmarked = 0
+    if repair:
+        # 同一内容(硬链接到同一副本或清单指向同一副本)只计入一次实际占用，
+        # 已有记录的页已经计入过，补记的页只有内容未被其他页占用时才计入
+        owners: Dict[Any, Page] = {}
+        for page in sorted(files, key=lambda page: (page not in recorded, page)):
+            owners.setdefault(files[page][1], page)
+        for chunk in _chunks(sorted(untracked), _BATCH):
+            marked += redis_client.mark_images_downloaded(
+                (pid, page, files[pid, page][0], owners[files[pid, page][1]] == (pid, page))
+                for pid, page in chunk
+            )
+        for chunk in _chunks(sorted(missing), _BATCH):
+            unmarked += redis_client.unmark_images(chunk)
+            for pid, page in chunk:
+                entry = store.manifest.get(pid, page)
+                if entry and not os.path.exists(store.path(entry.path)):
+                    store.manifest.remove(pid, page)
+
+    elapsed = time.perf_counter() - start
+    return {
+        'img_dir': img_dir,
+        'files': len(checked),
+        'bytes': total_bytes,
+        'recorded': len(recorded),
+        'untracked': len(untracked),
+        'missing': len(missing),
+        'truncated': len(damaged['truncated']),
+        'corrupt': len(damaged['corrupt']),
+        'marked': marked,
+        'unmarked': unmarked,
+        'untracked_samples': _samples(untracked),
+        'missing_samples': _samples(missing),
+        'seconds': round(elapsed, 3),
+        'files_per_sec': round(len(checked) / elapsed, 1) if elapsed else 0.0,
+        'mb_per_sec': round(total_bytes / 2**20 / elapsed, 1) if elapsed else 0.0
+    }
@@ -0,0 +1,374 @@
+"""共享HTTP传输层"""
+import asyncio
+import importlib.util
+import json
+import random
+import threading
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+from typing import Any, Awaitable, Callable, Dict, Iterator, Optional, Tuple, Type
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import HTTP_CONFIG
+from metrics import Metrics
+from rate_control import AdaptiveLimiter, parse_retry_after
+
+# 可重试的网络异常
+RETRYABLE_ERRORS = (
+    requests.ConnectionError,
+    requests.Timeout,
+    requests.exceptions.ChunkedEncodingError
+)
+
+
+class _Http2Response:
+    """httpx响应的包装，提供下载路径用到的requests.Response接口"""
+
+    def __init__(self, session: '_Http2Session', response: Any, elapsed: float):
+        self._session = session
+        self._response = response
+        self.status_code = response.status_code
+        self.headers = response.headers
+        self.elapsed = timedelta(seconds=elapsed)
+        self._content: Optional[bytes] = None
+
+    def iter_content(self, chunk_size: int) -> Iterator[bytes]:
+        """流式读取响应体，每块在会话的事件循环中读取"""
+        chunks = self._response.aiter_bytes(chunk_size)
+        while True:
+            chunk = self._session.call(_next_chunk(chunks))
+            if chunk is None:
+                return
+            yield chunk
+
+    def read(self) -> bytes:
+        """读取完整响应体"""
+        if self._content is None:
+            self._content = b''.join(self.iter_content(64 * 1024))
+        return self._content
+
+    @property
+    def content(self) -> bytes:
+        return self.read()
+
+    def json(self) -> Any:
+        return json.loads(self.content)
+
+    def close(self) -> None:
+        self._session.call(self._response.aclose())
+
+
+async def _next_chunk(chunks: Any) -> Optional[bytes]:
+    try:
+        return await chunks.__anext__()
+    except StopAsyncIteration:
+        return None
+
+
+class _Http2Session:
+    """
+    基于httpx的HTTP/2会话，接口与requests.Session.get一致
+
+    同一主机的并发请求复用少量连接上的多路流。httpx的同步HTTP/2连接
+    不能安全地被多个线程同时读写，因此连接只在会话自己的事件循环线程中
+    使用，下载线程通过call提交请求和读取响应块。https通过ALPN协商，
+    服务器不支持时回退到HTTP/1.1；明文http只能以先验知识使用h2c。
+    """
+
+    def __init__(self, scheme: str, pool_size: int):
+        import httpx
+
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, name='http2', daemon=True).start()
+        self._client = httpx.AsyncClient(
+            http1=scheme == 'https',
+            http2=True,
+            verify=False,
+            follow_redirects=True,
+            limits=httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+        )
+
+    def call(self, coro: Awaitable[Any]) -> Any:
+        """在事件循环中执行协程并等待结果，连接错误和超时转换为requests异常"""
+        import httpx
+
+        try:
+            return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+        except httpx.TimeoutException as e:
+            raise requests.Timeout(str(e)) from e
+        except httpx.TransportError as e:
+            raise requests.ConnectionError(str(e)) from e
+
+    def get(
+        self,
+        url: str,
+        timeout: Tuple[float, float],
+        stream: bool = False,
+        **kwargs
+    ) -> _Http2Response:
+        """发送GET请求"""
+        import httpx
+
+        connect, read = timeout
+        request = self._client.build_request(
+            'GET', url,
+            timeout=httpx.Timeout(read, connect=connect),
+            **kwargs
+        )
+        start = time.perf_counter()
+        response = _Http2Response(self, self.call(self._client.send(request, stream=True)), time.perf_counter() - start)
+        if not stream:
+            try:
+                response.read()
+            finally:
+                response.close()
+        return response
+
+    def close(self) -> None:
+        self.call(self._client.aclose())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+
+class HttpClient:
+    """HTTP客户端管理器，每个主机一个持久会话、独立的连接池和自适应并发限制"""
+    _instance: Optional['HttpClient'] = None
+
+    def __new__(cls) -> 'HttpClient':
+        """确保单例"""
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        """初始化客户端管理器"""
+        if not hasattr(self, '_initialized'):
+            self._initialized = True
+            self._lock = threading.Lock()
+            self._sessions: Dict[str, requests.Session] = {}
+            self._http2_sessions: Dict[str, _Http2Session] = {}
+            self._limiters: Dict[str, AdaptiveLimiter] = {}
+            self.metrics = Metrics()
+
+    @staticmethod
+    def _host(url: str) -> str:
+        """获取URL对应的主机"""
+        return urlsplit(url).netloc
+
+    def _get_session(self, host: str) -> requests.Session:
+        """获取指定主机的会话，连接池大小按主机配置"""
+        with self._lock:
+            if host not in self._sessions:
+                pool_size = HTTP_CONFIG.pool_sizes.get(host, HTTP_CONFIG.default_pool_size)
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=pool_size,
+                    max_retries=0
+                )
+                session = requests.Session()
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                session.verify = False
+                self._sessions[host] = session
+            return self._sessions[host]
+
+    @staticmethod
+    def require_http2() -> None:
+        """检查HTTP/2传输的可选依赖是否已安装"""
+        if importlib.util.find_spec('httpx') is None or importlib.util.find_spec('h2') is None:
+            raise ValueError("HTTP/2传输需要安装httpx：pip install 'httpx[http2]'")
+
+    def _get_http2_session(self, url: str) -> _Http2Session:
+        """获取指定主机的HTTP/2会话，连接数上限沿用该主机的连接池大小"""
+        host = self._host(url)
+        with self._lock:
+            if host not in self._http2_sessions:
+                pool_size = HTTP_CONFIG.pool_sizes.get(host, HTTP_CONFIG.default_pool_size)
+                self._http2_sessions[host] = _Http2Session(urlsplit(url).scheme, pool_size)
+            return self._http2_sessions[host]
+
+    def _get_limiter(self, host: str) -> AdaptiveLimiter:
+        """获取指定主机的并发限制器"""
+        with self._lock:
+            if host not in self._limiters:
+                limit = HTTP_CONFIG.host_concurrency.get(host, HTTP_CONFIG.default_concurrency)
+                self._limiters[host] = AdaptiveLimiter(limit)
+            return self._limiters[host]
+
+    def describe_limits(self) -> str:
+        """
+        各主机当前的并发限制，用于进度显示
+
+        返回:
+            str: 如 'pixiv 4/6 pximg 10/12'
+        """
+        with self._lock:
+            limiters = list(self._limiters.items())
+        return ' '.join(
+            f"{host.split('.')[-2] if host.count('.') else host} {limiter.describe()}"
+            for host, limiter in limiters
+        )
+
+    @staticmethod
+    def backoff(attempt: int) -> float:
+        """
+        计算第attempt次重试前的等待时间(全抖动指数退避)
+
+        参数:
+            attempt: 已失败次数(从0开始)
+
+        返回:
+            float: 等待秒数
+        """
+        ceiling = min(HTTP_CONFIG.backoff_max, HTTP_CONFIG.backoff_base * (2 ** attempt))
+        return random.uniform(0, ceiling)
+
+    def call_with_retries(
+        self,
+        func: Callable[..., Any],
+        *args,
+        retry_on: Tuple[Type[BaseException], ...] = RETRYABLE_ERRORS,
+        retries: Optional[int] = None
+    ) -> Any:
+        """
+        执行func，抛出retry_on中的异常时按退避策略重试
+
+        参数:
+            func: 要执行的函数
+            *args: 传给func的参数
+            retry_on: 需要重试的异常类型
+            retries: 覆盖默认重试次数
+
+        返回:
+            func的返回值
+        """
+        retries = HTTP_CONFIG.max_retries if retries is None else retries
+        for attempt in range(retries + 1):
+            try:
+                return func(*args)
+            except retry_on as e:
+                if attempt == retries:
+                    raise
+                self.metrics.inc('pixiv_retries_total', cause=type(e).__name__)
+            time.sleep(self.backoff(attempt))
+        raise AssertionError('unreachable')
+
+    def _send(
+        self,
+        url: str,
+        stream: bool,
+        retries: Optional[int] = None,
+        http2: bool = False,
+        **kwargs
+    ) -> Tuple[requests.Response, AdaptiveLimiter]:
+        """
+        发送GET请求，网络异常和可重试状态码按退避策略重试，
+        服务器返回Retry-After时至少等待指定时间
+
+        返回:
+            tuple: (响应, 仍被占用的主机限制器)
+        """
+        host = self._host(url)
+        session = self._get_http2_session(url) if http2 else self._get_session(host)
+        limiter = self._get_limiter(host)
+        retries = HTTP_CONFIG.max_retries if retries is None else retries
+        kwargs.setdefault('timeout', (HTTP_CONFIG.connect_timeout, HTTP_CONFIG.read_timeout))
+
+        for attempt in range(retries + 1):
+            retry_after = None
+            limiter.acquire()
+            try:
+                response = session.get(url, stream=stream, **kwargs)
+            except RETRYABLE_ERRORS as e:
+                limiter.release(None)
+                if attempt == retries:
+                    raise
+                self.metrics.inc('pixiv_retries_total', cause=type(e).__name__)
+            except BaseException:
+                limiter.release(None)
+                raise
+            else:
+                if response.status_code not in HTTP_CONFIG.retry_statuses or attempt == retries:
+                    self.metrics.observe('pixiv_http_ttfb_seconds', response.elapsed.total_seconds(), host=host)
+                    # 成功请求在响应处理完后释放，以便计入整个传输过程
+                    return response, limiter
+                self.metrics.inc('pixiv_retries_total', cause=f'http_{response.status_code}')
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                response.close()
+                limiter.release(
+                    response.status_code,
+                    response.elapsed.total_seconds(),
+                    retry_after
+                )
+            time.sleep(max(self.backoff(attempt), retry_after or 0))
+
+        raise AssertionError('unreachable')
+
+    @staticmethod
+    def _release(limiter: AdaptiveLimiter, response: requests.Response) -> None:
+        """释放限制器并反馈本次响应的状态和首字节延迟"""
+        limiter.release(
+            response.status_code,
+            response.elapsed.total_seconds(),
+            parse_retry_after(response.headers.get('Retry-After'))
+        )
+
+    def get(self, url: str, retries: Optional[int] = None, http2: bool = False, **kwargs) -> requests.Response:
+        """
+        发送GET请求并读取完整响应
+
+        参数:
+            url: 请求地址
+            retries: 覆盖默认重试次数
+            http2: 使用HTTP/2会话(需先调用require_http2检查依赖)
+            **kwargs: 透传给requests的参数(headers、params等)
+
+        返回:
+            Response: 最后一次请求的响应
+        """
+        response, limiter = self._send(url, stream=False, retries=retries, http2=http2, **kwargs)
+        self._release(limiter, response)
+        return response
+
+    @contextmanager
+    def stream(
+        self,
+        url: str,
+        retries: Optional[int] = None,
+        http2: bool = False,
+        **kwargs
+    ) -> Iterator[requests.Response]:
+        """
+        以流式方式发送GET请求，退出上下文时关闭响应并释放主机槽位
+
+        参数:
+            url: 请求地址
+            retries: 覆盖默认重试次数
+            http2: 使用HTTP/2会话(需先调用require_http2检查依赖)
+            **kwargs: 透传给requests的参数
+        """
+        response, limiter = self._send(url, stream=True, retries=retries, http2=http2, **kwargs)
+        try:
+            yield response
+        except BaseException as e:
+            response.close()
+            # 传输中断(包括调用方包装后的异常)按网络错误反馈给限制器
+            if isinstance(e, RETRYABLE_ERRORS) or isinstance(e.__cause__, RETRYABLE_ERRORS):
+                limiter.release(None)
+            else:
+                self._release(limiter, response)
+            raise
+        else:
+            response.close()
+            self._release(limiter, response)
+
+    def close(self) -> None:
+        """关闭所有会话"""
+        with self._lock:
+            for session in [*self._sessions.values(), *self._http2_sessions.values()]:
+                session.close()
+            self._sessions.clear()
+            self._http2_sessions.clear()
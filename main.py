@@ -1,89 +1,485 @@
 #!/usr/bin/env python3
 """
 Pixiv爬虫 - 主程序入口
-环境需求：Python3.8+ / Redis 
+环境需求：Python3.8+ / Redis
+
+不带参数运行时进入交互菜单，子命令用于脚本和定时任务：
+    python main.py crawl --db 0 --mode daily --workers 8 --output ./img --headless
+    python main.py backfill --start 2024-01-01 --end 2024-01-31 --modes daily,weekly
+    python main.py retry --db 0 --headless
+    python main.py publish ranking --db 0 --mode daily
+    python main.py publish backfill --start 2024-01-01 --end 2024-01-31 --modes daily
+    python main.py worker --db 0 --headless --idle-exit
+    python main.py stats --db 0 --json
+    python main.py clear --db 5 --yes
+    python main.py verify --db 0 --checksum --repair --jobs 16
+    python main.py relayout --layout id --jobs 8
+    python main.py export --db 0 --backend redis | python main.py import --db 0 --backend sqlite
+
+重量级模块(rich/redis/requests)只在需要的子命令中导入，stats直接用RESP协议
+读取计数器，启动时间适合健康检查。
 """
+import argparse
+import json
+import socket
 import sys
-from typing import NoReturn
-import requests.packages.urllib3
-from rich.console import Console
-import redis.exceptions
-
-from pixiv_spider import PixivSpider
-import redis_monitor
-from config import REDIS_CONFIG
-
-# 禁用SSL警告
-requests.packages.urllib3.disable_warnings()
-
-console = Console()
-
-def show_main_menu() -> NoReturn:
-    """显示主菜单并处理用户选择"""
-    while True:
-        try:
-            console.print("\n=== PixivSpider ===")
-            console.print("1. 爬取每日排行榜")
-            console.print("2. Redis数据库操作")
-            console.print("3. 退出程序")
-            
-            choice = console.input("\n请选择操作 (1-3): ")
-            
-            if choice == "1":
-                run_spider()
-            elif choice == "2":
-                run_redis_monitor()
-            elif choice == "3":
-                console.print("\n[green]再见![/green]")
-                sys.exit(0)
-            else:
-                console.print("\n[red]无效的选择，请重试[/red]")
-                
-        except KeyboardInterrupt:
-            console.print("\n\n[yellow]检测到Ctrl+C，正在安全退出...[/yellow]")
-            sys.exit(0)
-        except Exception as e:
-            console.print(f"\n[red]发生错误：{str(e)}[/red]")
-
-def run_spider() -> None:
-    """运行Pixiv爬虫"""
-    console.print("\n=== 启动PixivSpider ===")
-    console.print("[yellow]确保已安装并启动Redis服务[/yellow]")
-    console.print("[yellow]确保已准备好有效的Pixiv Cookie[/yellow]")
-    
-    while True:
-        try:
-            console.print("\n[cyan]可用的Redis数据库:[/cyan]")
-            min_db, max_db = REDIS_CONFIG.db_range
-            for i in range(min_db, max_db + 1):
-                console.print(f"{i}.DB{i}")
-                
-            db_choice = console.input("\n请选择Redis数据库: ")
-            db_num = int(db_choice)
-            
-            if min_db <= db_num <= max_db:
-                spider = PixivSpider(db_num)
-                spider.run()
-                break
-            else:
-                console.print(f"[red]错误：请输入{min_db}到{max_db}之间的数字[/red]")
-                
-        except redis.exceptions.ConnectionError:
-            console.print('[red]错误：无法连接到Redis服务，请确保Redis服务正在运行[/red]')
-            break
-        except ValueError:
-            console.print("[red]错误：请输入有效的数字[/red]")
-        except KeyboardInterrupt:
-            console.print('\n[yellow]用户中断运行[/yellow]')
-            break
-        except Exception as e:
-            console.print(f'[red]发生错误：{str(e)}[/red]')
-            break
-
-def run_redis_monitor() -> None:
-    """运行Redis管理工具"""
-    console.print("\n=== 启动Redis管理工具 ===")
-    redis_monitor.show_menu()
+from typing import Any, Dict, List, Optional
+
+from config import DOWNLOAD_CONFIG, PIPELINE_CONFIG, POSTPROCESS_CONFIG, REDIS_CONFIG, STATE_CONFIG, RedisKeys
+
+def _error(message: str) -> None:
+    """向标准错误输出错误信息"""
+    print(f"错误：{message}", file=sys.stderr)
+
+def _apply_options(args: argparse.Namespace) -> None:
+    """把命令行参数写入全局配置"""
+    if getattr(args, 'backend', None):
+        STATE_CONFIG.backend = args.backend
+    if getattr(args, 'output', None):
+        DOWNLOAD_CONFIG.img_dir = args.output
+    if getattr(args, 'layout', None):
+        DOWNLOAD_CONFIG.layout = args.layout
+    if getattr(args, 'workers', None):
+        PIPELINE_CONFIG.download_workers = args.workers
+    if getattr(args, 'metadata_workers', None):
+        PIPELINE_CONFIG.metadata_workers = args.metadata_workers
+    if getattr(args, 'schedule', None):
+        PIPELINE_CONFIG.schedule_policy = args.schedule
+    if getattr(args, 'postprocess', None):
+        POSTPROCESS_CONFIG.hooks = tuple(name.strip() for name in args.postprocess.split(',') if name.strip())
+
+def _create_spider(args: argparse.Namespace, local_cache: Optional[str] = None):
+    """按参数创建爬虫并写入cookie"""
+    from pixiv_spider import PixivSpider
+    from storage import get_store
+
+    # 布局与图片目录已使用的不一致时在开始爬取前拒绝
+    get_store()
+    spider = PixivSpider(args.db, headless=args.headless, local_cache=local_cache)
+    if args.cookie:
+        spider.redis.set_cookie(args.cookie)
+    return spider
+
+def _select_state(db: int):
+    """获取已选择数据库的状态存储客户端"""
+    from state_backend import get_state_client
+
+    client = get_state_client()
+    if not client.select_db(db):
+        raise ValueError(f"无效的Redis数据库编号: {db}")
+    return client
+
+def _run_with_redis(func) -> int:
+    """执行需要状态存储的命令，统一处理连接错误和中断"""
+    import sqlite3
+
+    import redis.exceptions
+
+    try:
+        return func()
+    except redis.exceptions.ConnectionError:
+        _error('无法连接到Redis服务，请确保Redis服务正在运行')
+        return 1
+    except sqlite3.Error as e:
+        _error(f'无法访问状态数据库：{e}')
+        return 1
+    except KeyboardInterrupt:
+        return 130
+    except ValueError as e:
+        _error(str(e))
+        return 1
+
+def cmd_crawl(args: argparse.Namespace) -> int:
+    """爬取排行榜"""
+    def crawl() -> int:
+        _create_spider(args).run(mode=args.mode)
+        return 0
+    return _run_with_redis(crawl)
+
+def _parse_backfill_range(args: argparse.Namespace):
+    """
+    解析回填的日期范围和排行榜类型
+
+    返回:
+        tuple: (起始日期, 结束日期, 排行榜类型列表)，参数无效时输出错误并返回None
+    """
+    from datetime import datetime
+
+    try:
+        start = datetime.strptime(args.start, "%Y-%m-%d").date()
+        end = datetime.strptime(args.end, "%Y-%m-%d").date()
+    except ValueError:
+        _error('日期格式应为YYYY-MM-DD')
+        return None
+    if start > end:
+        _error('起始日期不能晚于结束日期')
+        return None
+    return start, end, [mode.strip() for mode in args.modes.split(",") if mode.strip()]
+
+def cmd_backfill(args: argparse.Namespace) -> int:
+    """回填历史排行榜"""
+    parsed = _parse_backfill_range(args)
+    if parsed is None:
+        return 2
+    start, end, modes = parsed
+
+    def backfill() -> int:
+        _create_spider(args).run_backfill(start, end, modes)
+        return 0
+    return _run_with_redis(backfill)
+
+def cmd_retry(args: argparse.Namespace) -> int:
+    """重试到期的失败作品，或输出重试队列状态"""
+    if args.status:
+        def status() -> int:
+            client = _select_state(args.db)
+            report = client.get_retry_stats()
+            report['dead_letters'] = client.get_dead_letters(args.limit or 20)
+            print(json.dumps(report, ensure_ascii=False))
+            return 0
+        return _run_with_redis(status)
+
+    def retry() -> int:
+        _create_spider(args).run_retry(args.limit)
+        return 0
+    return _run_with_redis(retry)
+
+def _require_queue_backend() -> bool:
+    """分布式任务队列基于Redis Streams，其他后端时输出错误"""
+    if STATE_CONFIG.backend != 'redis':
+        _error('分布式任务队列需要Redis后端')
+        return False
+    return True
+
+def cmd_publish(args: argparse.Namespace) -> int:
+    """把排行榜或回填范围内未完成的作品发布到分布式任务队列"""
+    if not _require_queue_backend():
+        return 2
+    parsed = None
+    if args.source == 'backfill':
+        if not (args.start and args.end):
+            _error('publish backfill 需要 --start 和 --end')
+            return 2
+        parsed = _parse_backfill_range(args)
+        if parsed is None:
+            return 2
+
+    def publish() -> int:
+        spider = _create_spider(args)
+        if args.source == 'backfill':
+            count = spider.publish_backfill(*parsed)
+        else:
+            count = spider.publish_ranking(args.mode)
+        print(f"已发布 {count} 个作品任务", file=sys.stderr)
+        return 0
+    return _run_with_redis(publish)
+
+def cmd_worker(args: argparse.Namespace) -> int:
+    """作为分布式工作进程运行"""
+    if not _require_queue_backend():
+        return 2
+
+    def worker() -> int:
+        # 其他工作进程会并发更新状态，不载入本地去重缓存
+        _create_spider(args, local_cache='none').run_worker(idle_exit=args.idle_exit)
+        return 0
+    return _run_with_redis(worker)
+
+def _resp_command(stream, *args: str) -> Any:
+    """发送一条Redis命令并读取响应(RESP2)"""
+    parts = [f"*{len(args)}\r\n".encode()]
+    for arg in args:
+        data = str(arg).encode()
+        parts.append(b"$%d\r\n%s\r\n" % (len(data), data))
+    stream.write(b"".join(parts))
+    stream.flush()
+    return _resp_read(stream)
+
+def _resp_read(stream) -> Any:
+    """读取一个RESP2响应"""
+    line = stream.readline()
+    if not line:
+        raise ConnectionError('连接被关闭')
+    kind, payload = line[:1], line[1:-2]
+    if kind == b'+':
+        return payload.decode()
+    if kind == b'-':
+        raise RuntimeError(payload.decode())
+    if kind == b':':
+        return int(payload)
+    if kind == b'$':
+        length = int(payload)
+        if length < 0:
+            return None
+        return stream.read(length + 2)[:-2].decode()
+    if kind == b'*':
+        count = int(payload)
+        return None if count < 0 else [_resp_read(stream) for _ in range(count)]
+    raise RuntimeError(f'无法解析的响应: {line!r}')
+
+def read_stats(dbs: List[int], timeout: float = 2.0) -> List[Dict[str, Any]]:
+    """
+    读取各数据库的统计计数器和键数量
+
+    不导入redis-py，用一条连接直接发送SELECT/HMGET/DBSIZE。
+
+    参数:
+        dbs: 数据库编号列表
+        timeout: 连接与读取超时(秒)
+
+    返回:
+        list: 每个数据库的works/images/bytes/stored/keys
+    """
+    results = []
+    with socket.create_connection((REDIS_CONFIG.host, REDIS_CONFIG.port), timeout=timeout) as sock:
+        stream = sock.makefile('rwb')
+        for db in dbs:
+            _resp_command(stream, 'SELECT', str(db))
+            names = (RedisKeys.STAT_WORKS, RedisKeys.STAT_IMAGES, RedisKeys.STAT_BYTES, RedisKeys.STAT_STORED)
+            values = _resp_command(stream, 'HMGET', RedisKeys.STATS, *names)
+            item = {'db': db}
+            item.update((name, int(value or 0)) for name, value in zip(names, values))
+            item['keys'] = _resp_command(stream, 'DBSIZE')
+            results.append(item)
+    return results
+
+def read_sqlite_stats(dbs: List[int]) -> List[Dict[str, Any]]:
+    """
+    读取SQLite后端各数据库的统计计数器和条目数量(只读打开，不存在的数据库为0)
+
+    参数:
+        dbs: 数据库编号列表
+
+    返回:
+        list: 每个数据库的works/images/bytes/stored/keys
+    """
+    import os
+    import sqlite3
+    from contextlib import closing
+
+    from state_backend import sqlite_path
+
+    names = (RedisKeys.STAT_WORKS, RedisKeys.STAT_IMAGES, RedisKeys.STAT_BYTES, RedisKeys.STAT_STORED)
+    results = []
+    for db in dbs:
+        item: Dict[str, Any] = {'db': db, **{name: 0 for name in names}, 'keys': 0}
+        path = sqlite_path(db)
+        if os.path.exists(path):
+            try:
+                with closing(sqlite3.connect(f"file:{path}?mode=ro", uri=True)) as conn:
+                    item.update((name, int(value)) for name, value in conn.execute('SELECT name, value FROM stats'))
+                    item['keys'] = conn.execute(
+                        'SELECT (SELECT COUNT(DISTINCT pid) FROM work_fields) + (SELECT COUNT(*) FROM kv)'
+                    ).fetchone()[0]
+            except sqlite3.Error as e:
+                raise RuntimeError(e) from e
+        results.append({name: item[name] for name in ('db', *names, 'keys')})
+    return results
+
+def cmd_stats(args: argparse.Namespace) -> int:
+    """输出数据库统计"""
+    min_db, max_db = REDIS_CONFIG.db_range
+    dbs = list(range(min_db, max_db + 1)) if args.all else [args.db]
+    try:
+        stats = read_sqlite_stats(dbs) if STATE_CONFIG.backend == 'sqlite' else read_stats(dbs)
+    except (OSError, RuntimeError) as e:
+        _error(f'无法读取统计：{e}')
+        return 1
+    if args.all:
+        stats = [item for item in stats if item['keys']]
+
+    if args.json:
+        print(json.dumps(stats if args.all else stats[0], ensure_ascii=False))
+    else:
+        for item in stats:
+            print(f"DB{item['db']}: 作品 {item['works']}  图片 {item['images']}  键 {item['keys']}")
+    return 0
+
+def cmd_clear(args: argparse.Namespace) -> int:
+    """清空数据库"""
+    if not args.yes:
+        if not sys.stdin.isatty():
+            _error('非交互环境下清空数据库需要 --yes')
+            return 2
+        if input(f"确定要清空DB{args.db}吗？(y/n): ").strip().lower() != 'y':
+            return 0
+
+    def clear() -> int:
+        _select_state(args.db).clear_db()
+        print(f"DB{args.db} 已清空")
+        return 0
+    return _run_with_redis(clear)
+
+def cmd_verify(args: argparse.Namespace) -> int:
+    """检查图片目录与下载记录是否一致"""
+    def verify() -> int:
+        from fsck import verify_store
+
+        report = verify_store(
+            _select_state(args.db),
+            args.output,
+            jobs=args.jobs,
+            checksum=args.checksum,
+            repair=args.repair
+        )
+        if args.json:
+            print(json.dumps(report, ensure_ascii=False))
+        else:
+            print(f"目录 {report['img_dir']}: 文件 {report['files']}，记录 {report['recorded']}")
+            print(f"有文件无记录 {report['untracked']}，有记录无文件 {report['missing']}"
+                  f"(截断 {report['truncated']}，损坏 {report['corrupt']})")
+            for name in report['missing_samples']:
+                print(f"  缺少文件: {name}")
+            if args.repair:
+                print(f"已补记 {report['marked']}，已撤销 {report['unmarked']}")
+            print(f"耗时 {report['seconds']}s，{report['files_per_sec']} 文件/s，{report['mb_per_sec']} MiB/s")
+        if args.repair or (not report['untracked'] and not report['missing']):
+            return 0
+        return 3
+    return _run_with_redis(verify)
+
+def cmd_relayout(args: argparse.Namespace) -> int:
+    """把平铺的图片目录迁移到分片布局并建立清单"""
+    from storage import get_store
+
+    store = get_store(layout=args.layout, check=False)
+    resolve = None
+    if args.layout in ('date', 'user'):
+        client = _select_state(args.db)
+
+        def resolve(pid: str):
+            urls = client.get_cached_urls(pid) if args.layout == 'date' else None
+            user_id = client.get_user_id(pid) if args.layout == 'user' else None
+            return (urls[0] if urls else None), user_id
+
+    def migrate() -> int:
+        report = store.migrate(workers=args.jobs, resolve=resolve)
+        print(json.dumps(report, ensure_ascii=False))
+        return 0
+    return _run_with_redis(migrate)
+
+def cmd_export(args: argparse.Namespace) -> int:
+    """导出作品状态"""
+    from state_backend import export_state
+
+    def export() -> int:
+        client = _select_state(args.db)
+        if args.file == '-':
+            count = export_state(client, sys.stdout)
+        else:
+            with open(args.file, 'w', encoding='utf-8') as fp:
+                count = export_state(client, fp)
+        print(f"已导出 {count} 个作品", file=sys.stderr)
+        return 0
+    return _run_with_redis(export)
+
+def cmd_import(args: argparse.Namespace) -> int:
+    """导入作品状态"""
+    from state_backend import import_state
+
+    def load() -> int:
+        client = _select_state(args.db)
+        if args.file == '-':
+            count = import_state(client, sys.stdin)
+        else:
+            with open(args.file, encoding='utf-8') as fp:
+                count = import_state(client, fp)
+        print(f"已导入 {count} 个作品", file=sys.stderr)
+        return 0
+    return _run_with_redis(load)
+
+def build_parser() -> argparse.ArgumentParser:
+    """构建命令行解析器"""
+    parser = argparse.ArgumentParser(description='Pixiv排行榜爬虫，不带子命令时进入交互菜单')
+    commands = parser.add_subparsers(dest='command')
+
+    def add_db(sub: argparse.ArgumentParser) -> None:
+        sub.add_argument('--db', type=int, default=REDIS_CONFIG.db_range[0], help='Redis数据库编号')
+        sub.add_argument('--backend', choices=('redis', 'sqlite'), help='状态存储后端，默认使用配置')
+
+    def add_session_options(sub: argparse.ArgumentParser) -> None:
+        add_db(sub)
+        sub.add_argument('--cookie', help='写入并使用的Pixiv cookie')
+        sub.add_argument('--headless', action='store_true', help='无界面模式，以JSON-lines输出日志和进度')
+
+    def add_run_options(sub: argparse.ArgumentParser) -> None:
+        add_session_options(sub)
+        sub.add_argument('--workers', type=int, help='图片下载线程数')
+        sub.add_argument('--metadata-workers', type=int, help='作品元数据获取线程数')
+        sub.add_argument('--schedule', choices=('ranking', 'smallest', 'fair'), help='图片页调度策略，默认使用配置')
+        sub.add_argument('--output', help='图片输出目录')
+        sub.add_argument('--layout', choices=('flat', 'id', 'date', 'user'), help='目录布局，默认沿用图片目录已记录的布局')
+        sub.add_argument('--postprocess', help='下载后处理钩子，逗号分隔(phash/thumbnail/webp/avif，需要Pillow)')
+
+    crawl = commands.add_parser('crawl', help='爬取排行榜')
+    add_run_options(crawl)
+    crawl.add_argument('--mode', default='daily', help='排行榜类型(daily/weekly/monthly等)')
+    crawl.set_defaults(func=cmd_crawl)
+
+    backfill = commands.add_parser('backfill', help='回填历史排行榜')
+    add_run_options(backfill)
+    backfill.add_argument('--start', required=True, help='起始日期 YYYY-MM-DD')
+    backfill.add_argument('--end', required=True, help='结束日期 YYYY-MM-DD')
+    backfill.add_argument('--modes', default='daily', help='排行榜类型，逗号分隔')
+    backfill.set_defaults(func=cmd_backfill)
+
+    retry = commands.add_parser('retry', help='只重试重试队列中已到期的失败作品')
+    add_run_options(retry)
+    retry.add_argument('--limit', type=int, help='最多处理的作品数')
+    retry.add_argument('--status', action='store_true', help='只输出重试队列和死信列表(JSON)')
+    retry.set_defaults(func=cmd_retry)
+
+    publish = commands.add_parser('publish', help='把未完成的作品发布到分布式任务队列(需要Redis后端)')
+    add_session_options(publish)
+    publish.add_argument('source', choices=('ranking', 'backfill'), help='任务来源：今日排行榜或历史回填')
+    publish.add_argument('--mode', default='daily', help='ranking：排行榜类型(daily/weekly/monthly等)')
+    publish.add_argument('--start', help='backfill：起始日期 YYYY-MM-DD')
+    publish.add_argument('--end', help='backfill：结束日期 YYYY-MM-DD')
+    publish.add_argument('--modes', default='daily', help='backfill：排行榜类型，逗号分隔')
+    publish.set_defaults(func=cmd_publish)
+
+    worker = commands.add_parser('worker', help='作为分布式工作进程领取任务下载(需要Redis后端)')
+    add_run_options(worker)
+    worker.add_argument('--idle-exit', action='store_true', help='任务队列为空时退出')
+    worker.set_defaults(func=cmd_worker)
+
+    stats = commands.add_parser('stats', help='输出数据库统计')
+    add_db(stats)
+    stats.add_argument('--all', action='store_true', help='输出所有非空数据库')
+    stats.add_argument('--json', action='store_true', help='以JSON输出')
+    stats.set_defaults(func=cmd_stats)
+
+    clear = commands.add_parser('clear', help='清空数据库')
+    add_db(clear)
+    clear.add_argument('--yes', action='store_true', help='不再确认')
+    clear.set_defaults(func=cmd_clear)
+
+    verify = commands.add_parser('verify', help='检查图片目录与下载记录是否一致')
+    add_db(verify)
+    verify.add_argument('--output', help='图片目录')
+    verify.add_argument('--jobs', type=int, default=8, help='并行线程数')
+    verify.add_argument('--checksum', action='store_true', help='按清单校验SHA-256')
+    verify.add_argument('--repair', action='store_true', help='按磁盘修复Redis记录')
+    verify.add_argument('--json', action='store_true', help='以JSON输出')
+    verify.set_defaults(func=cmd_verify)
+
+    relayout = commands.add_parser('relayout', help='把平铺的图片目录迁移到分片布局并建立清单')
+    add_db(relayout)
+    relayout.add_argument('--layout', required=True, choices=('flat', 'id', 'date', 'user'), help='目标布局')
+    relayout.add_argument('--output', help='图片目录')
+    relayout.add_argument('--jobs', type=int, default=8, help='并行线程数')
+    relayout.set_defaults(func=cmd_relayout)
+
+    export = commands.add_parser('export', help='把作品状态导出为JSON-lines')
+    add_db(export)
+    export.add_argument('--file', default='-', help='输出文件，默认标准输出')
+    export.set_defaults(func=cmd_export)
+
+    load = commands.add_parser('import', help='导入export输出的作品状态(应导入到空数据库)')
+    add_db(load)
+    load.add_argument('--file', default='-', help='输入文件，默认标准输入')
+    load.set_defaults(func=cmd_import)
+    return parser
 
 def check_dependencies() -> None:
     """检查并安装依赖包"""
@@ -92,21 +488,38 @@ def check_dependencies() -> None:
         import requests
         from rich import console, progress, layout, panel
     except ImportError:
-        console.print('[yellow]检测到缺少必要包！正在尝试安装！.....[/yellow]')
+        print('检测到缺少必要包！正在尝试安装！.....')
         import os
         os.system('pip install -r requirements.txt')
-        
+
         # 重新导入以验证安装
         import redis
         import requests
         from rich import console, progress, layout, panel
-        
-        console.print('[green]依赖安装完成[/green]')
 
-if __name__ == "__main__":
+        print('依赖安装完成')
+
+def main(argv: Optional[List[str]] = None) -> int:
+    """
+    命令行入口
+
+    返回:
+        int: 退出码
+    """
+    args = build_parser().parse_args(argv)
+    if args.command:
+        _apply_options(args)
+        return args.func(args)
+
+    # 交互菜单
     try:
         check_dependencies()
-        show_main_menu()
+        import menu
+        menu.show_main_menu()
     except Exception as e:
-        console.print(f"[red]程序启动失败：{str(e)}[/red]")
-        sys.exit(1)
+        print(f"程序启动失败：{str(e)}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,144 @@
+"""
+Pixiv爬虫 - 交互式菜单
+"""
+import sys
+from datetime import datetime
+from typing import NoReturn
+import requests.packages.urllib3
+from rich.console import Console
+import redis.exceptions
+
+from pixiv_spider import PixivSpider
+import redis_monitor
+from config import REDIS_CONFIG, STATE_CONFIG
+
+# 禁用SSL警告
+requests.packages.urllib3.disable_warnings()
+
+console = Console()
+
+def show_main_menu() -> NoReturn:
+    """显示主菜单并处理用户选择"""
+    while True:
+        try:
+            console.print("\n=== PixivSpider ===")
+            console.print("1. 爬取每日排行榜")
+            console.print("2. 回填历史排行榜")
+            console.print("3. 分布式任务队列")
+            console.print("4. Redis数据库操作")
+            console.print("5. 退出程序")
+            
+            choice = console.input("\n请选择操作 (1-5): ")
+            
+            if choice == "1":
+                run_spider()
+            elif choice == "2":
+                run_backfill()
+            elif choice == "3":
+                run_distributed()
+            elif choice == "4":
+                run_redis_monitor()
+            elif choice == "5":
+                console.print("\n[green]再见![/green]")
+                sys.exit(0)
+            else:
+                console.print("\n[red]无效的选择，请重试[/red]")
+                
+        except KeyboardInterrupt:
+            console.print("\n\n[yellow]检测到Ctrl+C，正在安全退出...[/yellow]")
+            sys.exit(0)
+        except Exception as e:
+            console.print(f"\n[red]发生错误：{str(e)}[/red]")
+
+def select_db() -> int:
+    """
+    提示选择Redis数据库
+    
+    返回:
+        int: 数据库编号
+    """
+    while True:
+        console.print("\n[cyan]可用的Redis数据库:[/cyan]")
+        min_db, max_db = REDIS_CONFIG.db_range
+        for i in range(min_db, max_db + 1):
+            console.print(f"{i}.DB{i}")
+            
+        try:
+            db_num = int(console.input("\n请选择Redis数据库: "))
+        except ValueError:
+            console.print("[red]错误：请输入有效的数字[/red]")
+            continue
+            
+        if min_db <= db_num <= max_db:
+            return db_num
+        console.print(f"[red]错误：请输入{min_db}到{max_db}之间的数字[/red]")
+
+def run_backfill() -> None:
+    """回填历史排行榜"""
+    console.print("\n=== 回填历史排行榜 ===")
+    try:
+        start = datetime.strptime(console.input("起始日期 (YYYY-MM-DD): "), "%Y-%m-%d").date()
+        end = datetime.strptime(console.input("结束日期 (YYYY-MM-DD): "), "%Y-%m-%d").date()
+    except ValueError:
+        console.print("[red]错误：日期格式应为YYYY-MM-DD[/red]")
+        return
+    if start > end:
+        console.print("[red]错误：起始日期不能晚于结束日期[/red]")
+        return
+    modes = console.input("排行榜类型，逗号分隔 (默认daily): ").strip() or "daily"
+    modes = [mode.strip() for mode in modes.split(",") if mode.strip()]
+    
+    try:
+        spider = PixivSpider(select_db())
+        spider.run_backfill(start, end, modes)
+    except redis.exceptions.ConnectionError:
+        console.print('[red]错误：无法连接到Redis服务，请确保Redis服务正在运行[/red]')
+    except KeyboardInterrupt:
+        console.print('\n[yellow]用户中断运行，下次回填将从未完成的日期继续[/yellow]')
+
+def run_distributed() -> None:
+    """发布分布式任务或作为工作进程运行"""
+    console.print("\n=== 分布式任务队列 ===")
+    console.print("1. 发布今日排行榜")
+    console.print("2. 运行工作进程")
+    console.print("3. 返回")
+    choice = console.input("\n请选择操作 (1-3): ")
+    if choice not in ("1", "2"):
+        return
+    if STATE_CONFIG.backend != 'redis':
+        console.print('[red]错误：分布式任务队列需要Redis后端[/red]')
+        return
+        
+    try:
+        # 工作进程不使用本地去重缓存，构造时就跳过载入
+        spider = PixivSpider(select_db(), local_cache='none' if choice == "2" else None)
+        if choice == "1":
+            count = spider.publish_ranking()
+            console.print(f"[green]已发布 {count} 个作品任务[/green]")
+        else:
+            spider.run_worker()
+    except redis.exceptions.ConnectionError:
+        console.print('[red]错误：无法连接到Redis服务，请确保Redis服务正在运行[/red]')
+    except KeyboardInterrupt:
+        console.print('\n[yellow]用户中断运行，未确认的任务将由其他工作进程接管[/yellow]')
+
+def run_spider() -> None:
+    """运行Pixiv爬虫"""
+    console.print("\n=== 启动PixivSpider ===")
+    console.print("[yellow]确保已安装并启动Redis服务[/yellow]")
+    console.print("[yellow]确保已准备好有效的Pixiv Cookie[/yellow]")
+    
+    try:
+        spider = PixivSpider(select_db())
+        spider.run()
+    except redis.exceptions.ConnectionError:
+        console.print('[red]错误：无法连接到Redis服务，请确保Redis服务正在运行[/red]')
+    except KeyboardInterrupt:
+        console.print('\n[yellow]用户中断运行[/yellow]')
+    except Exception as e:
+        console.print(f'[red]发生错误：{str(e)}[/red]')
+
+def run_redis_monitor() -> None:
+    """运行Redis管理工具"""
+    console.print("\n=== 启动Redis管理工具 ===")
+    redis_monitor.show_menu()
@@ -0,0 +1,274 @@
+"""运行指标：各阶段耗时直方图和计数器，支持Prometheus文本格式与JSON导出"""
+import functools
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# 耗时直方图的桶上限(秒)
+_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# 指标说明
+_HELP = {
+    'pixiv_stage_seconds': '各阶段调用耗时(ranking/metadata/work/image/state，state为Redis或SQLite状态存储)',
+    'pixiv_http_ttfb_seconds': '建立连接到收到响应头的耗时',
+    'pixiv_transfer_seconds': '图片响应体传输耗时(不含磁盘写入)',
+    'pixiv_disk_write_seconds': '图片写入、同步和重命名耗时',
+    'pixiv_download_bytes_total': '下载的图片字节数',
+    'pixiv_retries_total': '重试次数(按原因)',
+    'pixiv_failures_total': '失败次数(按阶段和原因)',
+    'pixiv_cache_total': '缓存查询次数(按缓存和结果；dedup缓存的negative/exact_hit无需访问Redis，confirm需向Redis确认)',
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+class _Histogram:
+    """固定桶直方图"""
+    __slots__ = ('buckets', 'total', 'count', 'max')
+
+    def __init__(self):
+        self.buckets = [0] * (len(_BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.max = 0.0
+
+    def observe(self, value: float) -> None:
+        self.buckets[bisect_left(_BUCKETS, value)] += 1
+        self.total += value
+        self.count += 1
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        """按桶上限估算分位数，落在最后一个桶时返回最大值"""
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(_BUCKETS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class Metrics:
+    """
+    进程内指标注册表
+
+    未启用时所有记录方法只做一次布尔判断后返回，可以常驻在热点路径上。
+    """
+    _instance: Optional['Metrics'] = None
+
+    def __new__(cls) -> 'Metrics':
+        """确保单例"""
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        """初始化注册表"""
+        if not hasattr(self, '_initialized'):
+            self._initialized = True
+            self.enabled = False
+            self._lock = threading.Lock()
+            self._counters: Dict[str, Dict[Labels, float]] = {}
+            self._histograms: Dict[str, Dict[Labels, _Histogram]] = {}
+            self._started = time.time()
+            self._server: Optional[ThreadingHTTPServer] = None
+
+    def enable(self) -> None:
+        """启用指标记录并清空之前的数据"""
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self._started = time.time()
+            self.enabled = True
+
+    def inc(self, name: str, value: float = 1, **labels: str) -> None:
+        """
+        计数器加value
+
+        参数:
+            name: 指标名
+            value: 增量
+            **labels: 标签
+        """
+        if not self.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: str) -> None:
+        """
+        向直方图记录一个观测值
+
+        参数:
+            name: 指标名
+            value: 观测值(秒)
+            **labels: 标签
+        """
+        if not self.enabled:
+            return
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = _Histogram()
+            histogram.observe(value)
+
+    def render_prometheus(self) -> str:
+        """Prometheus文本格式(0.0.4)"""
+        def fmt(labels: Labels, *extra: Tuple[str, str]) -> str:
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ''
+            return '{' + ','.join(f'{k}="{v}"' for k, v in pairs) + '}'
+
+        lines: List[str] = []
+        with self._lock:
+            for name, series in sorted(self._counters.items()):
+                lines.append(f'# HELP {name} {_HELP.get(name, name)}')
+                lines.append(f'# TYPE {name} counter')
+                for labels, value in sorted(series.items()):
+                    lines.append(f'{name}{fmt(labels)} {value}')
+            for name, series in sorted(self._histograms.items()):
+                lines.append(f'# HELP {name} {_HELP.get(name, name)}')
+                lines.append(f'# TYPE {name} histogram')
+                for labels, histogram in sorted(series.items()):
+                    cumulative = 0
+                    for bound, count in zip(_BUCKETS, histogram.buckets):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{fmt(labels, ("le", str(bound)))} {cumulative}')
+                    lines.append(f'{name}_bucket{fmt(labels, ("le", "+Inf"))} {histogram.count}')
+                    lines.append(f'{name}_sum{fmt(labels)} {histogram.total}')
+                    lines.append(f'{name}_count{fmt(labels)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        当前指标的JSON结构
+
+        返回:
+            dict: 计数器取值，直方图的次数、总和、均值与估算分位数
+        """
+        with self._lock:
+            counters = {
+                name: [{'labels': dict(labels), 'value': value} for labels, value in sorted(series.items())]
+                for name, series in sorted(self._counters.items())
+            }
+            histograms = {
+                name: [
+                    {
+                        'labels': dict(labels),
+                        'count': h.count,
+                        'sum': round(h.total, 6),
+                        'mean': round(h.total / h.count, 6) if h.count else 0.0,
+                        'p50': h.quantile(0.5),
+                        'p99': h.quantile(0.99),
+                        'max': round(h.max, 6)
+                    }
+                    for labels, h in sorted(series.items())
+                ]
+                for name, series in sorted(self._histograms.items())
+            }
+        return {
+            'started': datetime.fromtimestamp(self._started).isoformat(timespec='seconds'),
+            'seconds': round(time.time() - self._started, 3),
+            'counters': counters,
+            'histograms': histograms
+        }
+
+    def write_summary(self, directory: str, extra: Optional[Dict[str, Any]] = None) -> str:
+        """
+        写入本次运行的JSON汇总
+
+        参数:
+            directory: 输出目录
+            extra: 附加字段(如失败作品数)
+
+        返回:
+            str: 汇总文件路径
+        """
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"run-{datetime.now():%Y%m%d-%H%M%S}.json")
+        summary = self.snapshot()
+        summary.update(extra or {})
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        return path
+
+    def serve(self, host: str, port: int) -> Tuple[str, int]:
+        """
+        在后台线程启动本地指标服务：/metrics为Prometheus格式，/metrics.json为JSON
+
+        参数:
+            host: 监听地址
+            port: 监听端口
+
+        返回:
+            tuple: 实际监听的(地址, 端口)
+        """
+        if self._server is None:
+            metrics = self
+
+            class Handler(BaseHTTPRequestHandler):
+                def log_message(self, format: str, *args: Any) -> None:
+                    pass
+
+                def do_GET(self) -> None:
+                    if self.path == '/metrics':
+                        body = metrics.render_prometheus().encode()
+                        content_type = 'text/plain; version=0.0.4; charset=utf-8'
+                    elif self.path == '/metrics.json':
+                        body = json.dumps(metrics.snapshot(), ensure_ascii=False).encode()
+                        content_type = 'application/json'
+                    else:
+                        self.send_error(404)
+                        return
+                    self.send_response(200)
+                    self.send_header('Content-Type', content_type)
+                    self.send_header('Content-Length', str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+
+            self._server = ThreadingHTTPServer((host, port), Handler)
+            self._server.daemon_threads = True
+            threading.Thread(target=self._server.serve_forever, name="metrics", daemon=True).start()
+        return self._server.server_address[:2]
+
+
+def timed(stage: str) -> Callable[[Callable], Callable]:
+    """
+    记录被装饰函数的耗时(pixiv_stage_seconds)，抛出异常时按异常类型计入失败次数
+
+    参数:
+        stage: 阶段名，操作名取函数名
+    """
+    metrics = Metrics()
+
+    def decorator(func: Callable) -> Callable:
+        op = func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not metrics.enabled:
+                return func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            except Exception as e:
+                metrics.inc('pixiv_failures_total', stage=stage, cause=type(e).__name__)
+                raise
+            finally:
+                metrics.observe('pixiv_stage_seconds', time.perf_counter() - start, stage=stage, op=op)
+
+        return wrapper
+
+    return decorator
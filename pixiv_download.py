@@ -1,12 +1,118 @@
 """Pixiv下载组件"""
+import hashlib
+import json
 import os
 import re
-from typing import Optional, Union
+import threading
+import time
+from typing import List, Optional, Tuple
 import requests
 from rich.progress import Progress
 
-from config import PIXIV_CONFIG
-from redis_client import RedisClient
+from config import DOWNLOAD_CONFIG, PIXIV_CONFIG
+from http_client import HttpClient, RETRYABLE_ERRORS
+from metrics import Metrics, timed
+from postprocess import get_postprocessor
+from rate_control import get_transfer_budget
+from state_backend import get_state_client
+from storage import file_sha256, get_store
+
+# 图片下载协议
+IMAGE_TRANSPORTS = ('http1', 'http2')
+
+class IncompleteDownload(Exception):
+    """图片传输不完整"""
+
+class _BudgetExhausted(Exception):
+    """传输预算不足，需要先释放响应再等待size字节的预算"""
+
+    def __init__(self, size: int):
+        super().__init__(size)
+        self.size = size
+
+def _fsync_dir(directory: str) -> None:
+    """同步目录项，确保重命名持久化(不支持的平台忽略)"""
+    try:
+        fd = os.open(directory or '.', os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def _remove_quietly(path: str) -> None:
+    """删除文件，不存在时忽略"""
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+def _discard_partial(part_path: str, marker_path: str) -> None:
+    """放弃已下载的部分文件及其续传标记"""
+    _remove_quietly(part_path)
+    _remove_quietly(marker_path)
+
+def _load_resume_marker(marker_path: str, part_path: str, url: str) -> Optional[dict]:
+    """
+    读取续传标记
+    
+    返回:
+        dict: 含已下载字节数(offset)的续传信息；无法续传时返回None
+    """
+    try:
+        with open(marker_path, encoding='utf-8') as fp:
+            marker = json.load(fp)
+        offset = os.path.getsize(part_path)
+    except (OSError, ValueError):
+        return None
+    if marker.get('url') != url or not marker.get('length') or not 0 < offset < marker['length']:
+        return None
+    marker['offset'] = offset
+    return marker
+
+def _write_resume_marker(marker_path: str, url: str, response: requests.Response, length: Optional[int]) -> bool:
+    """
+    服务器支持Range且提供校验值时写入续传标记
+    
+    返回:
+        bool: 是否可续传
+    """
+    etag = response.headers.get('ETag')
+    last_modified = response.headers.get('Last-Modified')
+    if (
+        response.headers.get('Accept-Ranges', '').lower() != 'bytes'
+        or not length
+        or not (etag or last_modified)
+    ):
+        _remove_quietly(marker_path)
+        return False
+    with open(marker_path, 'w', encoding='utf-8') as fp:
+        json.dump({
+            'url': url,
+            'etag': etag,
+            'last_modified': last_modified,
+            'length': length
+        }, fp)
+    return True
+
+def _range_matches(response: requests.Response, marker: dict) -> bool:
+    """检查206响应的范围和校验值是否与续传标记一致"""
+    match = re.match(r'bytes (\d+)-(\d+)/(\d+)', response.headers.get('Content-Range', ''))
+    if not match:
+        return False
+    start, _, total = map(int, match.groups())
+    if start != marker['offset'] or total != marker['length']:
+        return False
+    etag = response.headers.get('ETag')
+    if etag and marker.get('etag') and etag != marker['etag']:
+        return False
+    last_modified = response.headers.get('Last-Modified')
+    if last_modified and marker.get('last_modified') and last_modified != marker['last_modified']:
+        return False
+    return True
 
 class PixivDownloader:
     """处理Pixiv图片下载"""
@@ -21,14 +127,38 @@ class PixivDownloader:
         """
         self.headers = headers
         self.progress = progress
-        self.redis = RedisClient()
+        self.redis = get_state_client()
+        self.http = HttpClient()
+        self.metrics = Metrics()
+        self.store = get_store()
+        self.budget = get_transfer_budget()
+        self.postprocess = get_postprocessor(self.redis)
+        if PIXIV_CONFIG.image_transport not in IMAGE_TRANSPORTS:
+            raise ValueError(f"未知的图片下载协议: {PIXIV_CONFIG.image_transport}")
+        self.http2 = PIXIV_CONFIG.image_transport == 'http2'
+        if self.http2:
+            self.http.require_http2()
+        self._failure = threading.local()
+
+    def _fail(self, stage: str, cause: str) -> None:
+        """记录失败原因(计入指标，并留给本线程的调用方读取)"""
+        self.metrics.inc('pixiv_failures_total', stage=stage, cause=cause)
+        self._failure.cause = f"{stage}:{cause}"
 
-    def download_image(self, url: str) -> bool:
+    def last_failure(self) -> str:
+        """读取并清除本线程最近一次失败的原因"""
+        cause = getattr(self._failure, 'cause', None) or 'unknown'
+        self._failure.cause = None
+        return cause
+
+    @timed('image')
+    def download_image(self, url: str, check_state: bool = True) -> bool:
         """
         下载单张图片
         
         参数:
             url: 图片URL
+            check_state: 是否先查询Redis确认该页未下载(调用方已批量查询时传False)
             
         返回:
             bool: 成功返回True，失败返回False
@@ -36,115 +166,233 @@ class PixivDownloader:
         # 从URL提取图片信息
         match = re.search(r'/(\d+)_p(\d+)\.([a-z]+)$', url)
         if not match:
+            self._fail('image', 'bad_url')
             return False
             
         illust_id, page_num, extension = match.groups()
         file_name = f"{illust_id}_p{page_num}.{extension}"
         
         # 检查是否已下载
-        if self.redis.is_image_downloaded(illust_id, page_num):
+        if check_state and self.redis.is_image_downloaded(illust_id, page_num):
             return True
             
-        # 确保下载目录存在
-        if not os.path.isdir('./img'):
-            os.makedirs('./img')
+        # 按目录布局确定存放位置(按作者分片时需要作者ID)
+        user_id = self.redis.get_user_id(illust_id) if self.store.layout == 'user' else None
+        relative = self.store.relative_path(file_name, url, user_id)
+        
+        # 连接与状态码重试由共享传输层处理，这里只重试传输中断
+        try:
+            self.store.ensure_dir(relative)
+            result = self.http.call_with_retries(
+                self._fetch_to_file,
+                url,
+                self.store.path(relative),
+                retry_on=(IncompleteDownload,)
+            )
+        except (requests.RequestException, IncompleteDownload, OSError) as e:
+            self._fail('image', type(e).__name__)
+            return False
+        if result is None:
+            return False
+            
+        # 文件已完整落盘后才写入清单和更新Redis记录
+        size, sha256 = result
+        relative, is_new = self.store.store_content(relative, sha256)
+        self.store.record(illust_id, int(page_num), relative, size, sha256)
+        self.redis.mark_image_downloaded(illust_id, page_num, size, size if is_new else 0)
+        if self.postprocess:
+            self.postprocess.submit(illust_id, int(page_num), self.store.path(relative), relative)
+        return True
+
+    def _fetch_to_file(self, url: str, path: str) -> Optional[Tuple[int, str]]:
+        """
+        下载到目标文件，传输预算不足时不占用连接等待
+        
+        预算不足时响应已关闭、主机并发槽位已释放，在这里阻塞预留所需字节后
+        重新请求，重新请求时使用已预留的预算。
+        
+        参数:
+            url: 图片URL
+            path: 目标文件路径
+            
+        返回:
+            tuple: (文件大小, SHA-256)，服务器返回错误状态码时返回None
+            
+        异常:
+            IncompleteDownload: 传输中断、长度不一致或续传校验失败
+        """
+        held = None
+        try:
+            while True:
+                try:
+                    return self._stream_to_file(url, path, held)
+                except _BudgetExhausted as e:
+                    if held is not None:
+                        self.budget.release(held)
+                        held = None
+                    tick = time.perf_counter()
+                    self.budget.acquire(e.size)
+                    held = e.size
+                    self.metrics.observe('pixiv_budget_wait_seconds', time.perf_counter() - tick)
+        finally:
+            if held is not None:
+                self.budget.release(held)
+
+    def _stream_to_file(self, url: str, path: str, held: Optional[int] = None) -> Optional[Tuple[int, str]]:
+        """
+        流式下载到.part文件，校验长度后原子重命名为目标文件
+        
+        服务器支持Range且提供校验值时，中断后保留.part文件和续传标记，
+        下次从已下载位置续传；校验值或长度不一致时放弃已下载部分重新下载。
+        写文件前按剩余长度占用全局传输预算，预算不足时不等待，抛出
+        _BudgetExhausted并在退出with块时关闭响应。
+        
+        参数:
+            url: 图片URL
+            path: 目标文件路径
+            held: 调用方已预留的字节数，足够时不再占用预算
+            
+        返回:
+            tuple: (文件大小, SHA-256)，服务器返回错误状态码时返回None
+            
+        异常:
+            IncompleteDownload: 传输中断、长度不一致或续传校验失败
+            _BudgetExhausted: 预算不足
+        """
+        part_path = f'{path}.part'
+        marker_path = f'{part_path}.json'
+        marker = _load_resume_marker(marker_path, part_path, url)
+        
+        headers = self.headers
+        if marker:
+            headers = {**self.headers, 'Range': f"bytes={marker['offset']}-"}
+            validator = marker.get('etag') or marker.get('last_modified')
+            if validator:
+                headers['If-Range'] = validator
+                
+        with self.http.stream(url, headers=headers, http2=self.http2) as response:
+            if response.status_code == 206 and marker and _range_matches(response, marker):
+                offset, expected, mode = marker['offset'], marker['length'], 'ab'
+                resumable = True
+                digest = file_sha256(part_path, offset)
+            elif response.status_code == 200:
+                # 完整响应(包括If-Range校验失败时服务器返回的新内容)
+                offset, mode = 0, 'wb'
+                expected = response.headers.get('Content-Length')
+                if response.headers.get('Content-Encoding'):
+                    expected = None  # 压缩传输时解码后长度与头部不一致
+                expected = int(expected) if expected is not None else None
+                resumable = _write_resume_marker(marker_path, url, response, expected)
+                digest = hashlib.sha256()
+            elif response.status_code in (206, 416):
+                _discard_partial(part_path, marker_path)
+                raise IncompleteDownload(f'{url} 续传校验失败，改为完整下载')
+            else:
+                self._fail('image', f'http_{response.status_code}')
+                return None
+                
+            needed = expected - offset if expected is not None else DOWNLOAD_CONFIG.unknown_size_bytes
+            reserved = None
+            if held is None or needed > held:
+                if not self.budget.try_acquire(needed):
+                    raise _BudgetExhausted(needed)
+                reserved = needed
             
-        # 下载重试机制
-        for attempt in range(3):
+            written = offset
+            write_seconds = 0.0
+            started = time.perf_counter()
             try:
-                response = requests.get(
-                    url,
-                    headers=self.headers,
-                    timeout=15,
-                    verify=False
-                )
-                if response.status_code == 200:
-                    # 保存图片
-                    with open(f'./img/{file_name}', 'wb') as fp:
-                        fp.write(response.content)
-                    
-                    # 更新Redis记录
-                    self.redis.mark_image_downloaded(illust_id, page_num)
-                    
-                    # 更新总页数
-                    total_pages = self.redis.get_total_pages(illust_id)
-                    if not total_pages:
-                        self.redis.set_total_pages(illust_id, int(page_num) + 1)
-                    elif int(page_num) + 1 == total_pages:
-                        # 检查作品是否完成
-                        all_downloaded = all(
-                            self.redis.is_image_downloaded(illust_id, i)
-                            for i in range(total_pages)
-                        )
-                        if all_downloaded:
-                            self.redis.mark_work_complete(illust_id)
-                    
-                    return True
-                    
-            except requests.RequestException:
-                if attempt == 2:  # 最后一次尝试失败
-                    return False
-                continue
+                with open(part_path, mode) as fp:
+                    try:
+                        for chunk in response.iter_content(DOWNLOAD_CONFIG.chunk_size):
+                            tick = time.perf_counter()
+                            fp.write(chunk)
+                            write_seconds += time.perf_counter() - tick
+                            digest.update(chunk)
+                            written += len(chunk)
+                    except RETRYABLE_ERRORS as e:
+                        raise IncompleteDownload(f'{url} 传输中断: {e}') from e
+                        
+                    if expected is not None and written != expected:
+                        if written > expected:
+                            resumable = False
+                        raise IncompleteDownload(f'{url} 长度不符: {written}/{expected}')
+                        
+                    transfer_seconds = time.perf_counter() - started - write_seconds
+                    tick = time.perf_counter()
+                    if DOWNLOAD_CONFIG.fsync_policy in ('file', 'full'):
+                        fp.flush()
+                        os.fsync(fp.fileno())
+                        
+                os.replace(part_path, path)
+                write_seconds += time.perf_counter() - tick
+            except BaseException:
+                # 可续传时保留已下载部分，否则清理
+                if not resumable:
+                    _discard_partial(part_path, marker_path)
+                raise
+            finally:
+                if reserved is not None:
+                    self.budget.release(reserved)
                 
-        return False
+        _remove_quietly(marker_path)
+        if DOWNLOAD_CONFIG.fsync_policy == 'full':
+            _fsync_dir(os.path.dirname(path))
+        self.metrics.inc('pixiv_download_bytes_total', written - offset)
+        self.metrics.observe('pixiv_transfer_seconds', transfer_seconds)
+        self.metrics.observe('pixiv_disk_write_seconds', write_seconds)
+        return written, digest.hexdigest()
 
-    def download_work(self, work_id: str) -> bool:
+    def complete_work(self, work_id: str, total_pages: int) -> None:
         """
-        下载作品的所有图片
+        记录作品总页数并标记作品完成
+        
+        参数:
+            work_id: Pixiv作品ID
+            total_pages: 作品总页数
+        """
+        self.redis.complete_work(work_id, total_pages)
+
+    @timed('metadata')
+    def get_image_urls(self, work_id: str) -> Optional[List[Optional[str]]]:
+        """
+        获取作品所有页的原图URL，优先使用Redis中的缓存
         
         参数:
             work_id: Pixiv作品ID
             
         返回:
-            bool: 全部成功返回True，否则False
+            list: 每页的原图URL，缺少原图地址的页为None；请求失败返回None
         """
-        # 跳过已完成的作品
-        if self.redis.is_work_complete(work_id):
-            return True
+        cached = self.redis.get_cached_urls(work_id)
+        if cached:
+            self.metrics.inc('pixiv_cache_total', cache='meta', result='hit')
+            return cached
+        self.metrics.inc('pixiv_cache_total', cache='meta', result='miss')
             
         try:
-            # 获取图片URL列表
-            response = requests.get(
+            response = self.http.get(
                 PIXIV_CONFIG.ajax_url.format(work_id),
-                headers=self.headers,
-                verify=False
+                headers=self.headers
             )
             data = response.json()
+        except (requests.RequestException, ValueError) as e:
+            self._fail('metadata', type(e).__name__)
+            return None
             
-            if data.get('error'):
-                return False
-                
-            images = data.get('body', [])
-            if not images:
-                return False
-                
-            # 下载每张图片
-            if len(images) > 1:
-                # 多图作品
-                subtask_id = self.progress.add_task(
-                    f"[yellow]PID:{work_id}",
-                    total=len(images)
-                )
-                
-                success = True
-                for image in images:
-                    if 'urls' not in image or 'original' not in image['urls']:
-                        success = False
-                        continue
-                        
-                    if not self.download_image(image['urls']['original']):
-                        success = False
-                        
-                    self.progress.update(subtask_id, advance=1)
-                    
-                self.progress.remove_task(subtask_id)
-                return success
-                
-            else:
-                # 单图作品
-                if 'urls' not in images[0] or 'original' not in images[0]['urls']:
-                    return False
-                return self.download_image(images[0]['urls']['original'])
-                
-        except (requests.RequestException, KeyError, ValueError):
-            return False
+        if data.get('error'):
+            self._fail('metadata', 'api_error')
+            return None
+            
+        images = data.get('body', [])
+        if not images:
+            self._fail('metadata', 'no_images')
+            return None
+            
+        urls = [
+            image.get('urls', {}).get('original')
+            for image in images
+        ]
+        # 缓存元数据，同时提前记录总页数
+        self.redis.cache_urls(work_id, urls, PIXIV_CONFIG.meta_cache_ttl)
+        return urls
@@ -0,0 +1,396 @@
+"""分阶段并发下载流水线"""
+import collections
+import heapq
+import itertools
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+from rich.progress import Progress
+
+from config import PIPELINE_CONFIG, PipelineConfig
+from metrics import Metrics
+from pixiv_download import PixivDownloader
+
+# 队列结束标记
+_STOP = object()
+
+# 图片页调度策略
+SCHEDULE_POLICIES = ('ranking', 'smallest', 'fair')
+
+
+@dataclass
+class WorkState:
+    """单个作品在流水线中的下载状态"""
+    work_id: str
+    total: int
+    remaining: int
+    success: bool = True
+    cause: Optional[str] = None
+    task_id: Optional[int] = None
+    order: int = 0
+    started: float = field(default_factory=time.perf_counter)
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+class PageScheduler:
+    """
+    图片页调度器，按调度策略决定出队顺序
+
+    元数据阶段以作品为单位放入(作品状态, [(作品内待下载页序号, URL)])，
+    作品的所有页一次进入调度器，各作品的页分别排队，出队时按策略选择作品：
+        ranking:  按作品进入元数据阶段的顺序，逐作品下载
+        smallest: 页数少的作品优先，单图作品不会排在大型漫画作品之后
+        fair:     各作品轮流，所有作品的第n页都先于任一作品的第n+1页
+    同一优先级按放入顺序出队。作品只在全部页都能放下时才被接收(调度器
+    为空时例外)，大型作品等待空位不会挡住之后放入的小作品，单图作品
+    在待下载页数低于上限后即可进入调度。
+    出队元素为(作品状态, 作品内待下载页序号, URL)，所有页出队后才返回结束标记。
+    接口与queue.Queue的put/get一致，流水线的_put/_get可以直接使用。
+    """
+
+    def __init__(self, policy: str, maxsize: int = 0):
+        """
+        初始化调度器
+
+        参数:
+            policy: 调度策略
+            maxsize: 待下载页数上限，0为不限；页数超过上限的作品在调度器为空时接收
+        """
+        if policy not in SCHEDULE_POLICIES:
+            raise ValueError(f"未知的调度策略: {policy}")
+        self.policy = policy
+        self.maxsize = maxsize
+        self._works: List[tuple] = []
+        self._pending = 0
+        self._stops = 0
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def _priority(self, state: WorkState, index: int) -> tuple:
+        """作品下一页的优先级"""
+        if self.policy == 'smallest':
+            return (state.total, state.order)
+        if self.policy == 'fair':
+            return (index, state.order)
+        return (state.order,)
+
+    def _push(self, state: WorkState, pages: Deque[Tuple[int, str]]) -> None:
+        heapq.heappush(self._works, (self._priority(state, pages[0][0]), next(self._seq), state, pages))
+
+    def qsize(self) -> int:
+        """待下载页数"""
+        with self._cond:
+            return self._pending
+
+    def put(self, item: Any, timeout: Optional[float] = None) -> None:
+        """
+        放入一个作品的所有待下载页或结束标记
+
+        异常:
+            queue.Full: 超时仍没有足够的空位
+        """
+        with self._cond:
+            if item is _STOP:
+                self._stops += 1
+                self._cond.notify_all()
+                return
+            state, pages = item
+            if not pages:
+                return
+
+            def fits() -> bool:
+                return not self._pending or self._pending + len(pages) <= self.maxsize
+
+            if self.maxsize > 0 and not self._cond.wait_for(fits, timeout):
+                raise queue.Full
+            self._push(state, collections.deque(pages))
+            self._pending += len(pages)
+            self._cond.notify_all()
+
+    def get(self, timeout: Optional[float] = None) -> Any:
+        """
+        按策略取出下一页，所有页出队后返回结束标记
+
+        异常:
+            queue.Empty: 超时仍没有可取出的页
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._works or self._stops, timeout):
+                raise queue.Empty
+            if not self._works:
+                self._stops -= 1
+                return _STOP
+            _, _, state, pages = heapq.heappop(self._works)
+            index, url = pages.popleft()
+            if pages:
+                self._push(state, pages)
+            self._pending -= 1
+            self._cond.notify_all()
+            return state, index, url
+
+
+class DownloadPipeline:
+    """
+    三阶段下载流水线：排行榜页获取 -> 作品元数据获取 -> 图片下载
+
+    每个阶段有独立的线程池和有界队列，作品拆分为单页任务由共享的下载线程池
+    处理，单张慢图只占用一个下载线程，不会阻塞其他作品。页任务的出队顺序
+    由config.schedule_policy决定(见PageScheduler)。全局传输预算耗尽时，
+    排行榜和元数据阶段暂停获取新任务，直到在途下载归还预算。
+    """
+
+    def __init__(
+        self,
+        downloader: PixivDownloader,
+        progress: Progress,
+        main_task_id: int,
+        fetch_ranking: Callable[[Any], Dict[str, bool]],
+        log: Callable[[str], None],
+        config: PipelineConfig = PIPELINE_CONFIG,
+        on_work_done: Optional[Callable[[str, bool, Optional[str]], None]] = None
+    ):
+        """
+        初始化流水线
+
+        参数:
+            downloader: 图片下载器
+            progress: Rich进度条实例
+            main_task_id: 总体进度任务ID
+            fetch_ranking: 获取单个排行榜页并返回{作品ID: 是否已完成}的函数
+            log: 日志输出函数
+            config: 流水线配置
+            on_work_done: 作品处理结束时的回调，参数为(作品ID, 是否成功, 失败原因)
+        """
+        self.downloader = downloader
+        self.progress = progress
+        self.main_task_id = main_task_id
+        self.fetch_ranking = fetch_ranking
+        self.log = log
+        self.config = config
+        self.on_work_done = on_work_done
+        self.metrics = Metrics()
+
+        self.page_queue: queue.Queue = queue.Queue()
+        self.work_queue: queue.Queue = queue.Queue(maxsize=config.work_queue_size)
+        self.image_queue = PageScheduler(config.schedule_policy, maxsize=config.image_queue_size)
+        self._order = itertools.count()
+
+        self.failed_works: List[str] = []
+        self.failure_causes: Dict[str, str] = {}
+        self._failed_lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def _put(self, q: Any, item: Any) -> None:
+        """向有界队列放入元素，中断时放弃等待"""
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.2)
+                return
+            except queue.Full:
+                continue
+
+    def _get(self, q: Any) -> Any:
+        """从队列取出元素，中断时返回结束标记"""
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.2)
+            except queue.Empty:
+                continue
+        return _STOP
+
+    def _wait_budget(self) -> None:
+        """传输预算耗尽时等待，中断时放弃等待"""
+        while not self._stop.is_set() and not self.downloader.budget.wait_available(timeout=0.2):
+            continue
+
+    def _start_workers(self, count: int, target: Callable[[], None], name: str) -> List[threading.Thread]:
+        """启动一个阶段的工作线程"""
+        threads = []
+        for i in range(max(1, count)):
+            thread = threading.Thread(target=target, name=f"{name}-{i}", daemon=True)
+            thread.start()
+            threads.append(thread)
+        return threads
+
+    def _join(self, threads: List[threading.Thread]) -> None:
+        """等待线程结束，保持主线程可响应Ctrl+C"""
+        for thread in threads:
+            while thread.is_alive():
+                thread.join(timeout=0.2)
+
+    def _record_failure(self, work_id: str, cause: Optional[str]) -> None:
+        """记录失败作品及原因"""
+        with self._failed_lock:
+            self.failed_works.append(work_id)
+            self.failure_causes[work_id] = cause or 'unknown'
+
+    def _finish_work(self, work_id: str, success: bool, cause: Optional[str] = None) -> None:
+        """作品处理结束，更新总体进度"""
+        if not success:
+            self._record_failure(work_id, cause)
+        if self.on_work_done:
+            try:
+                self.on_work_done(work_id, success, None if success else cause or 'unknown')
+            except Exception as e:
+                self.log(f'[red]作品 {work_id} 的完成回调出错：{e!r}[/red]')
+        self.progress.update(
+            self.main_task_id,
+            advance=1,
+            speed=f"{self.downloader.http.describe_limits()} {self.downloader.budget.describe()}"
+        )
+
+    def _ranking_worker(self) -> None:
+        """排行榜阶段：获取排行榜页并将未完成的作品送入作品队列"""
+        while True:
+            page = self._get(self.page_queue)
+            if page is _STOP:
+                break
+            self._wait_budget()
+            try:
+                works = self.fetch_ranking(page)
+            except Exception as e:
+                # 网络、解析和状态存储错误都只放弃这一页，不能让线程退出
+                self.log(f'[red]获取排行榜第{page}页时发生错误：{e!r}[/red]')
+                continue
+            for work_id, complete in works.items():
+                if complete:
+                    self._finish_work(work_id, True)
+                else:
+                    self._put(self.work_queue, work_id)
+
+    def _metadata_worker(self) -> None:
+        """元数据阶段：获取作品的原图URL并拆分为单图下载任务"""
+        while True:
+            work_id = self._get(self.work_queue)
+            if work_id is _STOP:
+                break
+
+            self._wait_budget()
+            try:
+                urls = self.downloader.get_image_urls(work_id)
+                if not urls:
+                    self._finish_work(work_id, False, self.downloader.last_failure())
+                    continue
+
+                # 一次查询所有页的状态，已下载的页不再进入下载队列
+                downloaded = self.downloader.redis.get_downloaded_pages(work_id, len(urls))
+                pending = len(urls) - len(downloaded)
+                if pending == 0:
+                    self.downloader.complete_work(work_id, len(urls))
+                    self._finish_work(work_id, True)
+                    continue
+            except Exception as e:
+                # 线程退出会让作品永远无法结束，流水线停在关闭阶段
+                self.log(f'[red]获取作品 {work_id} 的元数据时发生错误：{e!r}[/red]')
+                self._finish_work(work_id, False, f'metadata:{type(e).__name__}')
+                continue
+
+            state = WorkState(work_id, total=len(urls), remaining=pending, order=next(self._order))
+
+            if pending > 1:
+                state.task_id = self.progress.add_task(
+                    f"[yellow]PID:{work_id}",
+                    total=pending,
+                    speed=""
+                )
+            pages = [url for page, url in enumerate(urls) if page not in downloaded]
+            # 作品的所有页一起进入调度器，由调度策略决定与其他作品的先后
+            self._put(self.image_queue, (state, list(enumerate(pages))))
+
+    def _download_worker(self) -> None:
+        """下载阶段：下载单张图片并更新所属作品的状态"""
+        while True:
+            item = self._get(self.image_queue)
+            if item is _STOP:
+                break
+            state, _, url = item
+            cause = None
+            try:
+                if not url:
+                    success, cause = False, 'image:no_original_url'
+                elif not self.downloader.download_image(url, check_state=False):
+                    success, cause = False, self.downloader.last_failure()
+                else:
+                    success = True
+            except Exception as e:
+                self.log(f'[red]下载 {url} 时发生错误：{e!r}[/red]')
+                success, cause = False, f'image:{type(e).__name__}'
+            self._page_done(state, success, cause)
+
+    def _page_done(self, state: WorkState, success: bool, cause: Optional[str] = None) -> None:
+        """单页下载结束，最后一页结束时完成整个作品"""
+        with state.lock:
+            state.remaining -= 1
+            state.success = state.success and success
+            state.cause = state.cause or cause
+            finished = state.remaining == 0
+
+        if state.task_id is not None:
+            self.progress.update(state.task_id, advance=1)
+
+        if not finished:
+            return
+
+        if state.task_id is not None:
+            self.progress.remove_task(state.task_id)
+        if state.success:
+            try:
+                self.downloader.complete_work(state.work_id, state.total)
+            except Exception as e:
+                self.log(f'[red]记录作品 {state.work_id} 完成时发生错误：{e!r}[/red]')
+                state.success, state.cause = False, f'state:{type(e).__name__}'
+        self.metrics.observe(
+            'pixiv_stage_seconds',
+            time.perf_counter() - state.started,
+            stage='work',
+            op='pipeline'
+        )
+        self._finish_work(state.work_id, state.success, state.cause)
+
+    def run(self, pages: Iterable[Any] = (), works: Iterable[str] = ()) -> List[str]:
+        """
+        运行流水线直到所有任务处理完毕
+
+        参数:
+            pages: 排行榜页任务，交给fetch_ranking处理
+            works: 已确认未完成的作品ID，直接进入元数据阶段
+
+        返回:
+            list: 失败的作品ID列表
+        """
+        cfg = self.config
+        postprocess = self.downloader.postprocess
+        dropped = postprocess.dropped if postprocess else 0
+        ranking_threads = self._start_workers(cfg.ranking_workers, self._ranking_worker, "ranking")
+        metadata_threads = self._start_workers(cfg.metadata_workers, self._metadata_worker, "metadata")
+        download_threads = self._start_workers(cfg.download_workers, self._download_worker, "download")
+
+        try:
+            for page in pages:
+                self.page_queue.put(page)
+            for work_id in works:
+                self._put(self.work_queue, work_id)
+
+            # 逐阶段关闭：上游全部结束后再通知下游
+            stages = [
+                (ranking_threads, self.page_queue),
+                (metadata_threads, self.work_queue),
+                (download_threads, self.image_queue),
+            ]
+            for threads, q in stages:
+                for _ in threads:
+                    self._put(q, _STOP)
+                self._join(threads)
+            # 后处理结果写入状态后再返回
+            if postprocess:
+                postprocess.wait()
+                if postprocess.dropped > dropped:
+                    self.log(f'[yellow]后处理队列已满，跳过了 {postprocess.dropped - dropped} 张图片[/yellow]')
+        except KeyboardInterrupt:
+            self._stop.set()
+            raise
+
+        return self.failed_works
@@ -2,7 +2,11 @@
 Pixiv爬虫 - 每日排行榜下载
 环境需求：Python3.8+ / Redis 
 """
-from typing import Generator, List, Dict, Any
+import sys
+from collections import deque
+from contextlib import contextmanager
+from datetime import date
+from typing import List, Dict, Any, Iterator, Optional
 import requests
 from rich.console import Console
 from rich.progress import (
@@ -17,36 +21,83 @@ from rich.layout import Layout
 from rich.panel import Panel
 from rich.console import Group
 
-from config import PIXIV_CONFIG
-from redis_client import RedisClient
+from config import METRICS_CONFIG, PIXIV_CONFIG
+from event_sink import EventSink
+from http_client import HttpClient
+from metrics import Metrics, timed
+from state_backend import get_state_client
 from pixiv_download import PixivDownloader
+from pixiv_pipeline import DownloadPipeline
+from backfill import RankingBackfill
+from work_queue import QueueConsumer, WorkQueue
 
 requests.packages.urllib3.disable_warnings()
 
+class _LogPanel:
+    """日志面板，只在界面刷新时渲染最近的日志"""
+    
+    def __init__(self, messages: deque):
+        self.messages = messages
+        
+    def __rich__(self) -> Panel:
+        return Panel(
+            Group(*list(self.messages)),
+            title="PixivSpider",
+            title_align="left",
+            border_style="cyan",
+            padding=(0, 1)
+        )
+
 class PixivSpider:
     """Pixiv每日排行榜爬虫"""
     
     TOTAL_IMAGES = 500  # 每日排行榜总图片数
     
-    def __init__(self, db: int = 0):
+    def __init__(self, db: int = 0, headless: bool = False, local_cache: Optional[str] = None):
         """
         初始化爬虫
         
         参数:
             db: Redis数据库编号(0-5)
+            headless: 无界面模式，以JSON-lines事件代替Rich界面
+            local_cache: 进程内去重缓存类型(none / set / bloom)，默认取REDIS_CONFIG；
+                         作为分布式工作进程运行时应传入none，避免载入用不到的缓存
         """
-        # 设置Redis
-        self.redis = RedisClient()
+        # 设置状态存储(Redis或SQLite)
+        self.redis = get_state_client()
         if not self.redis.select_db(db):
             raise ValueError(f"无效的Redis数据库编号: {db}")
             
+        # 共享HTTP传输层
+        self.http = HttpClient()
+            
         # 设置界面组件
+        self.headless = headless
         self.console = Console()
-        self._setup_ui()
+        if headless:
+            self._setup_events()
+        else:
+            self._setup_ui()
+        
+        # 按配置启用运行指标
+        self.metrics = Metrics()
+        if METRICS_CONFIG.enabled:
+            self.metrics.enable()
+            if METRICS_CONFIG.port:
+                host, port = self.metrics.serve(METRICS_CONFIG.host, METRICS_CONFIG.port)
+                self._update_log(f"[cyan]指标服务: http://{host}:{port}/metrics[/cyan]")
+        
+        # 按配置载入进程内去重缓存
+        report = self.redis.enable_local_cache(local_cache)
+        if report:
+            self._update_log(
+                f"[cyan]去重缓存已载入 {report['count']} 个作品，"
+                f"耗时 {report['seconds']:.2f}s，内存 {report['memory'] / 2**20:.1f} MiB[/cyan]"
+            )
         
         # 初始化状态
         self.headers = None
-        self.current_ranking_data = []
+        self.mode = 'daily'
         self.failed_works = []
         
     def _setup_ui(self) -> None:
@@ -68,100 +119,310 @@ class PixivSpider:
             expand=True
         )
         
-        # 设置日志面板
-        self.log_messages = []
+        # 设置日志面板(deque追加是线程安全的，面板在刷新时才渲染)
+        self.log_messages = deque(maxlen=18)
+        self.layout["PixivSpider"].update(_LogPanel(self.log_messages))
         self.main_task_id = self.progress.add_task(
             "[cyan]总体进度",
             total=self.TOTAL_IMAGES,
             speed=""
         )
         
-    def _update_log(self, message: str) -> None:
-        """更新日志显示"""
-        self.log_messages.append(message)
-        if len(self.log_messages) > 18:
-            self.log_messages.pop(0)
-        log_group = Group(*self.log_messages)
-        self.layout["PixivSpider"].update(
-            Panel(
-                log_group,
-                title="PixivSpider",
-                title_align="left",
-                border_style="cyan",
-                padding=(0, 1)
-            )
+    def _setup_events(self) -> None:
+        """无界面模式：事件输出同时充当进度条"""
+        self.events = EventSink()
+        self.progress = self.events
+        self.main_task_id = self.progress.add_task(
+            "总体进度",
+            total=self.TOTAL_IMAGES,
+            speed=""
         )
         
+    def _update_log(self, message: str) -> None:
+        """更新日志显示(线程安全)"""
+        if self.headless:
+            self.events.log(message)
+        else:
+            self.log_messages.append(message)
+            
+    @contextmanager
+    def _display(self) -> Iterator[None]:
+        """运行期间的显示：Rich实时界面，无界面模式下结束时写出剩余事件"""
+        if self.headless:
+            try:
+                yield
+            finally:
+                self.events.flush()
+            return
+        with Live(self.layout, console=self.console, refresh_per_second=10):
+            self.layout["progress"].update(self.progress)
+            yield
+        
     def _setup_session(self) -> None:
         """设置请求会话"""
         cookie = self.redis.get_cookie()
-        if not cookie:
+        if not cookie and (self.headless or not sys.stdin.isatty()):
+            cookie = ''  # 无法输入时使用匿名模式
+        elif not cookie:
             cookie = input('请输入一个cookie：')
             self.redis.set_cookie(cookie)
             
         self.headers = PIXIV_CONFIG.headers.copy()
         self.headers['cookie'] = cookie
         
-    def get_ranking_page(self, page: int) -> None:
+    @timed('ranking')
+    def get_ranking_data(
+        self,
+        page: int,
+        mode: str = 'daily',
+        date: Optional[str] = None
+    ) -> Dict[str, Any]:
         """
-        获取排行榜单页数据
+        获取排行榜单页的原始响应
         
         参数:
             page: 页码(1-10)
+            mode: 排行榜类型(daily/weekly/monthly等)
+            date: 排行榜日期(YYYYMMDD)，默认为最新
+            
+        返回:
+            dict: 接口返回的JSON，正常时作品数据在contents中
         """
         params = {
-            'mode': 'daily',
+            'mode': mode,
             'content': 'illust',
             'p': str(page),
             'format': 'json'
         }
+        if date:
+            params['date'] = date
         
-        response = requests.get(
+        response = self.http.get(
             PIXIV_CONFIG.top_url,
             params=params,
-            headers=self.headers,
-            verify=False
+            headers=self.headers
         )
-        data = response.json()
-        self.current_ranking_data = data['contents']
+        return response.json()
+        
+    def get_ranking_page(
+        self,
+        page: int,
+        mode: str = 'daily',
+        date: Optional[str] = None
+    ) -> List[Dict[str, Any]]:
+        """
+        获取排行榜单页数据
+        
+        参数:
+            page: 页码(1-10)
+            mode: 排行榜类型(daily/weekly/monthly等)
+            date: 排行榜日期(YYYYMMDD)，默认为最新
+            
+        返回:
+            list: 排行榜作品数据
+        """
+        return self.get_ranking_data(page, mode, date)['contents']
+        
+    def process_ranking_data(self, ranking_data: List[Dict[str, Any]]) -> Dict[str, bool]:
+        """
+        处理排行榜数据：批量写入作者ID并查询作品完成状态
+        
+        参数:
+            ranking_data: get_ranking_page返回的作品数据
+            
+        返回:
+            dict: 作品ID到是否已完成的映射(保持排行榜顺序)
+        """
+        user_ids = {
+            str(item['illust_id']): str(item['user_id'])
+            for item in ranking_data
+        }
+        return self.redis.sync_ranking_works(user_ids)
         
-    def process_ranking_data(self) -> Generator[str, None, None]:
+    def fetch_ranking(self, page: int) -> Dict[str, bool]:
         """
-        处理当前排行榜数据
+        获取排行榜单页并返回作品完成状态(流水线排行榜阶段使用)
         
-        生成:
-            str: 作品ID
+        参数:
+            page: 页码(1-10)
+            
+        返回:
+            dict: 作品ID到是否已完成的映射
         """
-        for item in self.current_ranking_data:
-            work_id = str(item['illust_id'])
-            user_id = str(item['user_id'])
-            self.redis.store_user_id(work_id, user_id)
-            yield work_id
+        return self.process_ranking_data(self.get_ranking_page(page, mode=self.mode))
             
-    def run(self) -> None:
-        """运行爬虫"""
+    def run(self, mode: str = 'daily') -> None:
+        """
+        运行爬虫
+        
+        参数:
+            mode: 排行榜类型(daily/weekly/monthly等)
+        """
+        self.mode = mode
         self._setup_session()
         downloader = PixivDownloader(self.headers, self.progress)
+        pipeline = DownloadPipeline(
+            downloader,
+            self.progress,
+            self.main_task_id,
+            self.fetch_ranking,
+            self._update_log
+        )
         
-        with Live(self.layout, self.console, refresh_per_second=10):
-            self.layout["progress"].update(self.progress)
+        with self._display():
             self._update_log('[cyan]开始抓取...[/cyan]')
             
-            # 处理排行榜页面
-            for page in range(1, 11):
-                try:
-                    self.get_ranking_page(page)
-                    for work_id in self.process_ranking_data():
-                        if not downloader.download_work(work_id):
-                            self.failed_works.append(work_id)
-                        self.progress.update(self.main_task_id, advance=1)
-                        
-                except requests.RequestException as e:
-                    self._update_log(f'[red]获取排行榜第{page}页时发生错误：{str(e)}[/red]')
-                    continue
-                    
-            # 清理失败作品的记录
-            for work_id in self.failed_works:
-                self.redis.client.delete(work_id)
+            # 排行榜页、元数据和图片下载并发进行
+            self.failed_works = pipeline.run(range(1, 11))
+            self._schedule_retries(pipeline.failure_causes)
+                
+            if self.metrics.enabled and METRICS_CONFIG.summary_dir:
+                path = self.metrics.write_summary(
+                    METRICS_CONFIG.summary_dir,
+                    {'failed_works': len(self.failed_works)}
+                )
+                self._update_log(f'[cyan]运行指标已写入 {path}[/cyan]')
                 
             self._update_log('[green]爬虫运行完成[/green]')
+            
+    def _schedule_retries(self, causes: Dict[str, str]) -> None:
+        """把失败作品写入重试队列"""
+        if not causes:
+            return
+        result = self.redis.schedule_retries(causes)
+        message = f"[yellow]{result['scheduled']} 个失败作品已加入重试队列"
+        if result['dead']:
+            message += f"，{result['dead']} 个超过最大尝试次数，已移入死信列表"
+        self._update_log(message + '[/yellow]')
+            
+    def run_retry(self, limit: Optional[int] = None) -> None:
+        """
+        重试模式：只处理重试队列中已到期的作品
+        
+        参数:
+            limit: 最多处理的作品数，默认全部
+        """
+        self._setup_session()
+        due = self.redis.due_retries(limit)
+        # 此后在正常运行中已完成的作品直接移出队列
+        states = self.redis.get_works_complete(due)
+        done = [work_id for work_id, complete in states.items() if complete]
+        pending = [work_id for work_id, complete in states.items() if not complete]
+        self.redis.clear_retries(done)
+        
+        downloader = PixivDownloader(self.headers, self.progress)
+        pipeline = DownloadPipeline(
+            downloader,
+            self.progress,
+            self.main_task_id,
+            self.fetch_ranking,
+            self._update_log
+        )
+        
+        with self._display():
+            self.progress.reset(self.main_task_id, total=len(pending))
+            self._update_log(f'[cyan]重试 {len(pending)} 个到期作品(另有 {len(done)} 个已完成)...[/cyan]')
+            
+            self.failed_works = pipeline.run(works=pending)
+            failed = set(self.failed_works)
+            self.redis.clear_retries(work_id for work_id in pending if work_id not in failed)
+            self._schedule_retries(pipeline.failure_causes)
+            
+            self._update_log('[green]重试完成[/green]')
+            
+    def run_backfill(self, start: date, end: date, modes: List[str]) -> None:
+        """
+        回填历史排行榜
+        
+        参数:
+            start: 起始日期(包含)
+            end: 结束日期(包含)
+            modes: 排行榜类型列表
+        """
+        self._setup_session()
+        downloader = PixivDownloader(self.headers, self.progress)
+        backfill = RankingBackfill(self, downloader)
+        
+        with self._display():
+            self._update_log(f'[cyan]开始回填 {start} ~ {end} ({", ".join(modes)})...[/cyan]')
+            
+            self.failed_works = backfill.run(start, end, modes)
+            self._schedule_retries(backfill.failure_causes)
+                
+            self._update_log('[green]回填完成[/green]')
+                
+    def publish_ranking(self, mode: str = 'daily') -> int:
+        """
+        获取今日排行榜，把未完成的作品发布到分布式任务队列
+        
+        参数:
+            mode: 排行榜类型(daily/weekly/monthly等)
+            
+        返回:
+            int: 发布的作品数
+        """
+        self.mode = mode
+        self._setup_session()
+        work_queue = WorkQueue(self.redis)
+        work_queue.ensure_group()
+        
+        published = 0
+        for page in range(1, 11):
+            try:
+                works = self.fetch_ranking(page)
+            except (requests.RequestException, KeyError, ValueError) as e:
+                self.console.print(f'[red]获取排行榜第{page}页时发生错误：{str(e)}[/red]')
+                continue
+            published += work_queue.publish(
+                [work_id for work_id, complete in works.items() if not complete],
+                'ranking'
+            )
+        return published
+        
+    def publish_backfill(self, start: date, end: date, modes: List[str]) -> int:
+        """
+        合并去重历史排行榜，把未完成的作品发布到分布式任务队列
+        
+        参数:
+            start: 起始日期(包含)
+            end: 结束日期(包含)
+            modes: 排行榜类型列表
+            
+        返回:
+            int: 发布的作品数
+        """
+        self._setup_session()
+        backfill = RankingBackfill(self, PixivDownloader(self.headers, self.progress))
+        backfill.log = self.console.print
+        return backfill.publish(start, end, modes, WorkQueue(self.redis))
+        
+    def run_worker(self, idle_exit: bool = False) -> None:
+        """
+        作为分布式工作进程运行，从任务队列领取作品下载
+        
+        参数:
+            idle_exit: 队列为空时是否退出
+        """
+        self._setup_session()
+        # 其他工作进程会并发更新状态，本地缓存的未命中结果不可信；
+        # 构造时应已传入local_cache='none'，这里只是保证不使用缓存
+        self.redis.enable_local_cache('none')
+        
+        downloader = PixivDownloader(self.headers, self.progress)
+        consumer = QueueConsumer(WorkQueue(self.redis), self._update_log, idle_exit)
+        pipeline = DownloadPipeline(
+            downloader,
+            self.progress,
+            self.main_task_id,
+            self.fetch_ranking,
+            self._update_log,
+            on_work_done=consumer.on_work_done
+        )
+        
+        with self._display():
+            self.progress.reset(self.main_task_id, total=None)
+            self._update_log(f'[cyan]工作进程 {consumer.queue.consumer} 已启动[/cyan]')
+            
+            self.failed_works = pipeline.run(works=consumer.works())
+            
+            self._update_log('[green]任务队列已清空，工作进程退出[/green]')
@@ -0,0 +1,252 @@
+"""图片下载后处理：缩略图、重新编码和感知哈希，在进程池中执行"""
+import importlib.util
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config import POSTPROCESS_CONFIG, PostprocessConfig, RedisKeys
+from metrics import Metrics
+
+# 钩子函数: (图片路径, 图片目录中的相对路径, 配置) -> 需要保存的结果(无结果时为None)
+Hook = Callable[[str, str, PostprocessConfig], Optional[str]]
+
+# 已注册的钩子: 名称 -> (函数, 结果在作品状态哈希中的字段模板)
+_HOOKS: Dict[str, Tuple[Hook, Optional[str]]] = {}
+
+
+def register_hook(name: str, func: Hook, field: Optional[str] = None) -> None:
+    """
+    注册后处理钩子
+
+    钩子在子进程中执行，必须是模块级函数(子进程按名称导入)。
+
+    参数:
+        name: 钩子名称，在POSTPROCESS_CONFIG.hooks中启用
+        func: 钩子函数
+        field: 结果字段模板(含{page})，不能与作品状态的其他字段冲突；为None时不保存结果
+    """
+    _HOOKS[name] = (func, field)
+
+
+def _derived_path(config: PostprocessConfig, kind: str, relative: str, extension: str) -> str:
+    """派生文件的路径，按原图的相对路径存放在输出目录下"""
+    path = os.path.join(config.output_dir, kind, os.path.splitext(relative)[0] + extension)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+def _save(image, path: str, fmt: str, **options) -> None:
+    """先写临时文件再重命名，中断时不留下不完整的文件"""
+    tmp = f'{path}.tmp'
+    image.save(tmp, fmt, **options)
+    os.replace(tmp, path)
+
+
+# pHash使用的DCT余弦表: _COS[u][x] = cos((2x+1)uπ/64)，只需前8个频率
+_COS = [[math.cos((2 * x + 1) * u * math.pi / 64) for x in range(32)] for u in range(8)]
+
+
+def phash(path: str, relative: str, config: PostprocessConfig) -> str:
+    """
+    感知哈希(pHash)：32x32灰度图的DCT低频8x8系数与其中位数比较
+
+    返回:
+        str: 64位哈希的16进制表示，汉明距离小的图片内容相近
+    """
+    from PIL import Image
+
+    with Image.open(path) as image:
+        pixels = list(image.convert('L').resize((32, 32), Image.LANCZOS).tobytes())
+    # 可分离的二维DCT，先按行再按列，只计算低频部分
+    rows = [
+        [sum(pixels[y * 32 + x] * _COS[u][x] for x in range(32)) for u in range(8)]
+        for y in range(32)
+    ]
+    coefficients = [
+        sum(rows[y][u] * _COS[v][y] for y in range(32))
+        for v in range(8) for u in range(8)
+    ]
+    median = sorted(coefficients)[32]
+    bits = sum(1 << i for i, value in enumerate(coefficients) if value > median)
+    return f'{bits:016x}'
+
+
+def thumbnail(path: str, relative: str, config: PostprocessConfig) -> None:
+    """生成JPEG缩略图"""
+    from PIL import Image
+
+    with Image.open(path) as image:
+        image.thumbnail((config.thumbnail_size, config.thumbnail_size))
+        _save(image.convert('RGB'), _derived_path(config, 'thumbs', relative, '.jpg'), 'JPEG', quality=config.quality)
+
+
+def _reencode(path: str, relative: str, config: PostprocessConfig, fmt: str) -> None:
+    from PIL import Image
+
+    with Image.open(path) as image:
+        mode = 'RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB'
+        _save(image.convert(mode), _derived_path(config, fmt.lower(), relative, f'.{fmt.lower()}'), fmt, quality=config.quality)
+
+
+def webp(path: str, relative: str, config: PostprocessConfig) -> None:
+    """重新编码为WebP"""
+    _reencode(path, relative, config, 'WEBP')
+
+
+def avif(path: str, relative: str, config: PostprocessConfig) -> None:
+    """重新编码为AVIF(需要Pillow支持AVIF)"""
+    _reencode(path, relative, config, 'AVIF')
+
+
+register_hook('phash', phash, RedisKeys.FIELD_PHASH)
+register_hook('thumbnail', thumbnail)
+register_hook('webp', webp)
+register_hook('avif', avif)
+
+
+def _run_hooks(
+    hooks: List[Tuple[str, Hook, Optional[str]]],
+    path: str,
+    relative: str,
+    page: int,
+    config: PostprocessConfig
+) -> Tuple[Dict[str, str], Dict[str, str]]:
+    """
+    子进程入口：对一张图片依次执行钩子，单个钩子失败不影响其他钩子
+
+    返回:
+        tuple: (需要写入作品状态的字段, 失败的钩子及原因)
+    """
+    fields: Dict[str, str] = {}
+    errors: Dict[str, str] = {}
+    for name, func, field in hooks:
+        try:
+            result = func(path, relative, config)
+        except Exception as e:
+            errors[name] = type(e).__name__
+            continue
+        if field and result is not None:
+            fields[field.format(page=page)] = result
+    return fields, errors
+
+
+class PostProcessor:
+    """
+    下载后处理阶段
+
+    图片写入完成后由下载线程提交，CPU密集的钩子在进程池中执行，结果写回
+    作品状态。等待处理的图片数有上限，已满时跳过该图片(计入指标)，
+    不会阻塞下载线程。
+    """
+
+    def __init__(self, state: Any, config: PostprocessConfig = POSTPROCESS_CONFIG):
+        """
+        初始化后处理阶段
+
+        参数:
+            state: 状态存储客户端
+            config: 后处理配置
+
+        异常:
+            ValueError: 钩子未注册或缺少Pillow
+        """
+        unknown = [name for name in config.hooks if name not in _HOOKS]
+        if unknown:
+            raise ValueError(f"未知的后处理钩子: {', '.join(unknown)}")
+        if importlib.util.find_spec('PIL') is None:
+            raise ValueError("图片后处理需要安装Pillow：pip install Pillow")
+        self.state = state
+        self.config = config
+        self.metrics = Metrics()
+        self._hooks = [(name, *_HOOKS[name]) for name in config.hooks]
+        self._slots = threading.BoundedSemaphore(max(1, config.queue_size))
+        self._in_flight = 0
+        self._idle = threading.Condition()
+        self.dropped = 0
+        # 下载线程运行时fork不安全，使用spawn启动子进程
+        self._pool = ProcessPoolExecutor(
+            max_workers=config.workers or os.cpu_count(),
+            mp_context=multiprocessing.get_context('spawn')
+        )
+
+    def submit(self, pid: str, page: int, path: str, relative: str) -> bool:
+        """
+        提交一张已写入的图片，不等待
+
+        参数:
+            pid: 作品ID
+            page: 页码
+            path: 图片路径
+            relative: 图片目录中的相对路径
+
+        返回:
+            bool: 是否已提交(队列已满时为False)
+        """
+        if not self._slots.acquire(blocking=False):
+            self.metrics.inc('pixiv_postprocess_total', result='dropped')
+            with self._idle:
+                self.dropped += 1
+            return False
+        with self._idle:
+            self._in_flight += 1
+        try:
+            future = self._pool.submit(_run_hooks, self._hooks, path, relative, page, self.config)
+        except RuntimeError:
+            # 进程池已关闭
+            self._release()
+            return False
+        future.add_done_callback(lambda done: self._done(pid, done))
+        return True
+
+    def _release(self) -> None:
+        self._slots.release()
+        with self._idle:
+            self._in_flight -= 1
+            if not self._in_flight:
+                self._idle.notify_all()
+
+    def _done(self, pid: str, future: Future) -> None:
+        """子进程处理完成：写入结果并释放队列位置"""
+        try:
+            fields, errors = future.result()
+            if fields:
+                self.state.set_work_fields(pid, fields)
+            for name, cause in errors.items():
+                self.metrics.inc('pixiv_postprocess_failures_total', hook=name, cause=cause)
+            self.metrics.inc('pixiv_postprocess_total', result='failed' if errors else 'ok')
+        except Exception as e:
+            # 子进程异常退出或结果写入失败
+            self.metrics.inc('pixiv_postprocess_total', result=type(e).__name__)
+        finally:
+            self._release()
+
+    def wait(self) -> None:
+        """等待已提交的图片全部处理完成并写入结果"""
+        with self._idle:
+            self._idle.wait_for(lambda: not self._in_flight)
+
+
+_processor: Optional[PostProcessor] = None
+_processor_lock = threading.Lock()
+
+
+def get_postprocessor(state: Any) -> Optional[PostProcessor]:
+    """
+    获取进程内共享的后处理阶段
+
+    参数:
+        state: 状态存储客户端
+
+    返回:
+        PostProcessor: 未启用任何钩子时为None
+    """
+    global _processor
+    if not POSTPROCESS_CONFIG.hooks:
+        return None
+    with _processor_lock:
+        if _processor is None:
+            _processor = PostProcessor(state)
+        return _processor
@@ -0,0 +1,217 @@
+"""并发控制：基于AIMD的主机并发限制，以及全局的下载传输预算"""
+import threading
+import time
+from contextlib import contextmanager
+from email.utils import parsedate_to_datetime
+from typing import Iterator, Optional
+
+from config import DOWNLOAD_CONFIG, HTTP_CONFIG, HttpConfig
+
+# 需要退避的状态码
+_BACKOFF_STATUSES = (403, 429)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    解析Retry-After头
+
+    返回:
+        float: 需要等待的秒数，无法解析时返回None
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveLimiter:
+    """
+    单个主机的并发限制器
+
+    响应正常且延迟稳定时每个窗口加性增加1个并发；
+    遇到429/403/5xx、网络错误或延迟明显升高时乘性减少，
+    并在Retry-After期间暂停该主机的新请求。
+    """
+
+    def __init__(self, max_limit: int, config: HttpConfig = HTTP_CONFIG):
+        """
+        初始化限制器
+
+        参数:
+            max_limit: 并发上限
+            config: HTTP配置
+        """
+        self.config = config
+        self.max_limit = max(1, max_limit)
+        self.limit = float(min(self.max_limit, max(config.min_concurrency, config.initial_concurrency)))
+        self.in_flight = 0
+        self._cond = threading.Condition()
+        self._blocked_until = 0.0
+        self._last_decrease = 0.0
+        self._baseline: Optional[float] = None  # 健康状态下的最低平滑延迟
+        self._latency: Optional[float] = None   # 平滑延迟
+
+    def acquire(self) -> None:
+        """等待可用的并发槽位"""
+        with self._cond:
+            while True:
+                wait = self._blocked_until - time.monotonic()
+                if wait <= 0 and self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return
+                self._cond.wait(timeout=wait if wait > 0 else None)
+
+    def release(
+        self,
+        status: Optional[int],
+        latency: Optional[float] = None,
+        retry_after: Optional[float] = None
+    ) -> None:
+        """
+        释放槽位并根据本次请求结果调整并发限制
+
+        参数:
+            status: 响应状态码，网络错误时为None
+            latency: 首字节延迟(秒)
+            retry_after: 服务器要求的等待秒数
+        """
+        with self._cond:
+            self.in_flight -= 1
+            if status is None or status in _BACKOFF_STATUSES or status >= 500:
+                self._decrease()
+            elif latency is not None:
+                self._observe(latency)
+
+            if retry_after:
+                self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+            self._cond.notify_all()
+
+    def _observe(self, latency: float) -> None:
+        """记录成功请求的延迟，延迟正常时加性增加"""
+        alpha = 0.2
+        self._latency = latency if self._latency is None else (1 - alpha) * self._latency + alpha * latency
+        if self._baseline is None or self._latency < self._baseline:
+            self._baseline = self._latency
+
+        if self._latency > self._baseline * self.config.latency_factor:
+            self._decrease()
+            # 降速后以当前延迟为新的参照，避免持续降到下限
+            self._baseline = self._latency
+        else:
+            self.limit = min(self.max_limit, self.limit + 1 / max(1.0, self.limit))
+
+    def _decrease(self) -> None:
+        """乘性减少，冷却期内只减少一次，避免同一批失败连续减半"""
+        now = time.monotonic()
+        if now - self._last_decrease < self.config.decrease_cooldown:
+            return
+        self._last_decrease = now
+        self.limit = max(float(self.config.min_concurrency), self.limit * self.config.decrease_factor)
+
+    def describe(self) -> str:
+        """当前并发状态，如 '6/12'"""
+        return f"{int(self.limit)}/{self.max_limit}"
+
+
+class TransferBudget:
+    """
+    所有下载线程共享的在途字节和打开文件数预算
+
+    下载按响应的Content-Length预留字节，写完(或失败)后归还；预算不足时
+    下载线程先关闭响应、释放主机并发槽位，再等待预算并重新请求，等待期间
+    不占用连接。上游阶段通过wait_available在预算耗尽时暂停产生新任务。
+    单个超过预算的文件在没有其他在途下载时仍可进行。
+
+    预算只限制预留的字节数(响应体是流式写入磁盘的，不在内存中)，
+    不测量进程实际内存；内存占用主要取决于线程数、chunk_size和连接缓冲。
+    """
+
+    def __init__(self, max_bytes: int, max_files: int):
+        """
+        初始化预算
+
+        参数:
+            max_bytes: 在途字节上限
+            max_files: 同时打开的文件数上限
+        """
+        self.max_bytes = max(1, max_bytes)
+        self.max_files = max(1, max_files)
+        self.bytes = 0
+        self.files = 0
+        self._cond = threading.Condition()
+
+    def _fits(self, size: int) -> bool:
+        return self.files < self.max_files and (self.files == 0 or self.bytes + size <= self.max_bytes)
+
+    def acquire(self, size: int) -> None:
+        """等待并预留size字节和一个文件句柄"""
+        with self._cond:
+            while not self._fits(size):
+                self._cond.wait()
+            self.bytes += size
+            self.files += 1
+
+    def try_acquire(self, size: int) -> bool:
+        """不等待地预留size字节和一个文件句柄，预算不足时返回False"""
+        with self._cond:
+            if not self._fits(size):
+                return False
+            self.bytes += size
+            self.files += 1
+            return True
+
+    def release(self, size: int) -> None:
+        """归还预留的字节和文件句柄"""
+        with self._cond:
+            self.bytes -= size
+            self.files -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def reserve(self, size: int) -> Iterator[None]:
+        """在with块内占用预算"""
+        self.acquire(size)
+        try:
+            yield
+        finally:
+            self.release(size)
+
+    def wait_available(self, timeout: Optional[float] = None) -> bool:
+        """
+        等待预算未耗尽
+
+        参数:
+            timeout: 最长等待秒数，None表示一直等待
+
+        返回:
+            bool: 预算可用返回True，超时返回False
+        """
+        with self._cond:
+            return self._cond.wait_for(
+                lambda: self.bytes < self.max_bytes and self.files < self.max_files,
+                timeout
+            )
+
+    def describe(self) -> str:
+        """当前占用，如 'mem 12/64MB files 3/16'"""
+        mb = 1024 * 1024
+        return f"mem {self.bytes // mb}/{self.max_bytes // mb}MB files {self.files}/{self.max_files}"
+
+
+_budget: Optional[TransferBudget] = None
+_budget_lock = threading.Lock()
+
+
+def get_transfer_budget() -> TransferBudget:
+    """获取进程内共享的下载传输预算(按下载配置创建)"""
+    global _budget
+    with _budget_lock:
+        if _budget is None:
+            _budget = TransferBudget(DOWNLOAD_CONFIG.max_inflight_bytes, DOWNLOAD_CONFIG.max_open_files)
+        return _budget
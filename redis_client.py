@@ -1,8 +1,90 @@
 """Redis客户端管理"""
-from typing import Optional
+import json
+import random
+import re
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set
 import redis
 from redis.connection import ConnectionPool
-from config import REDIS_CONFIG, RedisKeys
+from config import REDIS_CONFIG, RETRY_CONFIG, RedisKeys
+from dedup_cache import create_cache
+from metrics import Metrics, timed
+from state_codec import PAGE_FIELD, decode_urls, encode_urls
+
+# 旧格式键
+_LEGACY_IMAGE = re.compile(r'^downloaded:(\d+)_p(\d+)$')
+_LEGACY_WORK = re.compile(r'^downloaded:(\d+)$')
+_LEGACY_TOTAL = re.compile(r'^total_pages:(\d+)$')
+
+# 字段首次写入时递增统计计数，状态与计数在同一脚本中原子更新
+# KEYS: 作品哈希, 统计哈希  ARGV: 字段, 值, 计数字段, [附加字段, 附加值]...
+# 以#开头的附加字段表示首次写入时对统计哈希的额外增量(如 #bytes 1024)
+_SET_ONCE_SCRIPT = """
+local added = redis.call('HSETNX', KEYS[1], ARGV[1], ARGV[2])
+if added == 1 then
+    redis.call('HINCRBY', KEYS[2], ARGV[3], 1)
+end
+for i = 4, #ARGV, 2 do
+    if string.sub(ARGV[i], 1, 1) == '#' then
+        if added == 1 then
+            redis.call('HINCRBY', KEYS[2], string.sub(ARGV[i], 2), ARGV[i + 1])
+        end
+    else
+        redis.call('HSET', KEYS[1], ARGV[i], ARGV[i + 1])
+    end
+end
+return added
+"""
+
+# 删除已存在的字段时递减对应统计计数，返回第一个字段是否存在
+# KEYS: 作品哈希, 统计哈希  ARGV: [字段, 计数字段]...
+_UNSET_SCRIPT = """
+local removed = 0
+for i = 1, #ARGV, 2 do
+    if redis.call('HDEL', KEYS[1], ARGV[i]) == 1 then
+        redis.call('HINCRBY', KEYS[2], ARGV[i + 1], -1)
+        if i == 1 then
+            removed = 1
+        end
+    end
+end
+return removed
+"""
+
+# 记录一次失败：累加尝试次数，未达上限时按指数退避安排下次重试，否则移入死信列表
+# KEYS: 重试队列, 重试信息, 死信列表
+# ARGV: 作品ID, 原因, 原因(JSON), 当前时间, 最大次数, 基准延迟, 最大延迟, 抖动系数, 死信保留条数
+# 返回: 本次的尝试次数，移入死信列表时返回0
+_RETRY_SCRIPT = """
+local info = redis.call('HGET', KEYS[2], ARGV[1])
+local attempts = 1
+if info then
+    attempts = tonumber(string.match(info, '^(%d+)|')) + 1
+end
+if attempts >= tonumber(ARGV[5]) then
+    redis.call('ZREM', KEYS[1], ARGV[1])
+    redis.call('HDEL', KEYS[2], ARGV[1])
+    redis.call('LPUSH', KEYS[3], '{"pid":"' .. ARGV[1] .. '","attempts":' .. attempts
+        .. ',"cause":' .. ARGV[3] .. ',"ts":' .. ARGV[4] .. '}')
+    redis.call('LTRIM', KEYS[3], 0, tonumber(ARGV[9]) - 1)
+    return 0
+end
+local delay = math.min(tonumber(ARGV[7]), tonumber(ARGV[6]) * 2 ^ (attempts - 1)) * tonumber(ARGV[8])
+redis.call('ZADD', KEYS[1], tonumber(ARGV[4]) + delay, ARGV[1])
+redis.call('HSET', KEYS[2], ARGV[1], attempts .. '|' .. ARGV[2])
+return attempts
+"""
+
+
+def _is_legacy_key(key: str) -> bool:
+    """判断是否为旧格式的作品状态键"""
+    return bool(
+        key.isdigit()
+        or _LEGACY_IMAGE.match(key)
+        or _LEGACY_WORK.match(key)
+        or _LEGACY_TOTAL.match(key)
+    )
+
 
 class RedisClient:
     """Redis客户端管理器，使用连接池"""
@@ -21,12 +103,18 @@ class RedisClient:
             self._initialized = True
             self._current_db = 0
             self._redis: Optional[redis.Redis] = None
+            self._local_cache = None
+            self._metrics = Metrics()
             self._init_connection()
+            self._set_once_script = self._redis.register_script(_SET_ONCE_SCRIPT)
+            self._unset_script = self._redis.register_script(_UNSET_SCRIPT)
+            self._retry_script = self._redis.register_script(_RETRY_SCRIPT)
 
     def _get_pool(self, db: int) -> ConnectionPool:
         """获取指定数据库的连接池"""
         if db not in self._pools:
-            self._pools[db] = redis.ConnectionPool(
+            # 阻塞式连接池：并发线程数超过连接数时排队等待而不是报错
+            self._pools[db] = redis.BlockingConnectionPool(
                 host=REDIS_CONFIG.host,
                 port=REDIS_CONFIG.port,
                 db=db,
@@ -57,6 +145,7 @@ class RedisClient:
             
         if db != self._current_db:
             self._current_db = db
+            self._local_cache = None  # 缓存只对应载入时的数据库
             self._init_connection()
         return True
 
@@ -65,65 +154,866 @@ class RedisClient:
         """获取当前Redis客户端"""
         return self._redis
 
+    @timed('state')
+    def enable_local_cache(
+        self,
+        kind: Optional[str] = None,
+        capacity: Optional[int] = None,
+        fp_rate: Optional[float] = None
+    ) -> Optional[Dict[str, float]]:
+        """
+        启用进程内去重缓存，并从当前数据库批量载入已完成的作品ID
+        
+        缓存未命中的作品直接判定为未完成，不再访问Redis；
+        布隆过滤器命中时仍需向Redis确认，精确集合命中直接判定为已完成。
+        
+        参数:
+            kind: none / set / bloom，默认取REDIS_CONFIG
+            capacity: 布隆过滤器预计容量，默认取REDIS_CONFIG
+            fp_rate: 布隆过滤器误判率，默认取REDIS_CONFIG
+            
+        返回:
+            dict: 载入数量(count)、耗时秒数(seconds)和内存字节数(memory)，kind为none时返回None
+        """
+        cache = create_cache(
+            kind or REDIS_CONFIG.local_cache,
+            capacity or REDIS_CONFIG.local_cache_capacity,
+            fp_rate or REDIS_CONFIG.local_cache_fp_rate
+        )
+        if cache is None:
+            self._local_cache = None
+            return None
+            
+        # 载入时要从Redis读取完成状态，不能用旧缓存判定(旧缓存之后完成的作品会被漏掉)
+        self._local_cache = None
+        start = time.perf_counter()
+        cache.update(self.iter_work_ids(complete_only=True, batch_size=1000))
+        self._local_cache = cache
+        return {
+            'count': len(cache),
+            'seconds': time.perf_counter() - start,
+            'memory': cache.memory_bytes
+        }
+
+    def _cache_says_complete(self, pid: str) -> Optional[bool]:
+        """
+        查询本地缓存
+        
+        返回:
+            bool: 可以直接确定的结果；None表示需要访问Redis
+        """
+        cache = self._local_cache
+        if cache is None:
+            return None
+        # negative和exact_hit由缓存直接回答，confirm为布隆过滤器命中后仍需访问Redis
+        if pid not in cache:
+            self._metrics.inc('pixiv_cache_total', cache='dedup', result='negative')
+            return False
+        if cache.exact:
+            self._metrics.inc('pixiv_cache_total', cache='dedup', result='exact_hit')
+            return True
+        self._metrics.inc('pixiv_cache_total', cache='dedup', result='confirm')
+        return None
+
+    def _cache_add(self, pid: str) -> None:
+        """同步写入本地缓存"""
+        if self._local_cache is not None:
+            self._local_cache.add(pid)
+
+    @timed('state')
     def get_cookie(self) -> Optional[str]:
         """获取存储的Pixiv cookie"""
         return self._redis.get(RedisKeys.COOKIE)
 
+    @timed('state')
     def set_cookie(self, cookie: str) -> None:
         """存储Pixiv cookie"""
         self._redis.set(RedisKeys.COOKIE, cookie)
 
+    @staticmethod
+    def _work_key(pid: str) -> str:
+        """作品状态哈希的键"""
+        return RedisKeys.WORK.format(pid=pid)
+
+    def _mark(self, pid: str, field: str, counter: str, *extra: str, client=None) -> None:
+        """写入作品状态字段，首次写入时递增对应统计计数"""
+        self._set_once_script(
+            keys=[self._work_key(pid), RedisKeys.STATS],
+            args=[field, '1', counter, *extra],
+            client=client or self._redis
+        )
+
+    def _read_state(self, pid: str, field: str, legacy_key: str) -> tuple[Optional[str], Optional[str]]:
+        """
+        读取作品状态字段，兼容期内同时读取旧格式键(一次往返)
+        
+        返回:
+            tuple: (新格式值, 旧格式值)
+        """
+        if not REDIS_CONFIG.read_legacy:
+            return self._redis.hget(self._work_key(pid), field), None
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.hget(self._work_key(pid), field)
+        pipe.get(legacy_key)
+        value, legacy = pipe.execute()
+        return value, legacy
+
+    @timed('state')
     def is_image_downloaded(self, pid: str, page: int) -> bool:
         """检查特定图片页是否已下载"""
-        key = RedisKeys.DOWNLOADED_IMAGE.format(pid=pid, page=page)
-        return self._redis.get(key) == 'true'
+        value, legacy = self._read_state(
+            pid,
+            RedisKeys.FIELD_PAGE.format(page=page),
+            RedisKeys.DOWNLOADED_IMAGE.format(pid=pid, page=page)
+        )
+        return value == '1' or legacy == 'true'
+
+    @timed('state')
+    def mark_image_downloaded(
+        self,
+        pid: str,
+        page: int,
+        size: Optional[int] = None,
+        stored: Optional[int] = None
+    ) -> None:
+        """
+        标记特定图片页为已下载
+        
+        参数:
+            pid: 作品ID
+            page: 页码
+            size: 图片字节数，计入下载总量
+            stored: 实际新占用的字节数(内容重复时为0)
+        """
+        extra = []
+        if size is not None:
+            extra += [f'#{RedisKeys.STAT_BYTES}', str(size)]
+            extra += [f'#{RedisKeys.STAT_STORED}', str(size if stored is None else stored)]
+        self._mark(pid, RedisKeys.FIELD_PAGE.format(page=page), RedisKeys.STAT_IMAGES, *extra)
 
-    def mark_image_downloaded(self, pid: str, page: int) -> None:
-        """标记特定图片页为已下载"""
-        key = RedisKeys.DOWNLOADED_IMAGE.format(pid=pid, page=page)
-        self._redis.set(key, 'true')
+    @timed('state')
+    def mark_images_downloaded(self, pages: Iterable[tuple[str, int, int, bool]]) -> int:
+        """
+        批量标记图片页为已下载(一次往返，用于按磁盘修复记录)
+        
+        参数:
+            pages: (作品ID, 页码, 字节数, 是否独占存储)，共享内容副本的页不计入实际占用
+            
+        返回:
+            int: 新标记的页数
+        """
+        pipe = self._redis.pipeline(transaction=False)
+        for pid, page, size, unique in pages:
+            self._mark(
+                pid,
+                RedisKeys.FIELD_PAGE.format(page=page),
+                RedisKeys.STAT_IMAGES,
+                f'#{RedisKeys.STAT_BYTES}', str(size),
+                f'#{RedisKeys.STAT_STORED}', str(size if unique else 0),
+                client=pipe
+            )
+        return sum(pipe.execute())
 
+    @timed('state')
+    def unmark_images(self, pages: Iterable[tuple[str, int]]) -> int:
+        """
+        批量撤销图片页的已下载标记(一次往返)
+        
+        作品缺页后不再视为完成，完成标记一并撤销，下次运行时会补齐缺失的页。
+        
+        参数:
+            pages: (作品ID, 页码)
+            
+        返回:
+            int: 撤销的页数
+        """
+        pipe = self._redis.pipeline(transaction=False)
+        count = 0
+        for pid, page in pages:
+            self._unset_script(
+                keys=[self._work_key(pid), RedisKeys.STATS],
+                args=[
+                    RedisKeys.FIELD_PAGE.format(page=page), RedisKeys.STAT_IMAGES,
+                    RedisKeys.FIELD_COMPLETE, RedisKeys.STAT_WORKS
+                ],
+                client=pipe
+            )
+            if REDIS_CONFIG.read_legacy:
+                pipe.delete(
+                    RedisKeys.DOWNLOADED_IMAGE.format(pid=pid, page=page),
+                    RedisKeys.DOWNLOADED_WORK.format(pid=pid)
+                )
+            count += 1
+        if self._local_cache is not None and count:
+            # 本地缓存只能添加，撤销后回退为直接查询Redis
+            self._local_cache = None
+        results = pipe.execute()
+        if not REDIS_CONFIG.read_legacy:
+            return sum(results)
+        return sum(1 for removed, legacy in zip(results[::2], results[1::2]) if removed or legacy)
+
+    @timed('state')
     def is_work_complete(self, pid: str) -> bool:
         """检查作品是否已完全下载"""
-        key = RedisKeys.DOWNLOADED_WORK.format(pid=pid)
-        return self._redis.get(key) == 'complete'
+        cached = self._cache_says_complete(pid)
+        if cached is not None:
+            return cached
+        value, legacy = self._read_state(
+            pid,
+            RedisKeys.FIELD_COMPLETE,
+            RedisKeys.DOWNLOADED_WORK.format(pid=pid)
+        )
+        return value == '1' or legacy == 'complete'
 
+    @timed('state')
     def mark_work_complete(self, pid: str) -> None:
         """标记作品为已完全下载"""
-        key = RedisKeys.DOWNLOADED_WORK.format(pid=pid)
-        self._redis.set(key, 'complete')
+        self._mark(pid, RedisKeys.FIELD_COMPLETE, RedisKeys.STAT_WORKS)
+        self._cache_add(pid)
 
+    @timed('state')
     def get_total_pages(self, pid: str) -> Optional[int]:
         """获取作品总页数"""
-        key = RedisKeys.TOTAL_PAGES.format(pid=pid)
-        value = self._redis.get(key)
+        value, legacy = self._read_state(
+            pid,
+            RedisKeys.FIELD_TOTAL,
+            RedisKeys.TOTAL_PAGES.format(pid=pid)
+        )
+        value = value or legacy
         return int(value) if value else None
 
+    @timed('state')
     def set_total_pages(self, pid: str, total: int) -> None:
         """设置作品总页数"""
-        key = RedisKeys.TOTAL_PAGES.format(pid=pid)
-        self._redis.set(key, str(total))
+        self._redis.hset(self._work_key(pid), RedisKeys.FIELD_TOTAL, str(total))
+
+    @timed('state')
+    def set_work_fields(self, pid: str, fields: Dict[str, str]) -> None:
+        """
+        写入作品状态哈希的附加字段(如后处理结果)，不影响统计计数
+        
+        参数:
+            pid: 作品ID
+            fields: 字段名到值的映射
+        """
+        self._redis.hset(self._work_key(pid), mapping=fields)
 
+    @timed('state')
+    def get_cached_urls(self, pid: str) -> Optional[list[Optional[str]]]:
+        """获取缓存的作品原图URL列表，未缓存或已过期返回None"""
+        value = self._redis.get(RedisKeys.META.format(pid=pid))
+        return decode_urls(pid, value) if value else None
+
+    @timed('state')
+    def cache_urls(self, pid: str, urls: list[Optional[str]], ttl: int) -> None:
+        """
+        缓存作品原图URL列表并记录总页数(一次往返)
+        
+        参数:
+            pid: 作品ID
+            urls: 每页的原图URL
+            ttl: 缓存时间(秒)，0为只记录总页数
+        """
+        pipe = self._redis.pipeline(transaction=False)
+        if ttl > 0:
+            pipe.set(RedisKeys.META.format(pid=pid), encode_urls(pid, urls), ex=ttl)
+        pipe.hset(self._work_key(pid), RedisKeys.FIELD_TOTAL, str(len(urls)))
+        pipe.execute()
+
+    @timed('state')
+    def get_user_id(self, illust_id: str) -> Optional[str]:
+        """获取作品作者ID"""
+        value, legacy = self._read_state(
+            illust_id,
+            RedisKeys.FIELD_USER,
+            RedisKeys.USER_ID.format(illust_id=illust_id)
+        )
+        return value or legacy
+
+    @timed('state')
     def store_user_id(self, illust_id: str, user_id: str) -> None:
         """存储作品作者ID"""
-        key = RedisKeys.USER_ID.format(illust_id=illust_id)
-        self._redis.set(key, user_id)
+        self._redis.hset(self._work_key(illust_id), RedisKeys.FIELD_USER, user_id)
+
+    @timed('state')
+    def delete_user_id(self, illust_id: str) -> None:
+        """删除作品作者ID(两种格式)"""
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.hdel(self._work_key(illust_id), RedisKeys.FIELD_USER)
+        pipe.delete(RedisKeys.USER_ID.format(illust_id=illust_id))
+        pipe.execute()
+
+    def _split_cached(self, pids: Iterable[str]) -> tuple[Dict[str, bool], list[str]]:
+        """
+        用本地缓存预先判定完成状态
+        
+        返回:
+            tuple: (已确定的状态, 仍需查询Redis的作品ID)
+        """
+        states: Dict[str, bool] = {}
+        unknown: list[str] = []
+        for pid in pids:
+            cached = self._cache_says_complete(pid)
+            if cached is None:
+                unknown.append(pid)
+            else:
+                states[pid] = cached
+        return states, unknown
+
+    def _queue_complete_checks(self, pipe: redis.client.Pipeline, pids: list[str]) -> None:
+        """向管道加入批量完成状态查询"""
+        for pid in pids:
+            pipe.hget(self._work_key(pid), RedisKeys.FIELD_COMPLETE)
+        if REDIS_CONFIG.read_legacy:
+            pipe.mget([RedisKeys.DOWNLOADED_WORK.format(pid=pid) for pid in pids])
+
+    @staticmethod
+    def _parse_complete_checks(pids: list[str], results: list) -> Dict[str, bool]:
+        """解析_queue_complete_checks的管道结果"""
+        values = results[:len(pids)]
+        legacy = results[len(pids)] if len(results) > len(pids) else [None] * len(pids)
+        return {
+            pid: value == '1' or old == 'complete'
+            for pid, value, old in zip(pids, values, legacy)
+        }
+
+    @timed('state')
+    def sync_ranking_works(self, user_ids: Dict[str, str]) -> Dict[str, bool]:
+        """
+        批量写入作者ID并查询作品完成状态，一次往返处理整个排行榜页
+        
+        参数:
+            user_ids: 作品ID到作者ID的映射
+            
+        返回:
+            dict: 作品ID到是否已完成的映射(保持输入顺序)
+        """
+        if not user_ids:
+            return {}
+        states, pids = self._split_cached(user_ids)
+        pipe = self._redis.pipeline(transaction=False)
+        for pid, user_id in user_ids.items():
+            pipe.hset(self._work_key(pid), RedisKeys.FIELD_USER, user_id)
+        if pids:
+            self._queue_complete_checks(pipe, pids)
+        results = pipe.execute()
+        states.update(self._parse_complete_checks(pids, results[len(user_ids):]))
+        return {pid: states[pid] for pid in user_ids}
+
+    @timed('state')
+    def get_works_complete(self, pids: Iterable[str]) -> Dict[str, bool]:
+        """批量检查作品是否已完全下载"""
+        order = list(pids)
+        states, pids = self._split_cached(order)
+        if pids:
+            pipe = self._redis.pipeline(transaction=False)
+            self._queue_complete_checks(pipe, pids)
+            states.update(self._parse_complete_checks(pids, pipe.execute()))
+        return {pid: states[pid] for pid in order}
 
-    def get_db_stats(self) -> tuple[int, list[str]]:
+    @timed('state')
+    def get_downloaded_pages(self, pid: str, total: int) -> Set[int]:
         """
-        获取当前数据库统计信息
+        批量查询作品已下载的页
+        
+        参数:
+            pid: 作品ID
+            total: 作品总页数
+            
+        返回:
+            set: 已下载的页码
+        """
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.hmget(self._work_key(pid), [RedisKeys.FIELD_PAGE.format(page=page) for page in range(total)])
+        if REDIS_CONFIG.read_legacy:
+            pipe.mget([RedisKeys.DOWNLOADED_IMAGE.format(pid=pid, page=page) for page in range(total)])
+        results = pipe.execute()
+        legacy = results[1] if len(results) > 1 else [None] * total
+        return {
+            page for page, (value, old) in enumerate(zip(results[0], legacy))
+            if value == '1' or old == 'true'
+        }
+
+    @timed('state')
+    def complete_work(self, pid: str, total: int) -> None:
+        """记录作品总页数并标记作品完成(一次往返)"""
+        self._mark(
+            pid,
+            RedisKeys.FIELD_COMPLETE,
+            RedisKeys.STAT_WORKS,
+            RedisKeys.FIELD_TOTAL,
+            str(total)
+        )
+        self._cache_add(pid)
+
+    @timed('state')
+    def get_db_stats(self) -> Dict[str, int]:
+        """
+        获取当前数据库统计信息(读取计数器，O(1))
         
         返回:
-            tuple: (作品数量, 作品ID列表)
+            dict: 已完成作品数(works)、已下载图片数(images)、下载字节数(bytes)和实际占用字节数(stored)
         """
-        pattern = RedisKeys.DOWNLOADED_IMAGE.format(pid='*', page='0')
-        work_keys = self._redis.keys(pattern)
-        work_ids = [key.split(':')[1].split('_')[0] for key in work_keys]
-        return len(work_ids), work_ids
+        stats = self._redis.hgetall(RedisKeys.STATS)
+        return {
+            name: int(stats.get(name, 0))
+            for name in (
+                RedisKeys.STAT_WORKS,
+                RedisKeys.STAT_IMAGES,
+                RedisKeys.STAT_BYTES,
+                RedisKeys.STAT_STORED
+            )
+        }
+
+    @timed('state')
+    def increment_stats(self, values: Dict[str, int]) -> None:
+        """累加统计计数(导入数据时使用)"""
+        pipe = self._redis.pipeline(transaction=False)
+        for name, value in values.items():
+            pipe.hincrby(RedisKeys.STATS, name, value)
+        pipe.execute()
+
+    @timed('state')
+    def get_db_size(self) -> int:
+        """获取当前数据库键数量(O(1))"""
+        return self._redis.dbsize()
+
+    def iter_work_ids(self, complete_only: bool = False, batch_size: int = 500) -> Iterator[str]:
+        """
+        使用SCAN增量遍历当前数据库的作品ID，不会阻塞Redis
+        
+        参数:
+            complete_only: 只返回已完成的作品
+            batch_size: 每次SCAN的建议数量
+            
+        生成:
+            str: 作品ID
+        """
+        # 兼容期内记录已遍历的作品，旧格式键与作品哈希并存时不重复生成
+        seen: Optional[Set[str]] = set() if REDIS_CONFIG.read_legacy else None
+        batch: list[str] = []
+        for key in self._redis.scan_iter(match=RedisKeys.WORK.format(pid='*'), count=batch_size):
+            pid = key.split(':', 1)[1]
+            if seen is not None:
+                if pid in seen:
+                    continue
+                seen.add(pid)
+            if not complete_only:
+                yield pid
+                continue
+            batch.append(pid)
+            if len(batch) >= batch_size:
+                yield from (pid for pid, done in self.get_works_complete(batch).items() if done)
+                batch = []
+        if batch:
+            yield from (pid for pid, done in self.get_works_complete(batch).items() if done)
+            
+        # 兼容期内尚未迁移的旧格式作品，作品哈希中已判断过的作品跳过
+        if seen is not None:
+            if complete_only:
+                pattern, regex, value = RedisKeys.DOWNLOADED_WORK.format(pid='*'), _LEGACY_WORK, 'complete'
+            else:
+                pattern, regex, value = RedisKeys.DOWNLOADED_IMAGE.format(pid='*', page='0'), _LEGACY_IMAGE, 'true'
+            for match in self._scan_legacy(pattern, regex, value, batch_size):
+                pid = match.group(1)
+                if pid not in seen:
+                    seen.add(pid)
+                    yield pid
+
+    def _scan_legacy(
+        self,
+        pattern: str,
+        regex: 're.Pattern[str]',
+        value: str,
+        batch_size: int
+    ) -> Iterator['re.Match[str]']:
+        """
+        使用SCAN遍历旧格式键，每批用MGET读取值，只生成值为value的键
+        
+        参数:
+            pattern: SCAN匹配模式
+            regex: 旧格式键的正则
+            value: 有效记录的值('true' / 'complete')
+            batch_size: 每批读取的键数量
+            
+        生成:
+            Match: 旧格式键的匹配结果，SCAN重复返回的键只生成一次
+        """
+        def check(keys: list[str]) -> Iterator['re.Match[str]']:
+            for key, current in zip(keys, self._redis.mget(keys)):
+                if current == value:
+                    yield regex.match(key)
+
+        seen: Set[str] = set()
+        batch: list[str] = []
+        for key in self._redis.scan_iter(match=pattern, count=batch_size):
+            if key in seen or not regex.match(key):
+                continue
+            seen.add(key)
+            batch.append(key)
+            if len(batch) >= batch_size:
+                yield from check(batch)
+                batch = []
+        if batch:
+            yield from check(batch)
+
+    def iter_downloaded_pages(self, batch_size: int = 500) -> Iterator[tuple[str, Set[int]]]:
+        """
+        使用SCAN增量遍历每个作品已下载的页
+        
+        参数:
+            batch_size: 每批读取的作品数量
+            
+        生成:
+            tuple: (作品ID, 已下载页码集合)，只包含至少有一页已下载的作品
+        """
+        def read(keys: list[str]) -> Iterator[tuple[str, Set[int]]]:
+            pipe = self._redis.pipeline(transaction=False)
+            for key in keys:
+                pipe.hkeys(key)
+            for key, fields in zip(keys, pipe.execute()):
+                pages = {int(m.group(1)) for m in map(PAGE_FIELD.match, fields) if m}
+                if pages:
+                    yield key.split(':', 1)[1], pages
+                    
+        batch: list[str] = []
+        for key in self._redis.scan_iter(match=RedisKeys.WORK.format(pid='*'), count=batch_size):
+            batch.append(key)
+            if len(batch) >= batch_size:
+                yield from read(batch)
+                batch = []
+        if batch:
+            yield from read(batch)
+            
+        # 兼容期内尚未迁移的旧格式图片记录
+        if REDIS_CONFIG.read_legacy:
+            pattern = RedisKeys.DOWNLOADED_IMAGE.format(pid='*', page='*')
+            for match in self._scan_legacy(pattern, _LEGACY_IMAGE, 'true', batch_size):
+                yield match.group(1), {int(match.group(2))}
+
+    def iter_work_states(self, batch_size: int = 500) -> Iterator[tuple[str, Dict[str, str]]]:
+        """
+        使用SCAN增量遍历作品状态哈希(不包含尚未迁移的旧格式键)
+        
+        参数:
+            batch_size: 每批读取的作品数量
+            
+        生成:
+            tuple: (作品ID, 状态字段字典)
+        """
+        def read(keys: list[str]) -> Iterator[tuple[str, Dict[str, str]]]:
+            pipe = self._redis.pipeline(transaction=False)
+            for key in keys:
+                pipe.hgetall(key)
+            for key, state in zip(keys, pipe.execute()):
+                if state:
+                    yield key.split(':', 1)[1], state
+                    
+        batch: list[str] = []
+        for key in self._redis.scan_iter(match=RedisKeys.WORK.format(pid='*'), count=batch_size):
+            batch.append(key)
+            if len(batch) >= batch_size:
+                yield from read(batch)
+                batch = []
+        if batch:
+            yield from read(batch)
+
+    @timed('state')
+    def import_work_states(self, states: Iterable[tuple[str, Dict[str, str]]]) -> int:
+        """
+        写入一批作品状态(一次往返)，页和完成标记按首次写入递增计数
+        
+        参数:
+            states: (作品ID, 状态字段字典)
+            
+        返回:
+            int: 写入的作品数
+        """
+        pipe = self._redis.pipeline(transaction=False)
+        count = 0
+        for pid, fields in states:
+            plain = {}
+            for field, value in fields.items():
+                if field == RedisKeys.FIELD_COMPLETE:
+                    self._mark(pid, field, RedisKeys.STAT_WORKS, client=pipe)
+                elif PAGE_FIELD.match(field):
+                    self._mark(pid, field, RedisKeys.STAT_IMAGES, client=pipe)
+                else:
+                    plain[field] = value
+            if plain:
+                pipe.hset(self._work_key(pid), mapping=plain)
+            count += 1
+        pipe.execute()
+        return count
+
+    @timed('state')
+    def rebuild_stats(self, batch_size: int = 500) -> Dict[str, int]:
+        """
+        使用SCAN重新统计计数器(用于计数器缺失或迁移前的数据库)
+        
+        兼容期内同时统计旧格式键，作品哈希中已记录的作品和页不重复计数。
+        
+        参数:
+            batch_size: 每批读取的作品数量
+            
+        返回:
+            dict: 重建后的统计信息
+        """
+        works = images = 0
+        batch: list[str] = []
+
+        def count(keys: list[str]) -> tuple[int, int]:
+            pipe = self._redis.pipeline(transaction=False)
+            for key in keys:
+                pipe.hgetall(key)
+            done = pages = 0
+            for state in pipe.execute():
+                done += state.get(RedisKeys.FIELD_COMPLETE) == '1'
+                pages += sum(1 for field in state if PAGE_FIELD.match(field))
+            return done, pages
+
+        for key in self._redis.scan_iter(match=RedisKeys.WORK.format(pid='*'), count=batch_size):
+            batch.append(key)
+            if len(batch) >= batch_size:
+                done, pages = count(batch)
+                works, images = works + done, images + pages
+                batch = []
+        if batch:
+            done, pages = count(batch)
+            works, images = works + done, images + pages
+            
+        if REDIS_CONFIG.read_legacy:
+            legacy_works, legacy_images = self._count_legacy(batch_size)
+            works, images = works + legacy_works, images + legacy_images
+            
+        self._redis.hset(RedisKeys.STATS, mapping={
+            RedisKeys.STAT_WORKS: works,
+            RedisKeys.STAT_IMAGES: images
+        })
+        return {RedisKeys.STAT_WORKS: works, RedisKeys.STAT_IMAGES: images}
+
+    def _count_legacy(self, batch_size: int) -> tuple[int, int]:
+        """
+        统计尚未迁移的旧格式记录，作品哈希中已有的完成标记和页不计入
+        
+        返回:
+            tuple: (已完成作品数, 已下载图片数)
+        """
+        def count(pattern: str, regex: 're.Pattern[str]', value: str, field: Callable[['re.Match[str]'], str]) -> int:
+            def unrecorded(matches: list['re.Match[str]']) -> int:
+                pipe = self._redis.pipeline(transaction=False)
+                for match in matches:
+                    pipe.hget(self._work_key(match.group(1)), field(match))
+                return sum(1 for recorded in pipe.execute() if recorded != '1')
+
+            total = 0
+            batch: list['re.Match[str]'] = []
+            for match in self._scan_legacy(pattern, regex, value, batch_size):
+                batch.append(match)
+                if len(batch) >= batch_size:
+                    total += unrecorded(batch)
+                    batch = []
+            if batch:
+                total += unrecorded(batch)
+            return total
+
+        works = count(
+            RedisKeys.DOWNLOADED_WORK.format(pid='*'), _LEGACY_WORK, 'complete',
+            lambda match: RedisKeys.FIELD_COMPLETE
+        )
+        images = count(
+            RedisKeys.DOWNLOADED_IMAGE.format(pid='*', page='*'), _LEGACY_IMAGE, 'true',
+            lambda match: RedisKeys.FIELD_PAGE.format(page=match.group(2))
+        )
+        return works, images
+
+    @staticmethod
+    def _parse_legacy_key(key: str, value: Optional[str]) -> Optional[tuple[str, str, str]]:
+        """
+        将旧格式键值转换为作品状态哈希字段
+        
+        返回:
+            tuple: (作品ID, 字段, 值)，不是旧格式键时返回None
+        """
+        if value is None:
+            return None
+        match = _LEGACY_IMAGE.match(key)
+        if match:
+            pid, page = match.groups()
+            if value != 'true':
+                return None
+            return pid, RedisKeys.FIELD_PAGE.format(page=page), '1'
+        match = _LEGACY_WORK.match(key)
+        if match:
+            if value != 'complete':
+                return None
+            return match.group(1), RedisKeys.FIELD_COMPLETE, '1'
+        match = _LEGACY_TOTAL.match(key)
+        if match:
+            return match.group(1), RedisKeys.FIELD_TOTAL, value
+        if key.isdigit():
+            return key, RedisKeys.FIELD_USER, value
+        return None
+
+    def _migrate_batch(self, keys: list[str], skipped: Optional[list[str]] = None) -> int:
+        """
+        迁移一批旧格式键，写入新格式与删除旧键在同一事务中完成
+
+        只删除成功转换的键，无法识别的值(如非'true'的图片标记、非字符串类型)
+        原样保留，加入skipped。
+
+        返回:
+            int: 迁移的旧键数量
+        """
+        values = self._redis.mget(keys)
+        pipe = self._redis.pipeline(transaction=True)
+        converted = []
+        for key, value in zip(keys, values):
+            parsed = self._parse_legacy_key(key, value)
+            if not parsed:
+                if skipped is not None:
+                    skipped.append(key)
+                continue
+            pid, field, new_value = parsed
+            # 新格式已有值说明爬虫已写入更新的数据，不覆盖
+            if field == RedisKeys.FIELD_COMPLETE:
+                self._mark(pid, field, RedisKeys.STAT_WORKS, client=pipe)
+            elif PAGE_FIELD.match(field):
+                self._mark(pid, field, RedisKeys.STAT_IMAGES, client=pipe)
+            else:
+                pipe.hsetnx(self._work_key(pid), field, new_value)
+            converted.append(key)
+        if converted:
+            pipe.delete(*converted)
+            pipe.execute()
+        return len(converted)
+
+    @timed('state')
+    def migrate_legacy_keys(
+        self,
+        batch_size: int = 500,
+        on_batch: Optional[Callable[[int], None]] = None,
+        skipped: Optional[list[str]] = None
+    ) -> int:
+        """
+        将当前数据库的旧格式键分批迁移为作品状态哈希
+        
+        使用SCAN增量遍历，每批一个事务，可以在爬虫运行时执行。
+        
+        参数:
+            batch_size: 每批迁移的键数量
+            on_batch: 每批完成后的回调，参数为累计迁移数量
+            skipped: 传入列表时收集无法转换而保留的旧键
+            
+        返回:
+            int: 迁移的旧键数量
+        """
+        migrated = 0
+        batch: list[str] = []
+        for key in self._redis.scan_iter(count=batch_size):
+            if _is_legacy_key(key):
+                batch.append(key)
+            if len(batch) >= batch_size:
+                migrated += self._migrate_batch(batch, skipped)
+                batch = []
+                if on_batch:
+                    on_batch(migrated)
+        if batch:
+            migrated += self._migrate_batch(batch, skipped)
+            if on_batch:
+                on_batch(migrated)
+        return migrated
+
+    @timed('state')
+    def get_backfill_done(self) -> Set[str]:
+        """获取已完成回填的排行榜"""
+        return self._redis.smembers(RedisKeys.BACKFILL_DONE)
+
+    @timed('state')
+    def add_backfill_done(self, members: Iterable[str]) -> None:
+        """记录已完成回填的排行榜"""
+        self._redis.sadd(RedisKeys.BACKFILL_DONE, *members)
+
+    @timed('state')
+    def schedule_retries(self, causes: Dict[str, str]) -> Dict[str, int]:
+        """
+        记录失败作品，按指数退避安排重试，达到最大尝试次数的移入死信列表(一次往返)
+        
+        参数:
+            causes: 作品ID到失败原因的映射
+            
+        返回:
+            dict: 安排重试的作品数(scheduled)和移入死信列表的作品数(dead)
+        """
+        if not causes:
+            return {'scheduled': 0, 'dead': 0}
+        now = time.time()
+        pipe = self._redis.pipeline(transaction=False)
+        for pid, cause in causes.items():
+            self._retry_script(
+                keys=[RedisKeys.RETRY_DUE, RedisKeys.RETRY_INFO, RedisKeys.RETRY_DEAD],
+                args=[
+                    pid, cause, json.dumps(cause), now,
+                    RETRY_CONFIG.max_attempts,
+                    RETRY_CONFIG.backoff_base,
+                    RETRY_CONFIG.backoff_max,
+                    random.uniform(0.5, 1.0),
+                    RETRY_CONFIG.dead_letter_limit
+                ],
+                client=pipe
+            )
+        results = pipe.execute()
+        dead = results.count(0)
+        return {'scheduled': len(results) - dead, 'dead': dead}
+
+    @timed('state')
+    def due_retries(self, limit: Optional[int] = None) -> List[str]:
+        """
+        获取已到重试时间的作品，按到期时间先后排列
+        
+        参数:
+            limit: 最多返回的数量，默认全部
+        """
+        if limit:
+            return self._redis.zrangebyscore(RedisKeys.RETRY_DUE, '-inf', time.time(), start=0, num=limit)
+        return self._redis.zrangebyscore(RedisKeys.RETRY_DUE, '-inf', time.time())
+
+    @timed('state')
+    def clear_retries(self, pids: Iterable[str]) -> None:
+        """把已成功的作品移出重试队列"""
+        pids = list(pids)
+        if not pids:
+            return
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.zrem(RedisKeys.RETRY_DUE, *pids)
+        pipe.hdel(RedisKeys.RETRY_INFO, *pids)
+        pipe.execute()
+
+    @timed('state')
+    def get_retry_stats(self) -> Dict[str, int]:
+        """
+        获取重试队列统计
+        
+        返回:
+            dict: 等待重试(pending)、已到期(due)和死信(dead)的作品数
+        """
+        pipe = self._redis.pipeline(transaction=False)
+        pipe.zcard(RedisKeys.RETRY_DUE)
+        pipe.zcount(RedisKeys.RETRY_DUE, '-inf', time.time())
+        pipe.llen(RedisKeys.RETRY_DEAD)
+        pending, due, dead = pipe.execute()
+        return {'pending': pending, 'due': due, 'dead': dead}
+
+    @timed('state')
+    def get_dead_letters(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """获取最近移入死信列表的作品(作品ID、尝试次数、最后原因和时间)"""
+        return [json.loads(item) for item in self._redis.lrange(RedisKeys.RETRY_DEAD, 0, limit - 1)]
 
+    @timed('state')
     def clear_db(self) -> None:
-        """清空当前数据库"""
-        self._redis.flushdb()
+        """清空当前数据库(异步释放内存，不阻塞Redis)"""
+        self._redis.flushdb(asynchronous=True)
+        self._local_cache = None
 
     def close(self) -> None:
         """关闭所有连接池"""
@@ -5,8 +5,8 @@ from rich.console import Console
 from rich.table import Table
 from rich.prompt import Prompt, Confirm
 
-from redis_client import RedisClient
-from config import REDIS_CONFIG
+from state_backend import get_state_client
+from config import REDIS_CONFIG, RedisKeys
 
 console = Console()
 
@@ -15,7 +15,7 @@ class RedisMonitor:
     
     def __init__(self):
         """初始化监控器"""
-        self.redis = RedisClient()
+        self.redis = get_state_client()
         
     def _show_db_info(self, db_index: int) -> None:
         """
@@ -38,26 +38,64 @@ class RedisMonitor:
                 cookie[:30] + "..." if cookie else "未设置"
             )
             
-            # 作品统计
-            work_count, work_ids = self.redis.get_db_stats()
-            table.add_row("已下载作品数", str(work_count))
+            # 作品统计(计数器读取，不遍历键)
+            stats = self.redis.get_db_stats()
+            table.add_row("已下载作品数", str(stats[RedisKeys.STAT_WORKS]))
+            table.add_row("已下载图片数", str(stats[RedisKeys.STAT_IMAGES]))
+            downloaded = stats[RedisKeys.STAT_BYTES]
+            if downloaded:
+                stored = stats[RedisKeys.STAT_STORED]
+                table.add_row("已下载容量", f"{downloaded / 2**20:.1f} MiB")
+                table.add_row(
+                    "实际占用(去重后)",
+                    f"{stored / 2**20:.1f} MiB，节省 {1 - stored / downloaded:.1%}"
+                )
+            retries = self.redis.get_retry_stats()
+            table.add_row("待重试作品数", f"{retries['pending']}(已到期 {retries['due']})")
+            table.add_row("超过重试次数", str(retries['dead']))
+            table.add_row("键总数", str(self.redis.get_db_size()))
             
             console.print(table)
             
+            if Confirm.ask("是否重新统计计数器? (旧数据库或计数异常时使用)", default=False):
+                self.redis.rebuild_stats()
+                console.print("[green]计数器已重建[/green]")
+                
+            if Confirm.ask("是否导出作品ID列表?", default=False):
+                self._export_work_ids(db_index)
+            
         except Exception as e:
             console.print(f"[red]获取数据库信息时出错：{str(e)}[/red]")
             
+    def _export_work_ids(self, db_index: int) -> None:
+        """
+        使用SCAN流式导出已完成作品ID到文件
+        
+        参数:
+            db_index: 数据库编号
+        """
+        file_name = f"work_ids_db{db_index}.txt"
+        count = 0
+        with open(file_name, 'w', encoding='utf-8') as fp:
+            for work_id in self.redis.iter_work_ids(complete_only=True):
+                fp.write(f"{work_id}\n")
+                count += 1
+        console.print(f"[green]已导出 {count} 个作品ID到 {file_name}[/green]")
+        
+    def _get_active_dbs(self) -> list[int]:
+        """获取非空的数据库(DBSIZE为O(1)，可用于线上数据库)"""
+        active_dbs = []
+        min_db, max_db = REDIS_CONFIG.db_range
+        for db in range(min_db, max_db + 1):
+            if self.redis.select_db(db) and self.redis.get_db_size() > 0:
+                active_dbs.append(db)
+        return active_dbs
+        
     def show_status(self) -> None:
         """显示Redis状态和数据库信息"""
         try:
             # 获取活跃数据库
-            active_dbs = []
-            min_db, max_db = REDIS_CONFIG.db_range
-            for db in range(min_db, max_db + 1):
-                if self.redis.select_db(db):
-                    work_count, _ = self.redis.get_db_stats()
-                    if work_count > 0:
-                        active_dbs.append(db)
+            active_dbs = self._get_active_dbs()
                         
             if not active_dbs:
                 console.print("\n[yellow]当前没有活跃的数据库[/yellow]")
@@ -86,13 +124,8 @@ class RedisMonitor:
         """清空Redis数据库"""
         try:
             # 获取活跃数据库
-            active_dbs = []
+            active_dbs = self._get_active_dbs()
             min_db, max_db = REDIS_CONFIG.db_range
-            for db in range(min_db, max_db + 1):
-                if self.redis.select_db(db):
-                    work_count, _ = self.redis.get_db_stats()
-                    if work_count > 0:
-                        active_dbs.append(db)
                         
             if not active_dbs:
                 console.print("\n[yellow]当前没有活跃的数据库[/yellow]")
@@ -137,21 +170,48 @@ class RedisMonitor:
         except Exception as e:
             console.print(f"[red]清空数据库时出错：{str(e)}[/red]")
             
+    def migrate_layout(self) -> None:
+        """将旧格式键迁移为作品状态哈希"""
+        try:
+            min_db, max_db = REDIS_CONFIG.db_range
+            db = int(Prompt.ask(
+                "请选择要迁移的数据库编号",
+                choices=[str(db) for db in range(min_db, max_db + 1)]
+            ))
+            if not Confirm.ask(f"确定要迁移数据库 db{db} 吗? (可在爬虫运行时进行)"):
+                return
+                
+            self.redis.select_db(db)
+            skipped: list = []
+            migrated = self.redis.migrate_legacy_keys(
+                on_batch=lambda count: console.print(f"[cyan]已迁移 {count} 个键[/cyan]"),
+                skipped=skipped
+            )
+            console.print(f"[green]数据库 db{db} 迁移完成，共迁移 {migrated} 个旧格式键[/green]")
+            if skipped:
+                console.print(f"[yellow]{len(skipped)} 个键的值无法识别，已保留未迁移，例如：{', '.join(skipped[:5])}[/yellow]")
+            
+        except Exception as e:
+            console.print(f"[red]迁移数据库时出错：{str(e)}[/red]")
+            
     def run(self) -> None:
         """运行监控界面"""
         while True:
             console.print("\n=== Redis管理工具 ===")
             console.print("1. 显示状态")
             console.print("2. 清空数据库")
-            console.print("3. 退出")
+            console.print("3. 迁移旧数据格式")
+            console.print("4. 退出")
             
             try:
-                choice = Prompt.ask("请选择操作", choices=["1", "2", "3"])
+                choice = Prompt.ask("请选择操作", choices=["1", "2", "3", "4"])
                 
                 if choice == "1":
                     self.show_status()
                 elif choice == "2":
                     self.clear_database()
+                elif choice == "3":
+                    self.migrate_layout()
                 else:
                     break
                     
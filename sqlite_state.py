@@ -0,0 +1,691 @@
+"""SQLite下载状态存储：单机使用时代替Redis，接口与RedisClient一致"""
+import os
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Set
+
+from config import REDIS_CONFIG, RETRY_CONFIG, STATE_CONFIG, RedisKeys
+from metrics import timed
+from state_backend import sqlite_path
+from state_codec import PAGE_FIELD, decode_urls, encode_urls
+
+# 作品状态与Redis的作品哈希一一对应，(pid, field)主键即查询索引；
+# 键值表存放cookie和带过期时间的元数据缓存，集合表存放回填断点等集合；
+# 重试表按到期时间索引，对应Redis的重试有序集合
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS work_fields (
+    pid INTEGER NOT NULL,
+    field TEXT NOT NULL,
+    value TEXT NOT NULL,
+    PRIMARY KEY (pid, field)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS kv (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    expires REAL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS sets (
+    name TEXT NOT NULL,
+    member TEXT NOT NULL,
+    PRIMARY KEY (name, member)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS stats (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS retries (
+    pid INTEGER PRIMARY KEY,
+    due REAL NOT NULL,
+    attempts INTEGER NOT NULL,
+    cause TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS retries_due ON retries (due);
+CREATE TABLE IF NOT EXISTS dead_letters (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    pid INTEGER NOT NULL,
+    attempts INTEGER NOT NULL,
+    cause TEXT NOT NULL,
+    ts REAL NOT NULL
+);
+"""
+
+# 单条SQL中IN列表的最大参数数
+_MAX_PARAMS = 500
+
+
+class SqliteStateClient:
+    """
+    SQLite状态存储，使用与RedisClient相同的方法
+
+    每个数据库编号对应一个文件，WAL模式下读取不阻塞写入；
+    每个线程使用独立连接，每次写入或批量写入为一个事务。
+    分布式任务队列依赖Redis Streams，不支持此后端。
+    """
+    _instance: Optional['SqliteStateClient'] = None
+
+    def __new__(cls) -> 'SqliteStateClient':
+        """确保单例"""
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def __init__(self):
+        """初始化状态存储"""
+        if not hasattr(self, '_initialized'):
+            self._initialized = True
+            self._current_db = REDIS_CONFIG.db_range[0]
+            self._local = threading.local()
+            self._connections: List[sqlite3.Connection] = []
+            self._connections_lock = threading.Lock()
+            self._prepared: Set[str] = set()
+
+    @property
+    def path(self) -> str:
+        """当前数据库文件路径"""
+        return sqlite_path(self._current_db)
+
+    def _conn(self) -> sqlite3.Connection:
+        """获取当前线程、当前数据库的连接，首次使用时建表"""
+        path = self.path
+        connections = getattr(self._local, 'connections', None)
+        if connections is None:
+            connections = self._local.connections = {}
+        conn = connections.get(path)
+        if conn is None:
+            os.makedirs(STATE_CONFIG.sqlite_dir, exist_ok=True)
+            # 自行管理事务；连接只在本线程使用，关闭时由其他线程统一关闭
+            conn = sqlite3.connect(
+                path,
+                timeout=STATE_CONFIG.sqlite_timeout,
+                isolation_level=None,
+                check_same_thread=False
+            )
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            with self._connections_lock:
+                if path not in self._prepared:
+                    conn.executescript(_SCHEMA)
+                    conn.execute('DELETE FROM kv WHERE expires < ?', (time.time(),))
+                    self._prepared.add(path)
+                self._connections.append(conn)
+            connections[path] = conn
+        return conn
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """写事务，开始时即获取写锁，避免读后升级写锁时的死锁"""
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    def select_db(self, db: int) -> bool:
+        """
+        切换数据库(文件在首次读写时创建)
+
+        参数:
+            db: 数据库编号
+
+        返回:
+            bool: 编号是否有效
+        """
+        min_db, max_db = REDIS_CONFIG.db_range
+        if not min_db <= db <= max_db:
+            return False
+        self._current_db = db
+        return True
+
+    @property
+    def client(self):
+        """SQLite后端没有Redis连接"""
+        raise RuntimeError('分布式任务队列需要Redis后端')
+
+    def enable_local_cache(self, *args, **kwargs) -> None:
+        """本地查询已在进程内完成，无需去重缓存"""
+        return None
+
+    @staticmethod
+    def _incr(conn: sqlite3.Connection, name: str, value: int) -> None:
+        conn.execute(
+            'INSERT INTO stats (name, value) VALUES (?, ?) '
+            'ON CONFLICT (name) DO UPDATE SET value = value + excluded.value',
+            (name, value)
+        )
+
+    @staticmethod
+    def _set_field(conn: sqlite3.Connection, pid: str, field: str, value: str) -> None:
+        conn.execute('INSERT OR REPLACE INTO work_fields VALUES (?, ?, ?)', (int(pid), field, value))
+
+    def _mark(
+        self,
+        conn: sqlite3.Connection,
+        pid: str,
+        field: str,
+        counter: str,
+        increments: Optional[Dict[str, int]] = None
+    ) -> bool:
+        """写入作品状态字段，首次写入时递增对应统计计数"""
+        added = conn.execute(
+            "INSERT OR IGNORE INTO work_fields VALUES (?, ?, '1')",
+            (int(pid), field)
+        ).rowcount == 1
+        if added:
+            self._incr(conn, counter, 1)
+            for name, value in (increments or {}).items():
+                self._incr(conn, name, value)
+        return added
+
+    def _get_field(self, pid: str, field: str) -> Optional[str]:
+        row = self._conn().execute(
+            'SELECT value FROM work_fields WHERE pid = ? AND field = ?',
+            (int(pid), field)
+        ).fetchone()
+        return row[0] if row else None
+
+    @timed('state')
+    def get_cookie(self) -> Optional[str]:
+        """获取cookie"""
+        row = self._conn().execute('SELECT value FROM kv WHERE key = ?', (RedisKeys.COOKIE,)).fetchone()
+        return row[0] if row else None
+
+    @timed('state')
+    def set_cookie(self, cookie: str) -> None:
+        """设置cookie"""
+        with self._transaction() as conn:
+            conn.execute('INSERT OR REPLACE INTO kv VALUES (?, ?, NULL)', (RedisKeys.COOKIE, cookie))
+
+    @timed('state')
+    def is_image_downloaded(self, pid: str, page: int) -> bool:
+        """检查特定图片页是否已下载"""
+        return self._get_field(pid, RedisKeys.FIELD_PAGE.format(page=page)) == '1'
+
+    @timed('state')
+    def mark_image_downloaded(
+        self,
+        pid: str,
+        page: int,
+        size: Optional[int] = None,
+        stored: Optional[int] = None
+    ) -> None:
+        """
+        标记特定图片页为已下载
+
+        参数:
+            pid: 作品ID
+            page: 页码
+            size: 图片字节数，计入下载总量
+            stored: 实际新占用的字节数(内容重复时为0)
+        """
+        increments = None
+        if size is not None:
+            increments = {
+                RedisKeys.STAT_BYTES: size,
+                RedisKeys.STAT_STORED: size if stored is None else stored
+            }
+        with self._transaction() as conn:
+            self._mark(conn, pid, RedisKeys.FIELD_PAGE.format(page=page), RedisKeys.STAT_IMAGES, increments)
+
+    @timed('state')
+    def mark_images_downloaded(self, pages: Iterable[tuple[str, int, int, bool]]) -> int:
+        """
+        批量标记图片页为已下载(一个事务)
+
+        参数:
+            pages: (作品ID, 页码, 字节数, 是否独占存储)
+
+        返回:
+            int: 新标记的页数
+        """
+        added = 0
+        with self._transaction() as conn:
+            for pid, page, size, unique in pages:
+                added += self._mark(
+                    conn,
+                    pid,
+                    RedisKeys.FIELD_PAGE.format(page=page),
+                    RedisKeys.STAT_IMAGES,
+                    {RedisKeys.STAT_BYTES: size, RedisKeys.STAT_STORED: size if unique else 0}
+                )
+        return added
+
+    @timed('state')
+    def unmark_images(self, pages: Iterable[tuple[str, int]]) -> int:
+        """
+        批量撤销图片页的已下载标记，作品的完成标记一并撤销(一个事务)
+
+        返回:
+            int: 撤销的页数
+        """
+        removed = 0
+        with self._transaction() as conn:
+            for pid, page in pages:
+                for field, counter in (
+                    (RedisKeys.FIELD_PAGE.format(page=page), RedisKeys.STAT_IMAGES),
+                    (RedisKeys.FIELD_COMPLETE, RedisKeys.STAT_WORKS)
+                ):
+                    deleted = conn.execute(
+                        'DELETE FROM work_fields WHERE pid = ? AND field = ?',
+                        (int(pid), field)
+                    ).rowcount
+                    if deleted:
+                        self._incr(conn, counter, -1)
+                        removed += counter == RedisKeys.STAT_IMAGES
+        return removed
+
+    @timed('state')
+    def is_work_complete(self, pid: str) -> bool:
+        """检查作品是否已完全下载"""
+        return self._get_field(pid, RedisKeys.FIELD_COMPLETE) == '1'
+
+    @timed('state')
+    def mark_work_complete(self, pid: str) -> None:
+        """标记作品为已完全下载"""
+        with self._transaction() as conn:
+            self._mark(conn, pid, RedisKeys.FIELD_COMPLETE, RedisKeys.STAT_WORKS)
+
+    @timed('state')
+    def get_total_pages(self, pid: str) -> Optional[int]:
+        """获取作品总页数"""
+        value = self._get_field(pid, RedisKeys.FIELD_TOTAL)
+        return int(value) if value else None
+
+    @timed('state')
+    def set_total_pages(self, pid: str, total: int) -> None:
+        """设置作品总页数"""
+        with self._transaction() as conn:
+            self._set_field(conn, pid, RedisKeys.FIELD_TOTAL, str(total))
+
+    @timed('state')
+    def set_work_fields(self, pid: str, fields: Dict[str, str]) -> None:
+        """写入作品状态的附加字段(如后处理结果)，不影响统计计数"""
+        with self._transaction() as conn:
+            for field, value in fields.items():
+                self._set_field(conn, pid, field, value)
+
+    @timed('state')
+    def get_cached_urls(self, pid: str) -> Optional[list[Optional[str]]]:
+        """获取缓存的作品原图URL列表，未缓存或已过期返回None"""
+        row = self._conn().execute(
+            'SELECT value FROM kv WHERE key = ? AND (expires IS NULL OR expires > ?)',
+            (RedisKeys.META.format(pid=pid), time.time())
+        ).fetchone()
+        return decode_urls(pid, row[0]) if row else None
+
+    @timed('state')
+    def cache_urls(self, pid: str, urls: list[Optional[str]], ttl: int) -> None:
+        """
+        缓存作品原图URL列表并记录总页数(一个事务)
+
+        参数:
+            pid: 作品ID
+            urls: 每页的原图URL
+            ttl: 缓存时间(秒)，0为只记录总页数
+        """
+        with self._transaction() as conn:
+            if ttl > 0:
+                conn.execute(
+                    'INSERT OR REPLACE INTO kv VALUES (?, ?, ?)',
+                    (RedisKeys.META.format(pid=pid), encode_urls(pid, urls), time.time() + ttl)
+                )
+            self._set_field(conn, pid, RedisKeys.FIELD_TOTAL, str(len(urls)))
+
+    @timed('state')
+    def get_user_id(self, illust_id: str) -> Optional[str]:
+        """获取作品作者ID"""
+        return self._get_field(illust_id, RedisKeys.FIELD_USER)
+
+    @timed('state')
+    def store_user_id(self, illust_id: str, user_id: str) -> None:
+        """存储作品作者ID"""
+        with self._transaction() as conn:
+            self._set_field(conn, illust_id, RedisKeys.FIELD_USER, user_id)
+
+    @timed('state')
+    def delete_user_id(self, illust_id: str) -> None:
+        """删除作品作者ID"""
+        with self._transaction() as conn:
+            conn.execute(
+                'DELETE FROM work_fields WHERE pid = ? AND field = ?',
+                (int(illust_id), RedisKeys.FIELD_USER)
+            )
+
+    def _complete_pids(self, conn: sqlite3.Connection, pids: List[str]) -> Set[str]:
+        """查询一批作品中已完成的作品"""
+        complete: Set[str] = set()
+        for start in range(0, len(pids), _MAX_PARAMS):
+            chunk = [int(pid) for pid in pids[start:start + _MAX_PARAMS]]
+            rows = conn.execute(
+                f"SELECT pid FROM work_fields WHERE field = ? AND value = '1' "
+                f"AND pid IN ({','.join('?' * len(chunk))})",
+                (RedisKeys.FIELD_COMPLETE, *chunk)
+            )
+            complete.update(str(pid) for pid, in rows)
+        return complete
+
+    @timed('state')
+    def sync_ranking_works(self, user_ids: Dict[str, str]) -> Dict[str, bool]:
+        """
+        批量写入作者ID并查询作品完成状态(一个事务)
+
+        参数:
+            user_ids: 作品ID到作者ID的映射
+
+        返回:
+            dict: 作品ID到是否已完成的映射(保持输入顺序)
+        """
+        if not user_ids:
+            return {}
+        with self._transaction() as conn:
+            conn.executemany(
+                'INSERT OR REPLACE INTO work_fields VALUES (?, ?, ?)',
+                [(int(pid), RedisKeys.FIELD_USER, user_id) for pid, user_id in user_ids.items()]
+            )
+            complete = self._complete_pids(conn, list(user_ids))
+        return {pid: pid in complete for pid in user_ids}
+
+    @timed('state')
+    def get_works_complete(self, pids: Iterable[str]) -> Dict[str, bool]:
+        """批量检查作品是否已完全下载"""
+        order = list(pids)
+        complete = self._complete_pids(self._conn(), order)
+        return {pid: pid in complete for pid in order}
+
+    @timed('state')
+    def get_downloaded_pages(self, pid: str, total: int) -> Set[int]:
+        """
+        批量查询作品已下载的页
+
+        参数:
+            pid: 作品ID
+            total: 作品总页数
+
+        返回:
+            set: 已下载的页码
+        """
+        rows = self._conn().execute(
+            "SELECT field FROM work_fields WHERE pid = ? AND field GLOB 'p[0-9]*' AND value = '1'",
+            (int(pid),)
+        )
+        pages = {int(m.group(1)) for m in (PAGE_FIELD.match(field) for field, in rows) if m}
+        return {page for page in pages if page < total}
+
+    @timed('state')
+    def complete_work(self, pid: str, total: int) -> None:
+        """记录作品总页数并标记作品完成(一个事务)"""
+        with self._transaction() as conn:
+            self._mark(conn, pid, RedisKeys.FIELD_COMPLETE, RedisKeys.STAT_WORKS)
+            self._set_field(conn, pid, RedisKeys.FIELD_TOTAL, str(total))
+
+    @timed('state')
+    def get_db_stats(self) -> Dict[str, int]:
+        """
+        获取当前数据库统计信息
+
+        返回:
+            dict: 已完成作品数(works)、已下载图片数(images)、下载字节数(bytes)和实际占用字节数(stored)
+        """
+        stats = dict(self._conn().execute('SELECT name, value FROM stats'))
+        return {
+            name: int(stats.get(name, 0))
+            for name in (
+                RedisKeys.STAT_WORKS,
+                RedisKeys.STAT_IMAGES,
+                RedisKeys.STAT_BYTES,
+                RedisKeys.STAT_STORED
+            )
+        }
+
+    @timed('state')
+    def increment_stats(self, values: Dict[str, int]) -> None:
+        """累加统计计数(导入数据时使用)"""
+        with self._transaction() as conn:
+            for name, value in values.items():
+                self._incr(conn, name, value)
+
+    @timed('state')
+    def get_db_size(self) -> int:
+        """获取当前数据库的条目数量(作品数 + 键值数 + 集合数)，对应Redis的键数量"""
+        if not os.path.exists(self.path):
+            return 0
+        row = self._conn().execute(
+            'SELECT (SELECT COUNT(DISTINCT pid) FROM work_fields)'
+            ' + (SELECT COUNT(*) FROM kv)'
+            ' + (SELECT COUNT(DISTINCT name) FROM sets)'
+        ).fetchone()
+        return row[0]
+
+    def iter_work_states(self, batch_size: int = 500) -> Iterator[tuple[str, Dict[str, str]]]:
+        """
+        按作品ID顺序分批遍历作品状态，每批一次查询，不持有长事务
+
+        参数:
+            batch_size: 每批读取的作品数量
+
+        生成:
+            tuple: (作品ID, 状态字段字典)
+        """
+        conn = self._conn()
+        last = -1
+        while True:
+            pids = [pid for pid, in conn.execute(
+                'SELECT DISTINCT pid FROM work_fields WHERE pid > ? ORDER BY pid LIMIT ?',
+                (last, batch_size)
+            )]
+            if not pids:
+                return
+            states: Dict[int, Dict[str, str]] = {pid: {} for pid in pids}
+            rows = conn.execute(
+                'SELECT pid, field, value FROM work_fields WHERE pid BETWEEN ? AND ?',
+                (pids[0], pids[-1])
+            )
+            for pid, field, value in rows:
+                states[pid][field] = value
+            for pid in pids:
+                yield str(pid), states[pid]
+            last = pids[-1]
+
+    def iter_work_ids(self, complete_only: bool = False, batch_size: int = 500) -> Iterator[str]:
+        """
+        分批遍历当前数据库的作品ID
+
+        参数:
+            complete_only: 只返回已完成的作品
+            batch_size: 每批读取的作品数量
+
+        生成:
+            str: 作品ID
+        """
+        for pid, state in self.iter_work_states(batch_size):
+            if not complete_only or state.get(RedisKeys.FIELD_COMPLETE) == '1':
+                yield pid
+
+    def iter_downloaded_pages(self, batch_size: int = 500) -> Iterator[tuple[str, Set[int]]]:
+        """
+        分批遍历每个作品已下载的页
+
+        生成:
+            tuple: (作品ID, 已下载页码集合)，只包含至少有一页已下载的作品
+        """
+        for pid, state in self.iter_work_states(batch_size):
+            pages = {int(m.group(1)) for m in map(PAGE_FIELD.match, state) if m}
+            if pages:
+                yield pid, pages
+
+    @timed('state')
+    def import_work_states(self, states: Iterable[tuple[str, Dict[str, str]]]) -> int:
+        """
+        写入一批作品状态(一个事务)，页和完成标记按首次写入递增计数
+
+        参数:
+            states: (作品ID, 状态字段字典)
+
+        返回:
+            int: 写入的作品数
+        """
+        count = 0
+        with self._transaction() as conn:
+            for pid, fields in states:
+                for field, value in fields.items():
+                    if field == RedisKeys.FIELD_COMPLETE:
+                        self._mark(conn, pid, field, RedisKeys.STAT_WORKS)
+                    elif PAGE_FIELD.match(field):
+                        self._mark(conn, pid, field, RedisKeys.STAT_IMAGES)
+                    else:
+                        self._set_field(conn, pid, field, value)
+                count += 1
+        return count
+
+    @timed('state')
+    def rebuild_stats(self, batch_size: int = 500) -> Dict[str, int]:
+        """
+        重新统计计数器
+
+        返回:
+            dict: 重建后的统计信息
+        """
+        with self._transaction() as conn:
+            works, = conn.execute(
+                "SELECT COUNT(*) FROM work_fields WHERE field = ? AND value = '1'",
+                (RedisKeys.FIELD_COMPLETE,)
+            ).fetchone()
+            images, = conn.execute(
+                "SELECT COUNT(*) FROM work_fields WHERE field GLOB 'p[0-9]*' AND value = '1'"
+            ).fetchone()
+            conn.executemany(
+                'INSERT OR REPLACE INTO stats VALUES (?, ?)',
+                [(RedisKeys.STAT_WORKS, works), (RedisKeys.STAT_IMAGES, images)]
+            )
+        return {RedisKeys.STAT_WORKS: works, RedisKeys.STAT_IMAGES: images}
+
+    def migrate_legacy_keys(
+        self,
+        batch_size: int = 500,
+        on_batch: Optional[Callable[[int], None]] = None,
+        skipped: Optional[List[str]] = None
+    ) -> int:
+        """SQLite后端没有旧格式数据"""
+        return 0
+
+    @timed('state')
+    def get_backfill_done(self) -> Set[str]:
+        """获取已完成回填的排行榜"""
+        rows = self._conn().execute('SELECT member FROM sets WHERE name = ?', (RedisKeys.BACKFILL_DONE,))
+        return {member for member, in rows}
+
+    @timed('state')
+    def add_backfill_done(self, members: Iterable[str]) -> None:
+        """记录已完成回填的排行榜"""
+        with self._transaction() as conn:
+            conn.executemany(
+                'INSERT OR IGNORE INTO sets VALUES (?, ?)',
+                [(RedisKeys.BACKFILL_DONE, member) for member in members]
+            )
+
+    @timed('state')
+    def schedule_retries(self, causes: Dict[str, str]) -> Dict[str, int]:
+        """
+        记录失败作品，按指数退避安排重试，达到最大尝试次数的移入死信表(一个事务)
+
+        参数:
+            causes: 作品ID到失败原因的映射
+
+        返回:
+            dict: 安排重试的作品数(scheduled)和移入死信表的作品数(dead)
+        """
+        result = {'scheduled': 0, 'dead': 0}
+        if not causes:
+            return result
+        now = time.time()
+        with self._transaction() as conn:
+            for pid, cause in causes.items():
+                row = conn.execute('SELECT attempts FROM retries WHERE pid = ?', (int(pid),)).fetchone()
+                attempts = row[0] + 1 if row else 1
+                if attempts >= RETRY_CONFIG.max_attempts:
+                    conn.execute('DELETE FROM retries WHERE pid = ?', (int(pid),))
+                    conn.execute(
+                        'INSERT INTO dead_letters (pid, attempts, cause, ts) VALUES (?, ?, ?, ?)',
+                        (int(pid), attempts, cause, now)
+                    )
+                    result['dead'] += 1
+                    continue
+                delay = min(RETRY_CONFIG.backoff_max, RETRY_CONFIG.backoff_base * 2 ** (attempts - 1))
+                conn.execute(
+                    'INSERT OR REPLACE INTO retries VALUES (?, ?, ?, ?)',
+                    (int(pid), now + delay * random.uniform(0.5, 1.0), attempts, cause)
+                )
+                result['scheduled'] += 1
+            if result['dead']:
+                conn.execute(
+                    'DELETE FROM dead_letters WHERE id <= (SELECT MAX(id) FROM dead_letters) - ?',
+                    (RETRY_CONFIG.dead_letter_limit,)
+                )
+        return result
+
+    @timed('state')
+    def due_retries(self, limit: Optional[int] = None) -> List[str]:
+        """
+        获取已到重试时间的作品，按到期时间先后排列
+
+        参数:
+            limit: 最多返回的数量，默认全部
+        """
+        rows = self._conn().execute(
+            'SELECT pid FROM retries WHERE due <= ? ORDER BY due LIMIT ?',
+            (time.time(), limit or -1)
+        )
+        return [str(pid) for pid, in rows]
+
+    @timed('state')
+    def clear_retries(self, pids: Iterable[str]) -> None:
+        """把已成功的作品移出重试队列"""
+        with self._transaction() as conn:
+            conn.executemany('DELETE FROM retries WHERE pid = ?', [(int(pid),) for pid in pids])
+
+    @timed('state')
+    def get_retry_stats(self) -> Dict[str, int]:
+        """
+        获取重试队列统计
+
+        返回:
+            dict: 等待重试(pending)、已到期(due)和死信(dead)的作品数
+        """
+        pending, due, dead = self._conn().execute(
+            'SELECT (SELECT COUNT(*) FROM retries), (SELECT COUNT(*) FROM retries WHERE due <= ?),'
+            ' (SELECT COUNT(*) FROM dead_letters)',
+            (time.time(),)
+        ).fetchone()
+        return {'pending': pending, 'due': due, 'dead': dead}
+
+    @timed('state')
+    def get_dead_letters(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """获取最近移入死信表的作品(作品ID、尝试次数、最后原因和时间)"""
+        rows = self._conn().execute(
+            'SELECT pid, attempts, cause, ts FROM dead_letters ORDER BY id DESC LIMIT ?',
+            (limit,)
+        )
+        return [
+            {'pid': str(pid), 'attempts': attempts, 'cause': cause, 'ts': ts}
+            for pid, attempts, cause, ts in rows
+        ]
+
+    @timed('state')
+    def clear_db(self) -> None:
+        """清空当前数据库"""
+        with self._transaction() as conn:
+            for table in ('work_fields', 'kv', 'sets', 'stats', 'retries', 'dead_letters'):
+                conn.execute(f'DELETE FROM {table}')
+
+    def close(self) -> None:
+        """关闭所有连接"""
+        with self._connections_lock:
+            for conn in self._connections:
+                conn.close()
+            self._connections.clear()
+        self._local = threading.local()
@@ -0,0 +1,105 @@
+"""下载状态存储后端的选择，以及后端之间的导入导出"""
+import json
+import os
+from typing import Any, Dict, Iterable, Iterator, Optional, TextIO
+
+from config import STATE_CONFIG, RedisKeys
+
+# 支持的状态存储后端
+BACKENDS = ('redis', 'sqlite')
+
+# 导出文件中随作品状态一起迁移的统计计数(作品数和图片数由导入时重新累计)
+_CARRIED_STATS = (RedisKeys.STAT_BYTES, RedisKeys.STAT_STORED)
+
+
+def sqlite_path(db: int) -> str:
+    """SQLite后端中数据库编号对应的文件路径"""
+    return os.path.join(STATE_CONFIG.sqlite_dir, f"state_db{db}.sqlite")
+
+
+def get_state_client(backend: Optional[str] = None) -> Any:
+    """
+    获取状态存储客户端(单例)
+
+    参数:
+        backend: redis / sqlite，默认使用STATE_CONFIG
+
+    返回:
+        RedisClient或SqliteStateClient，两者方法一致
+    """
+    backend = backend or STATE_CONFIG.backend
+    if backend == 'redis':
+        from redis_client import RedisClient
+        return RedisClient()
+    if backend == 'sqlite':
+        from sqlite_state import SqliteStateClient
+        return SqliteStateClient()
+    raise ValueError(f"未知的状态存储后端: {backend}")
+
+
+def _batches(states: Iterable[Any], size: int) -> Iterator[list]:
+    batch = []
+    for state in states:
+        batch.append(state)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def export_state(client: Any, fp: TextIO) -> int:
+    """
+    把当前数据库的作品状态导出为JSON-lines
+
+    首行为统计计数，之后每行一个作品 {"pid": ..., "fields": {...}}。
+    cookie属于凭据，不导出。Redis后端需先迁移旧格式键。
+
+    参数:
+        client: 已选择数据库的状态存储客户端
+        fp: 输出文件
+
+    返回:
+        int: 导出的作品数
+    """
+    stats = client.get_db_stats()
+    fp.write(json.dumps({'stats': {name: stats[name] for name in _CARRIED_STATS}}) + '\n')
+    count = 0
+    for pid, fields in client.iter_work_states(STATE_CONFIG.batch_size):
+        fp.write(json.dumps({'pid': pid, 'fields': fields}, ensure_ascii=False, separators=(',', ':')) + '\n')
+        count += 1
+    return count
+
+
+def _read_records(fp: TextIO, stats: Dict[str, int]) -> Iterator[tuple]:
+    for line in fp:
+        if not line.strip():
+            continue
+        record = json.loads(line)
+        if 'stats' in record:
+            stats.update(record['stats'])
+        else:
+            yield record['pid'], record['fields']
+
+
+def import_state(client: Any, fp: TextIO) -> int:
+    """
+    从export_state的输出导入作品状态，每批一个事务(或一次往返)
+
+    已有的页和完成标记不会重复计数，字节统计直接累加，应导入到空数据库。
+
+    参数:
+        client: 已选择数据库的状态存储客户端
+        fp: 输入文件
+
+    返回:
+        int: 导入的作品数
+    """
+    stats: Dict[str, int] = {}
+    count = 0
+    for batch in _batches(_read_records(fp, stats), STATE_CONFIG.batch_size):
+        count += client.import_work_states(batch)
+    if any(stats.values()):
+        client.increment_stats(stats)
+    return count
+
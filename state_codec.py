@@ -0,0 +1,39 @@
+"""两种状态存储后端共用的字段格式与元数据编码(不依赖redis)"""
+import json
+import re
+from typing import Optional
+
+# 作品状态中的页字段
+PAGE_FIELD = re.compile(r'^p(\d+)$')
+
+# 原图URL：公共前缀 + {pid}_p{page}.{ext}
+_ORIGINAL_URL = re.compile(r'^(.*/)(\d+)_p(\d+)\.([a-z]+)$')
+
+
+def encode_urls(pid: str, urls: list[Optional[str]]) -> str:
+    """
+    压缩作品原图URL列表
+    
+    同一作品各页URL只有页码和扩展名不同，存为 "前缀|ext,ext,..."；
+    不符合该格式时退回JSON列表。
+    """
+    prefix = None
+    exts = []
+    for page, url in enumerate(urls):
+        match = _ORIGINAL_URL.match(url or '')
+        if not match or match.group(2) != pid or int(match.group(3)) != page:
+            return json.dumps(urls)
+        if prefix is None:
+            prefix = match.group(1)
+        elif match.group(1) != prefix:
+            return json.dumps(urls)
+        exts.append(match.group(4))
+    return f"{prefix}|{','.join(exts)}"
+
+
+def decode_urls(pid: str, value: str) -> list[Optional[str]]:
+    """解码encode_urls生成的URL列表"""
+    if value.startswith('['):
+        return json.loads(value)
+    prefix, exts = value.rsplit('|', 1)
+    return [f"{prefix}{pid}_p{page}.{ext}" for page, ext in enumerate(exts.split(','))]
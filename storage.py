@@ -0,0 +1,431 @@
+"""图片存储：目录分片布局与追加写入的清单索引"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+from config import DOWNLOAD_CONFIG
+
+# 支持的目录布局
+LAYOUTS = ('flat', 'id', 'date', 'user')
+
+# 按内容去重方式
+DEDUP_MODES = ('none', 'hardlink', 'manifest')
+
+# 按内容寻址的唯一副本目录(位于图片目录根部)，如 .blobs/ab/cd/abcd...
+BLOB_DIR = '.blobs'
+
+# 清单文件名(位于图片目录根部)
+MANIFEST_NAME = 'manifest.jsonl'
+
+# 图片文件名 {pid}_p{page}.{ext}
+IMAGE_NAME = re.compile(r'^(\d+)_p(\d+)\.([a-z]+)$')
+
+# 原图URL中的上传时间 /img/YYYY/MM/DD/
+_URL_DATE = re.compile(r'/img/(\d{4})/(\d{2})/(\d{2})/')
+
+# 无法确定分片时使用的目录
+_UNKNOWN = 'unknown'
+
+# 计算校验值时每次读取的字节数
+_HASH_CHUNK = 1024 * 1024
+
+
+@dataclass
+class ManifestEntry:
+    """清单记录：图片的相对路径、大小和SHA-256"""
+    pid: str
+    page: int
+    path: str
+    size: int
+    sha256: str
+
+
+def file_sha256(path: str, limit: Optional[int] = None) -> Any:
+    """
+    计算文件(或前limit字节)的SHA-256
+
+    返回:
+        hash对象，可继续update
+    """
+    digest = hashlib.sha256()
+    remaining = limit
+    with open(path, 'rb') as fp:
+        while remaining is None or remaining > 0:
+            chunk = fp.read(_HASH_CHUNK if remaining is None else min(_HASH_CHUNK, remaining))
+            if not chunk:
+                break
+            digest.update(chunk)
+            if remaining is not None:
+                remaining -= len(chunk)
+    return digest
+
+
+class Manifest:
+    """
+    追加写入的清单索引
+
+    每行一条JSON记录，同一页的后写记录覆盖先前记录，deleted记录表示移除，
+    layout记录表示目录布局(以最后一条为准)。打开时载入为按作品ID索引的
+    内存字典，按作品查询无需扫描目录。
+    """
+
+    def __init__(self, path: str):
+        """
+        打开清单并载入索引
+
+        参数:
+            path: 清单文件路径
+        """
+        self.path = path
+        self.layout: Optional[str] = None
+        self._index: Dict[str, Dict[int, ManifestEntry]] = {}
+        self._lock = threading.Lock()
+        self._count = 0
+        self._load()
+        self._fp = None
+
+    def _load(self) -> None:
+        """载入已有记录，忽略中断写入导致的不完整末行"""
+        try:
+            fp = open(self.path, encoding='utf-8')
+        except FileNotFoundError:
+            return
+        with fp:
+            for line in fp:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if 'layout' in record:
+                    self.layout = record['layout']
+                elif record.get('deleted'):
+                    self._discard(record['pid'], record['page'])
+                else:
+                    self._put(ManifestEntry(**record))
+
+    def _put(self, entry: ManifestEntry) -> None:
+        pages = self._index.setdefault(entry.pid, {})
+        if entry.page not in pages:
+            self._count += 1
+        pages[entry.page] = entry
+
+    def _discard(self, pid: str, page: int) -> None:
+        pages = self._index.get(pid)
+        if pages and pages.pop(page, None) is not None:
+            self._count -= 1
+            if not pages:
+                del self._index[pid]
+
+    def _append(self, record: dict) -> None:
+        """追加一行(调用方持有锁)"""
+        if self._fp is None:
+            self._fp = open(self.path, 'a', encoding='utf-8')
+        self._fp.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n')
+        self._fp.flush()
+        if DOWNLOAD_CONFIG.fsync_policy == 'full':
+            os.fsync(self._fp.fileno())
+
+    def set_layout(self, layout: str) -> None:
+        """记录目录布局(与当前记录相同时不写入)"""
+        with self._lock:
+            if self.layout != layout:
+                self._append({'layout': layout})
+                self.layout = layout
+
+    def add(self, entry: ManifestEntry) -> None:
+        """记录一张图片"""
+        with self._lock:
+            self._append(asdict(entry))
+            self._put(entry)
+
+    def remove(self, pid: str, page: int) -> None:
+        """移除一张图片的记录"""
+        with self._lock:
+            if page in self._index.get(pid, {}):
+                self._append({'pid': pid, 'page': page, 'deleted': True})
+                self._discard(pid, page)
+
+    def get(self, pid: str, page: int) -> Optional[ManifestEntry]:
+        """查询单页记录"""
+        return self._index.get(pid, {}).get(page)
+
+    def pages(self, pid: str) -> Dict[int, ManifestEntry]:
+        """查询作品所有页的记录"""
+        return dict(self._index.get(pid, {}))
+
+    def __iter__(self) -> Iterator[ManifestEntry]:
+        with self._lock:
+            entries = [entry for pages in self._index.values() for entry in pages.values()]
+        return iter(entries)
+
+    def __len__(self) -> int:
+        return self._count
+
+    def close(self) -> None:
+        """关闭清单文件"""
+        with self._lock:
+            if self._fp is not None:
+                self._fp.close()
+                self._fp = None
+
+
+class ImageStore:
+    """
+    图片目录
+
+    按布局把图片放入分片子目录：
+        flat: 全部位于根目录
+        id:   按作品ID每千个一组，如 120/456/120456789_p0.png
+        date: 按原图URL中的上传日期，如 2024/01/02/120456789_p0.png
+        user: 按作者ID，如 11/120456789_p0.png
+
+    使用的布局记录在清单中，之后未指定布局时沿用，指定的布局与记录不一致时
+    拒绝写入(需先用relayout迁移)。
+
+    启用按内容去重时，每个SHA-256只在 .blobs/ 下保存一份副本，
+    副本路径由哈希直接决定，文件系统本身即是哈希到副本的索引：
+        hardlink: 图片文件名作为副本的硬链接保留
+        manifest: 不保留图片文件名，清单记录指向副本
+    """
+
+    def __init__(self, root: str, layout: Optional[str] = None, dedup: str = 'none'):
+        """
+        初始化图片目录
+
+        参数:
+            root: 根目录
+            layout: 目录布局，None时使用清单中记录的布局(没有记录时为flat)
+            dedup: 按内容去重方式
+        """
+        if layout is not None and layout not in LAYOUTS:
+            raise ValueError(f"未知的目录布局: {layout}")
+        if dedup not in DEDUP_MODES:
+            raise ValueError(f"未知的去重方式: {dedup}")
+        self.root = root
+        self.dedup = dedup
+        self.manifest = Manifest(os.path.join(root, MANIFEST_NAME))
+        self.layout = layout or self.manifest.layout or 'flat'
+        self._dirs: set = set()
+        self._dirs_lock = threading.Lock()
+
+    def shard(self, pid: str, url: Optional[str] = None, user_id: Optional[str] = None) -> str:
+        """
+        计算作品所在的分片子目录
+
+        参数:
+            pid: 作品ID
+            url: 原图URL(date布局使用)
+            user_id: 作者ID(user布局使用)
+
+        返回:
+            str: 相对根目录的子目录，flat布局为空字符串
+        """
+        if self.layout == 'id':
+            value = int(pid)
+            return f"{value // 1_000_000:03d}/{value // 1000 % 1000:03d}"
+        if self.layout == 'date':
+            match = _URL_DATE.search(url or '')
+            return '/'.join(match.groups()) if match else _UNKNOWN
+        if self.layout == 'user':
+            return user_id or _UNKNOWN
+        return ''
+
+    def relative_path(
+        self,
+        file_name: str,
+        url: Optional[str] = None,
+        user_id: Optional[str] = None
+    ) -> str:
+        """图片相对根目录的路径"""
+        match = IMAGE_NAME.match(file_name)
+        shard = self.shard(match.group(1), url, user_id) if match else ''
+        return f"{shard}/{file_name}" if shard else file_name
+
+    def path(self, relative: str) -> str:
+        """相对路径转为实际路径"""
+        return os.path.join(self.root, *relative.split('/'))
+
+    def ensure_dir(self, relative: str) -> None:
+        """创建图片所在目录(已创建过的目录不再调用makedirs)"""
+        directory = os.path.dirname(self.path(relative))
+        if directory in self._dirs:
+            return
+        os.makedirs(directory, exist_ok=True)
+        with self._dirs_lock:
+            self._dirs.add(directory)
+
+    def check_layout(self) -> None:
+        """
+        检查布局与清单中记录的布局一致
+
+        异常:
+            ValueError: 图片目录已使用其他布局
+        """
+        recorded = self.manifest.layout
+        if recorded and recorded != self.layout:
+            raise ValueError(
+                f"图片目录 {self.root} 使用 {recorded} 布局，与指定的 {self.layout} 布局不一致，"
+                f"请去掉布局参数沿用 {recorded}，或先用 relayout 迁移"
+            )
+
+    @staticmethod
+    def blob_path(sha256: str) -> str:
+        """内容副本相对根目录的路径"""
+        return f"{BLOB_DIR}/{sha256[:2]}/{sha256[2:4]}/{sha256}"
+
+    def store_content(self, relative: str, sha256: str) -> Tuple[str, bool]:
+        """
+        按内容去重已落盘的图片
+
+        os.link在副本已存在时失败，借此原子地判断内容是否重复，
+        并发下载相同内容时只有一个线程成为副本的创建者。
+        文件系统不支持硬链接时保留原文件。
+
+        参数:
+            relative: 图片相对路径
+            sha256: 图片内容的SHA-256
+
+        返回:
+            tuple: (清单中记录的相对路径, 是否为新内容)
+        """
+        if self.dedup == 'none':
+            return relative, True
+        blob = self.blob_path(sha256)
+        path = self.path(relative)
+        self.ensure_dir(blob)
+        try:
+            os.link(path, self.path(blob))
+            is_new = True
+        except FileExistsError:
+            is_new = False
+        except OSError:
+            return relative, True
+
+        if self.dedup == 'manifest':
+            os.remove(path)
+            return blob, is_new
+        if not is_new:
+            # 用副本的硬链接原子替换刚下载的重复文件
+            temp_path = path + '.link'
+            try:
+                # 上次中断可能留下临时链接，不清理会让这一页每次重试都失败
+                os.remove(temp_path)
+            except FileNotFoundError:
+                pass
+            os.link(self.path(blob), temp_path)
+            os.replace(temp_path, path)
+        return relative, is_new
+
+    def record(self, pid: str, page: int, relative: str, size: int, sha256: str) -> None:
+        """把已落盘的图片写入清单，首次写入时记录布局"""
+        if self.manifest.layout != self.layout:
+            self.manifest.set_layout(self.layout)
+        self.manifest.add(ManifestEntry(pid, int(page), relative, size, sha256))
+
+    def find(self, pid: str, page: int) -> Optional[str]:
+        """按作品ID和页码查找图片路径，不扫描目录"""
+        entry = self.manifest.get(pid, int(page))
+        return self.path(entry.path) if entry else None
+
+    def migrate(
+        self,
+        source: Optional[str] = None,
+        workers: int = 8,
+        resolve: Optional[Callable[[str], Tuple[Optional[str], Optional[str]]]] = None,
+        on_progress: Optional[Callable[[int], None]] = None
+    ) -> Dict[str, float]:
+        """
+        把平铺目录中的图片并行移动到当前布局并写入清单
+
+        开始前先在清单中记录新布局，中断后重新运行会继续移动剩余文件。
+
+        参数:
+            source: 平铺目录，默认为根目录
+            workers: 并行线程数
+            resolve: 根据作品ID返回(原图URL, 作者ID)，date/user布局需要
+            on_progress: 每处理一个文件调用一次，参数为已处理数量
+
+        返回:
+            dict: 移动的文件数、字节数、耗时和每秒文件数
+
+        异常:
+            ValueError: 图片目录已使用flat以外的其他布局
+        """
+        recorded = self.manifest.layout
+        if recorded not in (None, 'flat', self.layout):
+            raise ValueError(f"图片目录 {self.root} 已使用 {recorded} 布局，只能从flat布局迁移")
+        self.manifest.set_layout(self.layout)
+        source = source or self.root
+        start = time.perf_counter()
+        done = 0
+        total_bytes = 0
+        resolved: Dict[str, Tuple[Optional[str], Optional[str]]] = {}
+
+        def move(entry: os.DirEntry) -> int:
+            pid, page, _ = IMAGE_NAME.match(entry.name).groups()
+            url = user_id = None
+            if resolve and self.layout in ('date', 'user'):
+                if pid not in resolved:
+                    resolved[pid] = resolve(pid)
+                url, user_id = resolved[pid]
+            relative = self.relative_path(entry.name, url, user_id)
+            size = entry.stat().st_size
+            digest = file_sha256(entry.path).hexdigest()
+            # 先写清单再移动，中断后重新运行会移动剩余文件并覆盖记录
+            self.record(pid, int(page), relative, size, digest)
+            self.ensure_dir(relative)
+            os.replace(entry.path, self.path(relative))
+            return size
+
+        with os.scandir(source) as entries:
+            images = [entry for entry in entries if entry.is_file() and IMAGE_NAME.match(entry.name)]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            for size in pool.map(move, images):
+                done += 1
+                total_bytes += size
+                if on_progress:
+                    on_progress(done)
+
+        elapsed = time.perf_counter() - start
+        return {
+            'files': done,
+            'bytes': total_bytes,
+            'seconds': round(elapsed, 3),
+            'files_per_sec': round(done / elapsed, 1) if elapsed else 0.0
+        }
+
+
+_stores: Dict[str, ImageStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(root: Optional[str] = None, layout: Optional[str] = None, check: bool = True) -> ImageStore:
+    """
+    获取图片目录实例(同一目录共享清单)
+
+    参数:
+        root: 根目录，默认使用下载配置
+        layout: 目录布局，默认使用下载配置，都未指定时沿用清单中记录的布局
+        check: 是否检查布局与清单中记录的一致(relayout迁移时为False)
+
+    异常:
+        ValueError: 指定的布局与图片目录已使用的布局不一致
+    """
+    root = os.path.abspath(root or DOWNLOAD_CONFIG.img_dir)
+    layout = layout or DOWNLOAD_CONFIG.layout
+    with _stores_lock:
+        store = _stores.get(root)
+        if store is None or (layout and store.layout != layout):
+            os.makedirs(root, exist_ok=True)
+            if store is not None:
+                store.manifest.close()
+            store = _stores[root] = ImageStore(root, layout, dedup=DOWNLOAD_CONFIG.dedup)
+    if check:
+        store.check_layout()
+    return store
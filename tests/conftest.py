@@ -0,0 +1,135 @@
+"""测试夹具：用fakeredis和临时目录替代真实的Redis与磁盘状态"""
+import threading
+from typing import Dict, List, Optional
+
+import fakeredis
+import pytest
+import redis
+
+import config
+from metrics import Metrics
+from redis_client import RedisClient
+from sqlite_state import SqliteStateClient
+
+
+@pytest.fixture
+def redis_state(monkeypatch):
+    """连接到内存中fakeredis服务器的RedisClient(数据库0)"""
+    server = fakeredis.FakeServer()
+
+    def fake_pool(**kwargs):
+        for key in ('host', 'port', 'max_connections'):
+            kwargs.pop(key, None)
+        return redis.ConnectionPool(connection_class=fakeredis.FakeRedisConnection, server=server, **kwargs)
+
+    monkeypatch.setattr(redis, 'BlockingConnectionPool', fake_pool)
+    monkeypatch.setattr(RedisClient, '_instance', None)
+    monkeypatch.setattr(RedisClient, '_pools', {})
+    client = RedisClient()
+    client.select_db(0)
+    yield client
+    client.close()
+
+
+@pytest.fixture
+def sqlite_state(monkeypatch, tmp_path):
+    """使用临时目录的SqliteStateClient(数据库0)"""
+    monkeypatch.setattr(config.STATE_CONFIG, 'sqlite_dir', str(tmp_path / 'state'))
+    monkeypatch.setattr(SqliteStateClient, '_instance', None)
+    client = SqliteStateClient()
+    client.select_db(0)
+    yield client
+    client.close()
+
+
+@pytest.fixture(params=['redis', 'sqlite'])
+def state(request):
+    """两种状态存储后端，用于检查行为一致"""
+    return request.getfixturevalue(f'{request.param}_state')
+
+
+@pytest.fixture
+def metrics():
+    """启用并清空的指标注册表，测试结束后恢复关闭"""
+    registry = Metrics()
+    registry.enable()
+    yield registry
+    registry.enabled = False
+
+
+class FakeProgress:
+    """只记录调用的进度条"""
+
+    def __init__(self):
+        self._next = 0
+        self.advanced: Dict[int, int] = {}
+
+    def add_task(self, *args, **kwargs) -> int:
+        self._next += 1
+        return self._next
+
+    def update(self, task_id: int, advance: int = 0, **kwargs) -> None:
+        self.advanced[task_id] = self.advanced.get(task_id, 0) + advance
+
+    def remove_task(self, task_id: int) -> None:
+        pass
+
+    def reset(self, task_id: int, **kwargs) -> None:
+        self.advanced[task_id] = 0
+
+
+class _FakeBudget:
+    def wait_available(self, timeout=None) -> bool:
+        return True
+
+    def describe(self) -> str:
+        return ''
+
+
+class _FakeHttp:
+    def describe_limits(self) -> str:
+        return ''
+
+
+class FakeDownloader:
+    """
+    流水线测试用的下载器
+
+    参数:
+        works: 作品ID到原图URL列表的映射
+        state: 状态存储客户端
+        fail_urls: 下载时抛出的异常 {URL: 异常}
+        fail_meta: 获取元数据时抛出的异常 {作品ID: 异常}
+    """
+
+    def __init__(self, works, state, fail_urls=None, fail_meta=None):
+        self.works = works
+        self.redis = state
+        self.fail_urls = fail_urls or {}
+        self.fail_meta = fail_meta or {}
+        self.http = _FakeHttp()
+        self.budget = _FakeBudget()
+        self.postprocess = None
+        self.downloaded: List[str] = []
+        self.completed: List[str] = []
+        self._lock = threading.Lock()
+
+    def get_image_urls(self, work_id: str) -> Optional[List[str]]:
+        if work_id in self.fail_meta:
+            raise self.fail_meta[work_id]
+        return self.works.get(work_id)
+
+    def last_failure(self) -> str:
+        return 'metadata:no_images'
+
+    def download_image(self, url: str, check_state: bool = True) -> bool:
+        if url in self.fail_urls:
+            raise self.fail_urls[url]
+        with self._lock:
+            self.downloaded.append(url)
+        return True
+
+    def complete_work(self, work_id: str, total: int) -> None:
+        with self._lock:
+            self.completed.append(work_id)
+        self.redis.complete_work(work_id, total)
@@ -0,0 +1,116 @@
+"""排行榜回填：页结束判断、跨日去重和断点"""
+from datetime import date
+
+import pytest
+import requests
+
+from backfill import RankingBackfill
+from config import BackfillConfig
+from tests.conftest import FakeDownloader, FakeProgress
+
+END = {'error': '指定されたページは存在しません'}
+
+
+def entry(pid, user='9'):
+    return {'illust_id': int(pid), 'user_id': int(user)}
+
+
+class FakeSpider:
+    """按(类型, 日期, 页码)返回预设响应的爬虫"""
+
+    def __init__(self, state, responses):
+        self.redis = state
+        self.responses = responses
+        self.progress = FakeProgress()
+        self.main_task_id = self.progress.add_task('total')
+        self.logs = []
+
+    def _update_log(self, message):
+        self.logs.append(message)
+
+    def fetch_ranking(self, page):
+        return {}
+
+    def get_ranking_data(self, page, mode='daily', date=None):
+        data = self.responses.get((mode, date, page), END)
+        if isinstance(data, Exception):
+            raise data
+        return data
+
+
+def make_backfill(state, responses, works=None):
+    spider = FakeSpider(state, responses)
+    downloader = FakeDownloader(works or {}, state)
+    return RankingBackfill(spider, downloader, BackfillConfig(max_pages=3, chunk_days=7)), downloader
+
+
+@pytest.mark.parametrize('page, response, expected', [
+    (1, {'contents': [entry(1)]}, [entry(1)]),
+    (2, END, []),
+    (1, END, None),  # 尚未发布或被拒绝，不能当作空排行榜
+    (1, {'message': 'rate limited'}, None),
+    (2, {'error': True, 'message': 'login required'}, None),
+    (2, requests.ConnectionError('reset'), None),
+])
+def test_fetch_page(redis_state, page, response, expected):
+    backfill, _ = make_backfill(redis_state, {('daily', '20240101', page): response})
+    assert backfill._fetch_page(('daily', '20240101'), page) == expected
+
+
+def test_run_dedups_and_checkpoints(redis_state):
+    responses = {
+        ('daily', '20240101', 1): {'contents': [entry(1), entry(2)]},
+        ('daily', '20240101', 2): {'contents': [entry(3)]},
+        ('daily', '20240102', 1): {'contents': [entry(2), entry(3), entry(4)]},
+        # 第1页被限流：不写入断点
+        ('daily', '20240103', 1): {'error': True, 'message': 'too many requests'},
+        # 20240104 第1页就没有contents(尚未发布)：不写入断点
+    }
+    works = {pid: [f'u/{pid}_p0'] for pid in '1234'}
+    backfill, downloader = make_backfill(redis_state, responses, works)
+
+    failed = backfill.run(date(2024, 1, 1), date(2024, 1, 4), ['daily'])
+
+    assert failed == []
+    assert sorted(downloader.downloaded) == ['u/1_p0', 'u/2_p0', 'u/3_p0', 'u/4_p0']
+    assert redis_state.get_backfill_done() == {'daily:20240101', 'daily:20240102'}
+    assert backfill.pending_rankings(date(2024, 1, 1), date(2024, 1, 4), ['daily']) == [
+        ('daily', '20240103'), ('daily', '20240104')
+    ]
+
+
+def test_run_skips_completed_works(redis_state):
+    redis_state.complete_work('1', 1)
+    responses = {('daily', '20240101', 1): {'contents': [entry(1), entry(2)]}}
+    backfill, downloader = make_backfill(redis_state, responses, {'1': ['u/1_p0'], '2': ['u/2_p0']})
+
+    backfill.run(date(2024, 1, 1), date(2024, 1, 1), ['daily'])
+
+    assert downloader.downloaded == ['u/2_p0']
+
+
+def test_failed_work_blocks_checkpoint(redis_state):
+    responses = {
+        ('daily', '20240101', 1): {'contents': [entry(1)]},
+        ('daily', '20240102', 1): {'contents': [entry(2)]},
+    }
+    backfill, _ = make_backfill(redis_state, responses, {'1': ['u/1_p0'], '2': ['u/2_p0']})
+    backfill.downloader.fail_urls['u/2_p0'] = OSError('disk full')
+
+    assert backfill.run(date(2024, 1, 1), date(2024, 1, 2), ['daily']) == ['2']
+    assert redis_state.get_backfill_done() == {'daily:20240101'}
+
+
+def test_publish_checkpoints_only_nonempty_rankings(redis_state):
+    from work_queue import WorkQueue
+
+    responses = {
+        ('daily', '20240101', 1): {'contents': [entry(1), entry(2)]},
+        ('daily', '20240102', 1): {'contents': [entry(2)]},
+    }
+    backfill, _ = make_backfill(redis_state, responses)
+
+    published = backfill.publish(date(2024, 1, 1), date(2024, 1, 3), ['daily'], WorkQueue(redis_state))
+
+    assert published == 2
+    assert redis_state.get_backfill_done() == {'daily:20240101', 'daily:20240102'}
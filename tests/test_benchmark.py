@@ -0,0 +1,51 @@
+"""基准测试：模拟服务、百分位数和回退判定"""
+import threading
+
+import pytest
+import requests
+
+from benchmark import StubConfig, _percentile, _StubServer, compare
+
+
+@pytest.fixture
+def stub():
+    server = _StubServer(StubConfig(latency_ms=0, image_kb=4, image_max_kb=16, multi_page_rate=0.5))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def test_stub_serves_deterministic_ranking(stub):
+    base = f'http://127.0.0.1:{stub.server_address[1]}'
+    first = requests.get(f'{base}/ranking.php?p=1&format=json').json()['contents']
+    assert len(first) == 50
+    assert 'error' in requests.get(f'{base}/ranking.php?p=11&format=json').json()
+
+    work_id = first[0]['illust_id']
+    pages = requests.get(f'{base}/ajax/illust/{work_id}/pages').json()['body']
+    assert len(pages) == stub.page_count(work_id)
+
+    path = pages[0]['urls']['original'].split(str(stub.server_address[1]), 1)[1]
+    image = requests.get(f'{base}{path}')
+    assert image.content == requests.get(f'{base}{path}').content
+    assert len(image.content) == stub.image_size(path)
+    assert stub.snapshot()['images'] == 2
+
+
+def test_percentile():
+    values = [float(v) for v in range(1, 101)]
+    assert _percentile([], 50) == 0.0
+    assert _percentile(values, 50) == 50.0
+    assert _percentile(values, 99) == 99.0
+    assert _percentile(values, 99.5) == 100.0
+    assert _percentile([1.0, 2.0, 3.0, 4.0], 50) == 2.0
+    assert _percentile([3.0], 99) == 3.0
+
+
+def test_compare_reports_regressions_only():
+    baseline = {'images_per_sec': 100.0, 'latency_p99_ms': 50.0, 'peak_rss_mb': 40.0}
+    result = {'images_per_sec': 85.0, 'latency_p99_ms': 40.0, 'peak_rss_mb': 43.0}
+    regressions = compare(result, baseline, tolerance=0.1)
+    assert len(regressions) == 1 and regressions[0].startswith('images_per_sec')
+    assert compare(result, {}, tolerance=0.1) == []
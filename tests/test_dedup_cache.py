@@ -0,0 +1,77 @@
+"""进程内去重缓存：布隆过滤器误判率与Redis客户端的缓存判定"""
+import pytest
+
+from config import RedisKeys
+from dedup_cache import BloomFilter, ExactSet, create_cache
+
+
+def test_bloom_has_no_false_negatives():
+    bloom = BloomFilter(10_000, 0.01)
+    pids = [str(120_000_000 + i * 7) for i in range(10_000)]
+    bloom.update(pids)
+    assert len(bloom) == 10_000
+    assert all(pid in bloom for pid in pids)
+
+
+@pytest.mark.parametrize('fp_rate', [0.01, 0.001])
+def test_bloom_false_positive_rate(fp_rate):
+    capacity = 20_000
+    bloom = BloomFilter(capacity, fp_rate)
+    bloom.update(str(100_000_000 + i) for i in range(capacity))
+    trials = 100_000
+    false_positives = sum(str(200_000_000 + i) in bloom for i in range(trials))
+    # 满容量时实际误判率应接近目标值，留出统计波动
+    assert false_positives / trials < fp_rate * 1.5
+
+
+def test_exact_set():
+    cache = ExactSet()
+    cache.update(['1', '2'])
+    cache.discard('2')
+    assert '1' in cache and '2' not in cache
+    assert len(cache) == 1
+
+
+def test_create_cache():
+    assert create_cache('none', 10, 0.01) is None
+    assert isinstance(create_cache('set', 10, 0.01), ExactSet)
+    assert isinstance(create_cache('bloom', 10, 0.01), BloomFilter)
+    with pytest.raises(ValueError):
+        create_cache('lru', 10, 0.01)
+
+
+@pytest.mark.parametrize('kind', ['set', 'bloom'])
+def test_redis_local_cache(redis_state, kind):
+    redis_state.complete_work('1', 1)
+    report = redis_state.enable_local_cache(kind, capacity=1000, fp_rate=0.01)
+    assert report['count'] == 1
+
+    assert redis_state.get_works_complete(['1', '2']) == {'1': True, '2': False}
+    # 本进程写入的完成状态同步进缓存
+    redis_state.complete_work('2', 1)
+    assert redis_state.get_works_complete(['2']) == {'2': True}
+    # 精确集合命中时不再访问Redis
+    if kind == 'set':
+        redis_state.client.delete(RedisKeys.WORK.format(pid='1'))
+        assert redis_state.get_works_complete(['1']) == {'1': True}
+
+
+@pytest.mark.parametrize('kind, expected', [
+    ('set', {'negative': 1, 'exact_hit': 1}),
+    ('bloom', {'negative': 1, 'confirm': 1}),
+])
+def test_local_cache_metric_labels(redis_state, metrics, kind, expected):
+    redis_state.complete_work('1', 1)
+    redis_state.enable_local_cache(kind, capacity=1000, fp_rate=0.001)
+    metrics.enable()
+    redis_state.get_works_complete(['1', '2'])
+    series = metrics.snapshot()['counters']['pixiv_cache_total']
+    assert {item['labels']['result']: item['value'] for item in series} == expected
+
+
+def test_reloading_cache_reads_redis(redis_state):
+    redis_state.enable_local_cache('set')
+    # 其他进程在缓存建立后完成的作品
+    redis_state.client.hset(RedisKeys.WORK.format(pid='7'), RedisKeys.FIELD_COMPLETE, '1')
+    assert redis_state.enable_local_cache('set')['count'] == 1
+    assert redis_state.is_work_complete('7')
@@ -0,0 +1,230 @@
+"""图片下载：元数据缓存、原子写入与断点续传、传输预算"""
+import hashlib
+import threading
+from contextlib import contextmanager
+
+import pytest
+import requests
+
+from config import DOWNLOAD_CONFIG, PIXIV_CONFIG, RedisKeys
+from metrics import Metrics
+from pixiv_download import IncompleteDownload, PixivDownloader, _range_matches
+from rate_control import TransferBudget
+
+
+class FakeResponse:
+    def __init__(self, body, status_code=200, headers=None):
+        self.body = body
+        self.status_code = status_code
+        self.headers = {'Content-Length': str(len(body)), **(headers or {})}
+
+    def iter_content(self, size):
+        for start in range(0, len(self.body), size):
+            yield self.body[start:start + size]
+
+
+class FakeHttp:
+    """记录响应打开和关闭，检查等待预算时没有打开的响应"""
+
+    def __init__(self, body):
+        self.body = body
+        self.open = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stream(self, url, headers=None, http2=False):
+        with self._lock:
+            self.open += 1
+            self.requests += 1
+        try:
+            yield FakeResponse(self.body)
+        finally:
+            with self._lock:
+                self.open -= 1
+
+
+def make_downloader(http, budget):
+    downloader = PixivDownloader.__new__(PixivDownloader)
+    downloader.headers = {}
+    downloader.http = http
+    downloader.http2 = False
+    downloader.budget = budget
+    downloader.metrics = Metrics()
+    downloader._failure = threading.local()
+    return downloader
+
+
+@pytest.fixture(autouse=True)
+def no_fsync(monkeypatch):
+    monkeypatch.setattr(DOWNLOAD_CONFIG, 'fsync_policy', 'none')
+
+
+def test_budget_wait_releases_response(tmp_path):
+    budget = TransferBudget(max_bytes=100, max_files=4)
+    http = FakeHttp(b'x' * 50)
+    downloader = make_downloader(http, budget)
+    budget.acquire(90)  # 其他下载占用的预算
+
+    result = {}
+    thread = threading.Thread(
+        target=lambda: result.update(value=downloader._fetch_to_file('u/1_p0.png', str(tmp_path / '1_p0.png'))),
+        daemon=True
+    )
+    thread.start()
+    # 等待预算时响应已关闭
+    thread.join(0.2)
+    assert thread.is_alive()
+    assert (http.requests, http.open) == (1, 0)
+
+    budget.release(90)
+    thread.join(2)
+    assert not thread.is_alive()
+    assert result['value'][0] == 50
+    assert (tmp_path / '1_p0.png').read_bytes() == b'x' * 50
+    assert http.requests == 2
+    assert (budget.bytes, budget.files) == (0, 0)
+
+
+def test_budget_released_on_error(tmp_path):
+    budget = TransferBudget(max_bytes=100, max_files=4)
+    http = FakeHttp(b'x' * 10)
+    downloader = make_downloader(http, budget)
+    with pytest.raises(FileNotFoundError):
+        downloader._fetch_to_file('u/1_p0.png', str(tmp_path / 'missing' / '1_p0.png'))
+    assert (budget.bytes, budget.files) == (0, 0)
+
+
+_MARKER = {'offset': 10, 'length': 100, 'etag': '"a"', 'last_modified': None}
+
+
+@pytest.mark.parametrize('headers, expected', [
+    ({'Content-Range': 'bytes 10-99/100', 'ETag': '"a"'}, True),
+    ({'Content-Range': 'bytes 10-99/100'}, True),
+    ({'Content-Range': 'bytes 0-99/100', 'ETag': '"a"'}, False),
+    ({'Content-Range': 'bytes 10-119/120', 'ETag': '"a"'}, False),
+    ({'Content-Range': 'bytes 10-99/100', 'ETag': '"b"'}, False),
+    ({'ETag': '"a"'}, False),
+    ({'Content-Range': 'bytes */100'}, False),
+])
+def test_range_matches(headers, expected):
+    assert _range_matches(FakeResponse(b'', 206, headers), _MARKER) is expected
+
+
+def test_range_matches_checks_last_modified():
+    marker = {**_MARKER, 'etag': None, 'last_modified': 'Mon, 01 Jan 2024 00:00:00 GMT'}
+    headers = {'Content-Range': 'bytes 10-99/100', 'Last-Modified': 'Tue, 02 Jan 2024 00:00:00 GMT'}
+    assert not _range_matches(FakeResponse(b'', 206, headers), marker)
+
+
+_URLS = [f'https://i.pximg.net/img-original/img/2024/01/01/00/00/00/12_p{page}.{ext}'
+         for page, ext in enumerate(['jpg', 'png', 'jpg'])]
+
+
+@pytest.mark.parametrize('urls', [_URLS, [_URLS[0], None]])
+def test_url_cache_roundtrip(state, urls):
+    assert state.get_cached_urls('12') is None
+    state.cache_urls('12', urls, 60)
+    assert state.get_cached_urls('12') == urls
+    assert state.get_total_pages('12') == len(urls)
+
+
+def test_url_cache_ttl_zero_only_records_total(state):
+    state.cache_urls('12', _URLS, 0)
+    assert state.get_cached_urls('12') is None
+    assert state.get_total_pages('12') == 3
+
+
+class FakeMetaHttp:
+    def __init__(self, body):
+        self.body = body
+        self.requests = 0
+
+    def get(self, url, **kwargs):
+        self.requests += 1
+        response = FakeResponse(b'')
+        response.json = lambda: self.body
+        return response
+
+
+def test_image_urls_are_cached(redis_state, metrics):
+    http = FakeMetaHttp({'error': False, 'body': [{'urls': {'original': url}} for url in _URLS]})
+    downloader = make_downloader(http, None)
+    downloader.redis = redis_state
+
+    assert downloader.get_image_urls('12') == _URLS
+    assert downloader.get_image_urls('12') == _URLS
+    assert http.requests == 1
+    results = {c['labels']['result']: c['value'] for c in metrics.snapshot()['counters']['pixiv_cache_total']}
+    assert results == {'hit': 1, 'miss': 1}
+    # URL按前缀和扩展名压缩存储
+    assert redis_state.client.get(RedisKeys.META.format(pid='12')).endswith('|jpg,png,jpg')
+    assert redis_state.client.ttl(RedisKeys.META.format(pid='12')) <= PIXIV_CONFIG.meta_cache_ttl
+
+
+class RangeHttp:
+    """支持Range/If-Range的服务端，可在指定字节数后断开"""
+
+    def __init__(self, body, etag='"a"', cut=None):
+        self.body = body
+        self.etag = etag
+        self.cut = cut
+        self.ranges = []
+
+    @contextmanager
+    def stream(self, url, headers=None, http2=False):
+        headers = headers or {}
+        start = 0
+        if 'Range' in headers and headers.get('If-Range') in (None, self.etag):
+            start = int(headers['Range'][len('bytes='):-1])
+        self.ranges.append(start)
+        body = self.body[start:]
+        response = FakeResponse(body, 206 if start else 200, {'Accept-Ranges': 'bytes', 'ETag': self.etag})
+        if start:
+            response.headers['Content-Range'] = f'bytes {start}-{len(self.body) - 1}/{len(self.body)}'
+        cut, self.cut = self.cut, None
+        if cut is not None:
+            def broken(size):
+                yield body[:cut]
+                raise requests.ConnectionError('reset')
+            response.iter_content = broken
+        yield response
+
+
+def test_interrupted_download_resumes(tmp_path):
+    body = bytes(range(100))
+    http = RangeHttp(body, cut=40)
+    downloader = make_downloader(http, TransferBudget(max_bytes=1000, max_files=4))
+    path = tmp_path / '1_p0.png'
+
+    with pytest.raises(IncompleteDownload):
+        downloader._fetch_to_file('u/1_p0.png', str(path))
+    # 目标文件只在完整写入后出现
+    assert not path.exists()
+    assert (tmp_path / '1_p0.png.part').stat().st_size == 40
+
+    assert downloader._fetch_to_file('u/1_p0.png', str(path)) == (100, hashlib.sha256(body).hexdigest())
+    assert http.ranges == [0, 40]
+    assert path.read_bytes() == body
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['1_p0.png']
+
+
+def test_changed_content_restarts_download(tmp_path):
+    http = RangeHttp(b'a' * 100, cut=40)
+    downloader = make_downloader(http, TransferBudget(max_bytes=1000, max_files=4))
+    path = tmp_path / '1_p0.png'
+    with pytest.raises(IncompleteDownload):
+        downloader._fetch_to_file('u/1_p0.png', str(path))
+
+    http.body, http.etag = b'b' * 80, '"b"'
+    assert downloader._fetch_to_file('u/1_p0.png', str(path))[0] == 80
+    assert path.read_bytes() == b'b' * 80
+
+
+def test_unresumable_partial_is_discarded(tmp_path):
+    http = RangeHttp(b'x' * 100, cut=40)
+    http.etag = None
+    downloader = make_downloader(http, TransferBudget(max_bytes=1000, max_files=4))
+    with pytest.raises(IncompleteDownload):
+        downloader._fetch_to_file('u/1_p0.png', str(tmp_path / '1_p0.png'))
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,58 @@
+"""无界面模式：JSON-lines事件输出与进度节流"""
+import io
+import json
+import threading
+
+from event_sink import EventSink
+
+
+def _events(stream):
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+def test_log_levels_and_markup():
+    stream = io.StringIO()
+    sink = EventSink(stream)
+    sink.log('[red]失败：[bold]1[/bold][/red]')
+    sink.log('[yellow]跳过[/yellow]')
+    sink.log('[cyan]开始[/cyan]')
+    sink.flush()
+    assert [(e['level'], e['message']) for e in _events(stream)] == [
+        ('error', '失败：1'), ('warning', '跳过'), ('info', '开始')
+    ]
+
+
+def test_progress_is_throttled_and_counts_all_advances():
+    stream = io.StringIO()
+    sink = EventSink(stream, progress_interval=3600)
+    main_task = sink.add_task('总进度', total=400)
+    sub_task = sink.add_task('作品1', total=3)
+
+    def advance():
+        for _ in range(100):
+            sink.update(main_task, advance=1)
+            sink.update(sub_task, advance=1)
+
+    threads = [threading.Thread(target=advance) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    sink.flush()
+
+    events = _events(stream)
+    assert all(e['event'] == 'progress' for e in events)
+    # 400次更新只输出最初的少数几次和flush，其余被节流
+    assert len(events) <= 5
+    assert (events[-1]['completed'], events[-1]['total']) == (400, 400)
+
+
+def test_reset_restarts_progress():
+    stream = io.StringIO()
+    sink = EventSink(stream)
+    task = sink.add_task('总进度', total=5)
+    sink.update(task, advance=1)
+    sink.reset(task, total=2)
+    sink.flush()
+    assert _events(stream)[-1]['completed'] == 0
+    assert _events(stream)[-1]['total'] == 2
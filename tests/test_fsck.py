@@ -0,0 +1,50 @@
+"""一致性检查：按磁盘补记时的实际占用统计"""
+import hashlib
+
+import pytest
+
+import storage
+from config import DOWNLOAD_CONFIG, RedisKeys
+from fsck import verify_store
+
+
+@pytest.fixture
+def img_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(storage, '_stores', {})
+    monkeypatch.setattr(DOWNLOAD_CONFIG, 'layout', None)
+    return tmp_path
+
+
+def download(store, name, data):
+    """模拟下载：写入文件后按内容去重"""
+    with open(store.path(name), 'wb') as fp:
+        fp.write(data)
+    store.store_content(name, hashlib.sha256(data).hexdigest())
+
+
+@pytest.mark.parametrize('dedup, stored', [('none', 4 + 6 + 6), ('hardlink', 4 + 6)])
+def test_repair_counts_shared_content_once(state, img_dir, monkeypatch, dedup, stored):
+    monkeypatch.setattr(DOWNLOAD_CONFIG, 'dedup', dedup)
+    store = storage.get_store(str(img_dir))
+    download(store, '1_p0.png', b'uniq')
+    download(store, '2_p0.png', b'shared')
+    download(store, '3_p0.png', b'shared')
+
+    report = verify_store(state, str(img_dir), jobs=2, repair=True)
+
+    assert report['marked'] == 3
+    stats = state.get_db_stats()
+    assert stats[RedisKeys.STAT_BYTES] == 16
+    assert stats[RedisKeys.STAT_STORED] == stored
+
+
+def test_repair_skips_content_already_counted(state, img_dir, monkeypatch):
+    monkeypatch.setattr(DOWNLOAD_CONFIG, 'dedup', 'hardlink')
+    store = storage.get_store(str(img_dir))
+    download(store, '1_p0.png', b'shared')
+    state.mark_image_downloaded('1', 0, size=6, stored=6)
+    download(store, '2_p0.png', b'shared')
+
+    verify_store(state, str(img_dir), jobs=2, repair=True)
+
+    assert state.get_db_stats()[RedisKeys.STAT_STORED] == 6
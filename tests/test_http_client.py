@@ -0,0 +1,118 @@
+"""HTTP传输层：重试、Retry-After、主机并发槽位的释放和HTTP/2传输"""
+from datetime import timedelta
+
+import pytest
+import requests
+
+import http_client
+from benchmark import StubConfig, _start_h2, _StubServer
+from config import HTTP_CONFIG
+from http_client import HttpClient
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.elapsed = timedelta(milliseconds=20)
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class FakeSession:
+    """按顺序返回预设的响应或抛出预设的异常"""
+
+    def __init__(self, *results):
+        self.results = list(results)
+        self.calls = 0
+
+    def get(self, url, stream=False, **kwargs):
+        self.calls += 1
+        result = self.results.pop(0)
+        if isinstance(result, BaseException):
+            raise result
+        return result
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(HttpClient, '_instance', None)
+    sleeps = []
+    monkeypatch.setattr(http_client.time, 'sleep', sleeps.append)
+    instance = HttpClient()
+    instance.sleeps = sleeps
+    return instance
+
+
+def _use(client, monkeypatch, session):
+    monkeypatch.setattr(client, '_get_session', lambda host: session)
+    return client._get_limiter('i.pximg.net')
+
+
+def test_retry_after_is_honoured(client, monkeypatch, metrics):
+    monkeypatch.setattr(HTTP_CONFIG, 'backoff_base', 0.0)
+    busy = FakeResponse(503, {'Retry-After': '0.05'})
+    session = FakeSession(busy, FakeResponse(200))
+    limiter = _use(client, monkeypatch, session)
+
+    response = client.get('https://i.pximg.net/a.jpg')
+    assert response.status_code == 200
+    assert busy.closed
+    assert client.sleeps == [0.05]
+    assert limiter.in_flight == 0
+    retries, = metrics.snapshot()['counters']['pixiv_retries_total']
+    assert retries['labels'] == {'cause': 'http_503'}
+
+
+def test_network_errors_exhaust_retries(client, monkeypatch):
+    session = FakeSession(*[requests.ConnectionError('reset')] * 3)
+    limiter = _use(client, monkeypatch, session)
+    with pytest.raises(requests.ConnectionError):
+        client.get('https://i.pximg.net/a.jpg', retries=2)
+    assert session.calls == 3
+    assert len(client.sleeps) == 2
+    assert limiter.in_flight == 0
+
+
+def test_last_retryable_status_is_returned(client, monkeypatch):
+    session = FakeSession(FakeResponse(429), FakeResponse(429))
+    _use(client, monkeypatch, session)
+    assert client.get('https://i.pximg.net/a.jpg', retries=1).status_code == 429
+
+
+def test_stream_releases_slot_on_error(client, monkeypatch):
+    response = FakeResponse(200)
+    limiter = _use(client, monkeypatch, FakeSession(response))
+    with pytest.raises(ValueError):
+        with client.stream('https://i.pximg.net/a.jpg'):
+            assert limiter.in_flight == 1
+            raise ValueError('disk full')
+    assert response.closed
+    assert limiter.in_flight == 0
+
+
+def test_backoff_is_capped():
+    for attempt in range(20):
+        assert 0 <= HttpClient.backoff(attempt) <= HTTP_CONFIG.backoff_max
+
+
+def test_http2_stream(client):
+    pytest.importorskip('httpx')
+    pytest.importorskip('h2')
+    stub = _StubServer(StubConfig(latency_ms=0, image_kb=64, image_max_kb=256))
+    port = _start_h2(stub)
+    paths = [f'/img-original/img/2024/01/01/00/00/00/{pid}_p0.png' for pid in range(1, 5)]
+    try:
+        client.require_http2()
+        for path in paths:
+            with client.stream(f'http://localhost:{port}{path}', http2=True) as response:
+                assert response.status_code == 200
+                assert b''.join(response.iter_content(4096)) == stub.blob[:stub.image_size(path)]
+        assert client.get(f'http://localhost:{port}/missing', http2=True).status_code == 404
+    finally:
+        client.close()
+        stub.server_close()
+    # 请求结束后主机槽位全部归还
+    assert client._get_limiter(f'localhost:{port}').in_flight == 0
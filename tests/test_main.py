@@ -0,0 +1,136 @@
+"""命令行入口：参数解析、延迟导入、分布式子命令、统计读取和状态导出导入"""
+import io
+import json
+import subprocess
+import sys
+
+import pytest
+
+import main
+from config import DOWNLOAD_CONFIG, PIPELINE_CONFIG, STATE_CONFIG
+
+
+@pytest.fixture
+def options(monkeypatch):
+    """命令行会改写全局配置，测试结束后恢复"""
+    monkeypatch.setattr(STATE_CONFIG, 'backend', STATE_CONFIG.backend)
+    monkeypatch.setattr(DOWNLOAD_CONFIG, 'img_dir', DOWNLOAD_CONFIG.img_dir)
+    monkeypatch.setattr(DOWNLOAD_CONFIG, 'layout', DOWNLOAD_CONFIG.layout)
+    monkeypatch.setattr(PIPELINE_CONFIG, 'download_workers', PIPELINE_CONFIG.download_workers)
+    monkeypatch.setattr(PIPELINE_CONFIG, 'schedule_policy', PIPELINE_CONFIG.schedule_policy)
+
+
+def test_run_options_update_config(options):
+    args = main.build_parser().parse_args([
+        'crawl', '--db', '2', '--workers', '3', '--schedule', 'fair',
+        '--output', '/tmp/img', '--layout', 'id', '--backend', 'sqlite'
+    ])
+    main._apply_options(args)
+    assert args.func is main.cmd_crawl and args.db == 2 and args.mode == 'daily'
+    assert PIPELINE_CONFIG.download_workers == 3
+    assert PIPELINE_CONFIG.schedule_policy == 'fair'
+    assert DOWNLOAD_CONFIG.img_dir == '/tmp/img'
+    assert DOWNLOAD_CONFIG.layout == 'id'
+    assert STATE_CONFIG.backend == 'sqlite'
+
+
+def test_entry_point_imports_no_heavy_modules():
+    code = (
+        'import sys, main; '
+        'print(sorted(m for m in ("redis", "requests", "rich") if m in sys.modules))'
+    )
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == '[]'
+
+
+def test_resp_reader():
+    stream = io.BytesIO(b'*3\r\n$1\r\n7\r\n$-1\r\n:42\r\n+OK\r\n-ERR bad\r\n')
+    assert main._resp_read(stream) == ['7', None, 42]
+    assert main._resp_read(stream) == 'OK'
+    with pytest.raises(RuntimeError):
+        main._resp_read(stream)
+    with pytest.raises(ConnectionError):
+        main._resp_read(stream)
+
+
+def test_clear_requires_yes_without_tty(monkeypatch, capsys):
+    monkeypatch.setattr(sys, 'stdin', io.StringIO())
+    assert main.main(['clear', '--db', '0']) == 2
+    assert '--yes' in capsys.readouterr().err
+
+
+def test_export_import_between_backends(redis_state, sqlite_state, options, tmp_path, capsys):
+    redis_state.complete_work('1', 2)
+    redis_state.mark_image_downloaded('2', 0)
+    dump = str(tmp_path / 'state.jsonl')
+
+    assert main.main(['export', '--db', '0', '--backend', 'redis', '--file', dump]) == 0
+    assert main.main(['import', '--db', '0', '--backend', 'sqlite', '--file', dump]) == 0
+    assert sqlite_state.is_work_complete('1')
+    assert sqlite_state.is_image_downloaded('2', 0)
+
+    capsys.readouterr()
+    assert main.main(['stats', '--db', '0', '--backend', 'sqlite', '--json']) == 0
+    stats = json.loads(capsys.readouterr().out)
+    assert (stats['db'], stats['works'], stats['images']) == (0, 1, 1)
+
+
+class FakeSpider:
+    def __init__(self, local_cache=None):
+        self.local_cache = local_cache
+        self.calls = []
+
+    def publish_ranking(self, mode):
+        self.calls.append(('ranking', mode))
+        return 3
+
+    def publish_backfill(self, start, end, modes):
+        self.calls.append(('backfill', str(start), str(end), modes))
+        return 5
+
+    def run_worker(self, idle_exit=False):
+        self.calls.append(('worker', idle_exit))
+
+
+@pytest.fixture
+def spiders(monkeypatch, options):
+    created = []
+
+    def create(args, local_cache=None):
+        created.append(FakeSpider(local_cache))
+        return created[-1]
+
+    monkeypatch.setattr(main, '_create_spider', create)
+    return created
+
+
+def test_worker_subcommand(spiders):
+    assert main.main(['worker', '--db', '1', '--backend', 'redis', '--workers', '2', '--idle-exit']) == 0
+    spider, = spiders
+    assert spider.local_cache == 'none'
+    assert spider.calls == [('worker', True)]
+    assert PIPELINE_CONFIG.download_workers == 2
+
+
+def test_publish_subcommands(spiders, capsys):
+    assert main.main(['publish', 'ranking', '--backend', 'redis', '--mode', 'weekly']) == 0
+    assert main.main([
+        'publish', 'backfill', '--backend', 'redis',
+        '--start', '2024-01-01', '--end', '2024-01-03', '--modes', 'daily,weekly'
+    ]) == 0
+    assert [spider.calls[0] for spider in spiders] == [
+        ('ranking', 'weekly'),
+        ('backfill', '2024-01-01', '2024-01-03', ['daily', 'weekly'])
+    ]
+    assert '已发布 5 个作品任务' in capsys.readouterr().err
+
+
+@pytest.mark.parametrize('argv', [
+    ['worker', '--backend', 'sqlite'],
+    ['publish', 'ranking', '--backend', 'sqlite'],
+    ['publish', 'backfill', '--backend', 'redis', '--start', '2024-01-01'],
+    ['publish', 'backfill', '--backend', 'redis', '--start', '2024-02-01', '--end', '2024-01-01'],
+])
+def test_distributed_subcommands_reject_invalid_options(spiders, argv):
+    assert main.main(argv) == 2
+    assert spiders == []
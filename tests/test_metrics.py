@@ -0,0 +1,73 @@
+"""运行指标：计数器、直方图导出和timed装饰器"""
+import json
+
+import pytest
+
+from metrics import Metrics, timed
+
+
+def test_disabled_registry_records_nothing():
+    registry = Metrics()
+    registry.enabled = False
+    registry.inc('pixiv_retries_total', cause='http_429')
+    registry.enable()
+    assert registry.snapshot()['counters'] == {}
+    registry.enabled = False
+
+
+def test_render_prometheus(metrics):
+    metrics.inc('pixiv_download_bytes_total', 100)
+    metrics.inc('pixiv_download_bytes_total', 50)
+    metrics.observe('pixiv_stage_seconds', 0.003, stage='image', op='download')
+    metrics.observe('pixiv_stage_seconds', 100.0, stage='image', op='download')
+
+    lines = metrics.render_prometheus().splitlines()
+    assert '# TYPE pixiv_download_bytes_total counter' in lines
+    assert 'pixiv_download_bytes_total 150' in lines
+    assert '# TYPE pixiv_stage_seconds histogram' in lines
+    assert 'pixiv_stage_seconds_bucket{op="download",stage="image",le="0.001"} 0' in lines
+    assert 'pixiv_stage_seconds_bucket{op="download",stage="image",le="0.005"} 1' in lines
+    assert 'pixiv_stage_seconds_bucket{op="download",stage="image",le="60.0"} 1' in lines
+    assert 'pixiv_stage_seconds_bucket{op="download",stage="image",le="+Inf"} 2' in lines
+    assert 'pixiv_stage_seconds_count{op="download",stage="image"} 2' in lines
+
+
+def test_snapshot_quantiles(metrics):
+    for _ in range(99):
+        metrics.observe('pixiv_transfer_seconds', 0.02)
+    metrics.observe('pixiv_transfer_seconds', 42.0)
+
+    series, = metrics.snapshot()['histograms']['pixiv_transfer_seconds']
+    assert series['count'] == 100
+    assert series['p50'] == 0.025
+    assert series['p99'] == 0.025
+    assert series['max'] == 42.0
+
+
+def test_timed_records_duration_and_failures(metrics):
+    @timed('state')
+    def lookup(fail):
+        if fail:
+            raise KeyError('x')
+        return 1
+
+    assert lookup(False) == 1
+    with pytest.raises(KeyError):
+        lookup(True)
+
+    snapshot = metrics.snapshot()
+    series, = snapshot['histograms']['pixiv_stage_seconds']
+    assert series['labels'] == {'stage': 'state', 'op': 'lookup'}
+    assert series['count'] == 2
+    assert snapshot['counters']['pixiv_failures_total'] == [
+        {'labels': {'cause': 'KeyError', 'stage': 'state'}, 'value': 1}
+    ]
+
+
+def test_write_summary(metrics, tmp_path):
+    metrics.inc('pixiv_retries_total', cause='timeout')
+    path = metrics.write_summary(str(tmp_path / 'metrics'), {'failed_works': 3})
+    with open(path, encoding='utf-8') as f:
+        summary = json.load(f)
+    assert summary['failed_works'] == 3
+    assert summary['counters']['pixiv_retries_total'][0]['value'] == 1
@@ -0,0 +1,94 @@
+"""下载流水线：异常不能让工作线程退出，失败作品也要计入进度"""
+import threading
+
+import pytest
+import redis
+
+from config import PipelineConfig
+from pixiv_pipeline import DownloadPipeline
+from tests.conftest import FakeDownloader, FakeProgress
+
+
+def run_pipeline(downloader, works, timeout=10.0, **config):
+    """在后台线程运行流水线，超时视为卡死"""
+    progress = FakeProgress()
+    done = []
+    pipeline = DownloadPipeline(
+        downloader,
+        progress,
+        progress.add_task('total'),
+        fetch_ranking=lambda page: {},
+        log=lambda message: None,
+        config=PipelineConfig(**config),
+        on_work_done=lambda work_id, success, cause: done.append((work_id, success))
+    )
+    thread = threading.Thread(target=pipeline.run, kwargs={'works': works}, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    assert not thread.is_alive(), '流水线没有结束'
+    return pipeline, progress, done
+
+
+def test_metadata_error_does_not_hang(redis_state):
+    downloader = FakeDownloader(
+        {'1': ['u/1_p0'], '2': ['u/2_p0', 'u/2_p1']},
+        redis_state,
+        fail_meta={'1': redis.ConnectionError('connection refused')}
+    )
+    pipeline, progress, done = run_pipeline(downloader, ['1', '2'], metadata_workers=1)
+
+    assert pipeline.failure_causes == {'1': 'metadata:ConnectionError'}
+    assert sorted(done) == [('1', False), ('2', True)]
+    assert progress.advanced[1] == 2
+    assert downloader.completed == ['2']
+
+
+def test_download_error_fails_work_but_drains(redis_state):
+    downloader = FakeDownloader(
+        {'1': ['u/1_p0', 'u/1_p1', 'u/1_p2'], '2': ['u/2_p0']},
+        redis_state,
+        fail_urls={'u/1_p1': FileExistsError('u/1_p1.link')}
+    )
+    pipeline, _, done = run_pipeline(downloader, ['1', '2'], download_workers=1)
+
+    assert pipeline.failure_causes == {'1': 'image:FileExistsError'}
+    assert sorted(done) == [('1', False), ('2', True)]
+    # 失败作品的其他页照常下载，但作品不标记为完成
+    assert sorted(downloader.downloaded) == ['u/1_p0', 'u/1_p2', 'u/2_p0']
+    assert downloader.completed == ['2']
+
+
+def test_complete_error_is_recorded(redis_state, monkeypatch):
+    downloader = FakeDownloader({'1': ['u/1_p0', 'u/1_p1']}, redis_state)
+
+    def broken(work_id, total):
+        raise redis.ConnectionError('connection reset')
+
+    monkeypatch.setattr(downloader, 'complete_work', broken)
+    pipeline, _, done = run_pipeline(downloader, ['1'])
+
+    assert pipeline.failure_causes == {'1': 'state:ConnectionError'}
+    assert done == [('1', False)]
+
+
+@pytest.mark.parametrize('error', [ValueError('bad json'), redis.ConnectionError('down')])
+def test_ranking_error_skips_page(redis_state, error):
+    downloader = FakeDownloader({'1': ['u/1_p0']}, redis_state)
+    progress = FakeProgress()
+    pages = {1: error, 2: {'1': False}}
+
+    def fetch_ranking(page):
+        result = pages[page]
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    pipeline = DownloadPipeline(
+        downloader, progress, progress.add_task('total'), fetch_ranking, log=lambda message: None,
+        config=PipelineConfig(ranking_workers=1)
+    )
+    thread = threading.Thread(target=pipeline.run, kwargs={'pages': [1, 2]}, daemon=True)
+    thread.start()
+    thread.join(10)
+    assert not thread.is_alive()
+    assert downloader.completed == ['1']
@@ -0,0 +1,77 @@
+"""下载后处理：钩子执行、感知哈希和进程池写回"""
+from dataclasses import replace
+
+import pytest
+
+from config import POSTPROCESS_CONFIG, RedisKeys
+from postprocess import PostProcessor, _run_hooks, phash, thumbnail
+
+Image = pytest.importorskip('PIL.Image')
+
+
+def _gradient(path, size=64, flip=False):
+    """左上暗右下亮的渐变，带一个圆形亮斑；flip为True时明暗反转"""
+    image = Image.new('L', (size, size))
+    pixels = []
+    for y in range(size):
+        for x in range(size):
+            value = (x + y) * 127 // size
+            if (x - size // 4) ** 2 + (y - size // 3) ** 2 < (size // 5) ** 2:
+                value = 250
+            pixels.append(255 - value if flip else value)
+    image.putdata(pixels)
+    image.save(path)
+    return str(path)
+
+
+def _distance(a, b):
+    return bin(int(a, 16) ^ int(b, 16)).count('1')
+
+
+@pytest.fixture
+def config(tmp_path):
+    return replace(POSTPROCESS_CONFIG, output_dir=str(tmp_path / 'derived'), thumbnail_size=16, workers=1)
+
+
+def _broken(path, relative, config):
+    raise OSError('bad image')
+
+
+def test_run_hooks_isolates_failures(tmp_path, config):
+    path = _gradient(tmp_path / '1_p0.png')
+    hooks = [('broken', _broken, None), ('phash', phash, RedisKeys.FIELD_PHASH)]
+    fields, errors = _run_hooks(hooks, path, '1_p0.png', 0, config)
+    assert list(fields) == ['h0']
+    assert errors == {'broken': 'OSError'}
+
+
+def test_phash_is_stable_under_resize(tmp_path, config):
+    small = phash(_gradient(tmp_path / 'a.png', 64), '', config)
+    large = phash(_gradient(tmp_path / 'b.png', 256), '', config)
+    flipped = phash(_gradient(tmp_path / 'c.png', 64, flip=True), '', config)
+    assert len(small) == 16
+    assert _distance(small, large) <= 10
+    assert _distance(small, flipped) > 32
+
+
+def test_thumbnail_keeps_relative_path(tmp_path, config):
+    path = _gradient(tmp_path / 'src.png')
+    thumbnail(path, 'ab/1_p0.png', config)
+    with Image.open(tmp_path / 'derived' / 'thumbs' / 'ab' / '1_p0.jpg') as image:
+        assert max(image.size) == 16
+
+
+def test_unknown_hook_is_rejected(redis_state, config):
+    with pytest.raises(ValueError):
+        PostProcessor(redis_state, replace(config, hooks=('missing',)))
+
+
+def test_processor_writes_results(redis_state, tmp_path, config):
+    processor = PostProcessor(redis_state, replace(config, hooks=('phash',)))
+    try:
+        assert processor.submit('1', 2, _gradient(tmp_path / '1_p2.png'), '1_p2.png')
+        processor.wait()
+    finally:
+        processor._pool.shutdown()
+    value = redis_state.client.hget(RedisKeys.WORK.format(pid='1'), 'h2')
+    assert value and len(value) == 16
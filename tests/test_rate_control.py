@@ -0,0 +1,147 @@
+"""并发控制：传输预算与AIMD主机并发限制"""
+import threading
+import time
+from email.utils import formatdate
+
+import pytest
+
+from config import HttpConfig
+from rate_control import AdaptiveLimiter, TransferBudget, parse_retry_after
+
+
+def test_budget_reserves_bytes_and_files():
+    budget = TransferBudget(max_bytes=100, max_files=2)
+    assert budget.try_acquire(60)
+    assert not budget.try_acquire(50)  # 字节不足
+    assert budget.try_acquire(40)
+    assert not budget.try_acquire(0)  # 文件数已满
+    assert budget.describe() == 'mem 0/0MB files 2/2'
+    budget.release(60)
+    budget.release(40)
+    assert (budget.bytes, budget.files) == (0, 0)
+
+
+def test_oversize_file_allowed_when_idle():
+    budget = TransferBudget(max_bytes=100, max_files=4)
+    assert budget.try_acquire(500)
+    assert not budget.try_acquire(1)
+    budget.release(500)
+
+
+def test_acquire_waits_for_release():
+    budget = TransferBudget(max_bytes=100, max_files=4)
+    budget.acquire(80)
+    acquired = threading.Event()
+
+    def waiter():
+        with budget.reserve(50):
+            acquired.set()
+
+    thread = threading.Thread(target=waiter, daemon=True)
+    thread.start()
+    assert not acquired.wait(0.05)
+    budget.release(80)
+    assert acquired.wait(1)
+    thread.join(1)
+    assert (budget.bytes, budget.files) == (0, 0)
+
+
+def test_wait_available_blocks_producers_when_exhausted():
+    budget = TransferBudget(max_bytes=100, max_files=4)
+    budget.acquire(100)
+    assert not budget.wait_available(timeout=0.01)
+    threading.Timer(0.02, budget.release, args=(100,)).start()
+    assert budget.wait_available(timeout=1)
+
+
+def make_limiter(max_limit=8, **overrides):
+    options = dict(min_concurrency=1, initial_concurrency=2, decrease_factor=0.5,
+                   latency_factor=3.0, decrease_cooldown=0.0)
+    options.update(overrides)
+    return AdaptiveLimiter(max_limit, HttpConfig(**options))
+
+
+def finish(limiter, status=200, latency=0.1, retry_after=None):
+    limiter.acquire()
+    limiter.release(status, latency, retry_after)
+
+
+def test_limiter_additive_increase_up_to_max():
+    limiter = make_limiter(max_limit=4)
+    assert limiter.describe() == '2/4'
+    for _ in range(3):
+        finish(limiter)
+    assert limiter.describe() == '3/4'  # 每个请求加1/limit，约一个窗口加1
+    for _ in range(50):
+        finish(limiter)
+    assert limiter.limit == 4
+
+
+@pytest.mark.parametrize('status', [429, 403, 500, 503, None])
+def test_limiter_multiplicative_decrease(status):
+    limiter = make_limiter()
+    limiter.limit = 8.0
+    finish(limiter, status)
+    assert limiter.limit == 4.0
+    finish(limiter, status)
+    finish(limiter, status)
+    finish(limiter, status)
+    assert limiter.limit == 1.0  # 不低于下限
+
+
+def test_limiter_cooldown_halves_once_per_burst():
+    limiter = make_limiter(decrease_cooldown=60.0)
+    limiter.limit = 8.0
+    for _ in range(5):
+        finish(limiter, 429)
+    assert limiter.limit == 4.0
+
+
+def test_limiter_decreases_on_latency_spike():
+    limiter = make_limiter()
+    limiter.limit = 8.0
+    for _ in range(5):
+        finish(limiter, latency=0.1)
+    before = limiter.limit
+    finish(limiter, latency=5.0)
+    assert limiter.limit == before * 0.5
+
+
+def test_limiter_blocks_during_retry_after():
+    limiter = make_limiter()
+    finish(limiter, 429, retry_after=0.2)
+    start = time.monotonic()
+    limiter.acquire()
+    assert time.monotonic() - start >= 0.15
+    limiter.release(200, 0.1)
+
+
+def test_limiter_caps_in_flight():
+    limiter = make_limiter(initial_concurrency=2)
+    limiter.acquire()
+    limiter.acquire()
+    third = threading.Event()
+
+    def worker():
+        limiter.acquire()
+        third.set()
+
+    threading.Thread(target=worker, daemon=True).start()
+    assert not third.wait(0.05)
+    limiter.release(200, 0.1)
+    assert third.wait(1)
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('5', 5.0),
+    ('-1', 0.0),
+    (None, None),
+    ('soon', None),
+])
+def test_parse_retry_after(value, expected):
+    assert parse_retry_after(value) == expected
+
+
+def test_parse_retry_after_http_date():
+    value = formatdate(time.time() + 30, usegmt=True)
+    assert 28 <= parse_retry_after(value) <= 31
@@ -0,0 +1,140 @@
+"""Redis状态客户端：计数脚本、SCAN遍历和旧格式键迁移"""
+import pytest
+
+from config import REDIS_CONFIG, RedisKeys
+from redis_client import RedisClient
+
+
+@pytest.mark.parametrize('key, value, expected', [
+    ('downloaded:12_p3', 'true', ('12', 'p3', '1')),
+    ('downloaded:12_p3', 'false', None),
+    ('downloaded:12', 'complete', ('12', 'c', '1')),
+    ('downloaded:12', 'partial', None),
+    ('total_pages:12', '4', ('12', 't', '4')),
+    ('12', '9876', ('12', 'u', '9876')),
+    ('12', None, None),
+    ('cookie', 'abc', None),
+])
+def test_parse_legacy_key(key, value, expected):
+    assert RedisClient._parse_legacy_key(key, value) == expected
+
+
+def test_migrate_legacy_keys(redis_state):
+    raw = redis_state.client
+    raw.mset({
+        'downloaded:12_p0': 'true',
+        'downloaded:12_p1': 'true',
+        'downloaded:12': 'complete',
+        'total_pages:12': '2',
+        '12': '9876',
+        # 无法识别的值，必须原样保留
+        'downloaded:13_p0': 'yes',
+        'downloaded:13': 'partial',
+    })
+    raw.sadd('14', 'member')
+
+    skipped = []
+    migrated = redis_state.migrate_legacy_keys(batch_size=3, skipped=skipped)
+
+    assert migrated == 5
+    assert sorted(skipped) == ['14', 'downloaded:13', 'downloaded:13_p0']
+    assert raw.hgetall(RedisKeys.WORK.format(pid='12')) == {'p0': '1', 'p1': '1', 'c': '1', 't': '2', 'u': '9876'}
+    assert raw.get('downloaded:13_p0') == 'yes'
+    assert raw.get('downloaded:13') == 'partial'
+    assert raw.smembers('14') == {'member'}
+    assert redis_state.get_db_stats()[RedisKeys.STAT_IMAGES] == 2
+    assert redis_state.get_db_stats()[RedisKeys.STAT_WORKS] == 1
+
+
+def test_migrate_keeps_newer_state(redis_state):
+    raw = redis_state.client
+    redis_state.mark_image_downloaded('12', 0)
+    redis_state.store_user_id('12', '1111')
+    raw.mset({'downloaded:12_p0': 'true', '12': '9876'})
+
+    assert redis_state.migrate_legacy_keys() == 2
+    assert raw.hget(RedisKeys.WORK.format(pid='12'), 'u') == '1111'
+    # 已经计入的图片页不重复计数
+    assert redis_state.get_db_stats()[RedisKeys.STAT_IMAGES] == 1
+
+
+def test_set_once_script_counts_first_write_only(redis_state):
+    raw = redis_state.client
+    key = RedisKeys.WORK.format(pid='12')
+    for _ in range(3):
+        redis_state._mark('12', 'p0', RedisKeys.STAT_IMAGES, '#bytes', '100', 'u', '77')
+    assert raw.hgetall(key) == {'p0': '1', 'u': '77'}
+    assert raw.hgetall(RedisKeys.STATS) == {RedisKeys.STAT_IMAGES: '1', 'bytes': '100'}
+
+
+def test_batched_marks_and_unmarks_keep_counters(redis_state):
+    assert redis_state.mark_images_downloaded([('1', 0, 10, True), ('1', 1, 10, False)]) == 2
+    assert redis_state.mark_images_downloaded([('1', 0, 10, True)]) == 0
+    assert redis_state.unmark_images([('1', 0), ('1', 5)]) == 1
+    stats = redis_state.get_db_stats()
+    assert stats[RedisKeys.STAT_IMAGES] == 1
+    assert stats[RedisKeys.STAT_STORED] == 10
+
+
+def test_scan_iteration_includes_legacy_keys(redis_state, monkeypatch):
+    monkeypatch.setattr(REDIS_CONFIG, 'read_legacy', True)
+    redis_state.complete_work('1', 1)
+    redis_state.mark_image_downloaded('2', 0)
+    redis_state.client.mset({'downloaded:3': 'complete', 'downloaded:3_p0': 'true'})
+
+    assert sorted(redis_state.iter_work_ids(batch_size=1)) == ['1', '2', '3']
+    assert sorted(redis_state.iter_work_ids(complete_only=True, batch_size=1)) == ['1', '3']
+    assert redis_state.is_image_downloaded('3', 0)
+    assert redis_state.is_work_complete('3')
+
+    monkeypatch.setattr(REDIS_CONFIG, 'read_legacy', False)
+    assert not redis_state.is_work_complete('3')
+
+
+def test_rebuild_stats_from_scan(redis_state):
+    redis_state.mark_image_downloaded('1', 0)
+    redis_state.mark_image_downloaded('1', 1)
+    redis_state.complete_work('1', 2)
+    redis_state.client.delete(RedisKeys.STATS)
+    assert redis_state.rebuild_stats(batch_size=1) == {RedisKeys.STAT_WORKS: 1, RedisKeys.STAT_IMAGES: 2}
+
+
+def test_rebuild_stats_counts_legacy_only_db(redis_state, monkeypatch):
+    monkeypatch.setattr(REDIS_CONFIG, 'read_legacy', True)
+    redis_state.client.mset({
+        'downloaded:100_p0': 'true',
+        'downloaded:100_p1': 'true',
+        'downloaded:100': 'complete',
+        'downloaded:101_p0': 'false',
+        'downloaded:102': 'partial',
+    })
+    expected = {RedisKeys.STAT_WORKS: 1, RedisKeys.STAT_IMAGES: 2}
+    assert redis_state.rebuild_stats(batch_size=1) == expected
+    assert redis_state.get_db_stats()[RedisKeys.STAT_IMAGES] == 2
+
+
+def test_rebuild_stats_counts_mixed_records_once(redis_state, monkeypatch):
+    monkeypatch.setattr(REDIS_CONFIG, 'read_legacy', True)
+    redis_state.complete_work('100', 1)
+    redis_state.mark_image_downloaded('100', 0)
+    redis_state.client.mset({
+        'downloaded:100_p0': 'true',
+        'downloaded:100_p1': 'true',
+        'downloaded:100': 'complete',
+    })
+    assert redis_state.rebuild_stats() == {RedisKeys.STAT_WORKS: 1, RedisKeys.STAT_IMAGES: 2}
+
+
+def test_iter_work_ids_dedups_and_checks_legacy_values(redis_state, monkeypatch):
+    monkeypatch.setattr(REDIS_CONFIG, 'read_legacy', True)
+    redis_state.complete_work('1', 1)
+    redis_state.mark_image_downloaded('1', 0)
+    redis_state.client.mset({
+        'downloaded:1': 'complete',
+        'downloaded:1_p0': 'true',
+        'downloaded:2': 'partial',
+        'downloaded:2_p0': 'true',
+        'downloaded:3_p0': 'false',
+    })
+    assert sorted(redis_state.iter_work_ids(batch_size=1)) == ['1', '2']
+    assert list(redis_state.iter_work_ids(complete_only=True, batch_size=1)) == ['1']
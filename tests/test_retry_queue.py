@@ -0,0 +1,68 @@
+"""失败作品重试队列：指数退避与死信(两种后端)"""
+import time
+
+import pytest
+
+from config import RETRY_CONFIG, RedisKeys
+
+
+@pytest.fixture
+def retry_config(monkeypatch):
+    monkeypatch.setattr(RETRY_CONFIG, 'max_attempts', 3)
+    monkeypatch.setattr(RETRY_CONFIG, 'backoff_base', 0.0)
+    monkeypatch.setattr(RETRY_CONFIG, 'backoff_max', 3600.0)
+    monkeypatch.setattr(RETRY_CONFIG, 'dead_letter_limit', 2)
+    return RETRY_CONFIG
+
+
+def test_schedule_and_clear(state, retry_config):
+    assert state.schedule_retries({}) == {'scheduled': 0, 'dead': 0}
+    assert state.schedule_retries({'1': 'image:http_404', '2': 'metadata:no_images'}) == {'scheduled': 2, 'dead': 0}
+    assert sorted(state.due_retries()) == ['1', '2']
+    assert len(state.due_retries(limit=1)) == 1
+
+    state.clear_retries(['1'])
+    assert state.due_retries() == ['2']
+    assert state.get_retry_stats() == {'pending': 1, 'due': 1, 'dead': 0}
+
+
+def test_dead_letter_after_max_attempts(state, retry_config):
+    for _ in range(2):
+        assert state.schedule_retries({'1': 'image:ConnectionError'}) == {'scheduled': 1, 'dead': 0}
+    assert state.schedule_retries({'1': 'image:http_403 "quoted"'}) == {'scheduled': 0, 'dead': 1}
+
+    assert state.due_retries() == []
+    dead = state.get_dead_letters()
+    assert [(item['pid'], item['attempts'], item['cause']) for item in dead] == [
+        ('1', 3, 'image:http_403 "quoted"')
+    ]
+    # 清除后重新失败从第1次开始计数
+    assert state.schedule_retries({'1': 'image:ConnectionError'}) == {'scheduled': 1, 'dead': 0}
+
+
+def test_dead_letters_are_trimmed(state, retry_config):
+    retry_config.max_attempts = 1
+    state.schedule_retries({'1': 'a', '2': 'b', '3': 'c'})
+    assert state.get_retry_stats()['dead'] == 2
+    assert sorted(item['pid'] for item in state.get_dead_letters()) == ['2', '3']
+
+
+def test_exponential_backoff(redis_state, retry_config):
+    retry_config.backoff_base = 100.0
+    retry_config.backoff_max = 300.0
+    delays = []
+    for _ in range(2):
+        now = time.time()
+        redis_state.schedule_retries({'1': 'x'})
+        delays.append(redis_state.client.zscore(RedisKeys.RETRY_DUE, '1') - now)
+    retry_config.max_attempts = 10
+    for _ in range(2):
+        now = time.time()
+        redis_state.schedule_retries({'1': 'x'})
+        delays.append(redis_state.client.zscore(RedisKeys.RETRY_DUE, '1') - now)
+
+    # 抖动系数0.5~1.0：100, 200, 400->300(上限), 300
+    for delay, full in zip(delays, (100, 200, 300, 300)):
+        assert full * 0.5 - 1 <= delay <= full + 1
+    assert redis_state.due_retries() == []
+    assert redis_state.get_retry_stats() == {'pending': 1, 'due': 0, 'dead': 0}
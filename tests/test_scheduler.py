@@ -0,0 +1,89 @@
+"""图片页调度器：各策略的出队顺序与有界接收"""
+import queue
+import threading
+
+import pytest
+
+from pixiv_pipeline import _STOP, PageScheduler, WorkState
+
+
+def work(order, total, name=None):
+    """构造作品状态和全部待下载页"""
+    name = name or f'w{order}'
+    state = WorkState(name, total=total, remaining=total, order=order)
+    return state, [(index, f'{name}/{index}') for index in range(total)]
+
+
+def drain(scheduler):
+    urls = []
+    while True:
+        item = scheduler.get(timeout=1)
+        if item is _STOP:
+            return urls
+        urls.append(item[2])
+
+
+@pytest.mark.parametrize('policy, expected', [
+    ('ranking', ['w0/0', 'w0/1', 'w0/2', 'w1/0', 'w2/0', 'w2/1']),
+    ('smallest', ['w1/0', 'w2/0', 'w2/1', 'w0/0', 'w0/1', 'w0/2']),
+    ('fair', ['w0/0', 'w1/0', 'w2/0', 'w0/1', 'w2/1', 'w0/2']),
+])
+def test_policy_order(policy, expected):
+    scheduler = PageScheduler(policy)
+    for item in (work(0, 3), work(1, 1), work(2, 2)):
+        scheduler.put(item)
+    scheduler.put(_STOP)
+    assert drain(scheduler) == expected
+
+
+def test_unknown_policy():
+    with pytest.raises(ValueError):
+        PageScheduler('random')
+
+
+def test_stop_after_all_pages():
+    scheduler = PageScheduler('ranking')
+    scheduler.put(_STOP)
+    scheduler.put(work(0, 2))
+    assert [scheduler.get(timeout=1)[1] for _ in range(2)] == [0, 1]
+    assert scheduler.get(timeout=1) is _STOP
+    with pytest.raises(queue.Empty):
+        scheduler.get(timeout=0.01)
+
+
+def test_single_image_not_behind_manga_when_full():
+    """调度器已满时，之后放入的单图作品仍先于大型作品剩余的页"""
+    scheduler = PageScheduler('smallest', maxsize=4)
+    scheduler.put(work(0, 10, 'manga'))  # 空调度器接收超过上限的作品
+    with pytest.raises(queue.Full):
+        scheduler.put(work(1, 20, 'next-manga'), timeout=0.01)
+
+    admitted = threading.Event()
+
+    def producer():
+        scheduler.put(work(2, 1, 'single'))
+        admitted.set()
+
+    thread = threading.Thread(target=producer, daemon=True)
+    thread.start()
+    assert not admitted.wait(0.05)
+
+    order = [scheduler.get(timeout=1)[2] for _ in range(7)]
+    thread.join(1)
+    assert admitted.is_set()
+    # 下载到只剩3页时单图作品被接收，接下来立即出队
+    assert order == [f'manga/{i}' for i in range(7)]
+    assert scheduler.get(timeout=1)[2] == 'single/0'
+    assert scheduler.qsize() == 3
+
+
+def test_bounded_put_waits_for_room():
+    scheduler = PageScheduler('fair', maxsize=3)
+    scheduler.put(work(0, 2))
+    scheduler.put(work(1, 1))
+    assert scheduler.qsize() == 3
+    with pytest.raises(queue.Full):
+        scheduler.put(work(2, 1), timeout=0.01)
+    scheduler.get(timeout=1)
+    scheduler.put(work(2, 1), timeout=0.01)
+    assert scheduler.qsize() == 3
@@ -0,0 +1,33 @@
+"""爬虫初始化：工作进程不载入本地去重缓存"""
+import pytest
+
+from config import REDIS_CONFIG
+from pixiv_spider import PixivSpider
+
+
+@pytest.fixture
+def loads(redis_state, monkeypatch):
+    """记录从Redis载入本地缓存的次数"""
+    calls = []
+    original = redis_state.iter_work_ids
+
+    def iter_work_ids(*args, **kwargs):
+        calls.append(kwargs)
+        return original(*args, **kwargs)
+
+    monkeypatch.setattr(redis_state, 'iter_work_ids', iter_work_ids)
+    monkeypatch.setattr(REDIS_CONFIG, 'local_cache', 'set')
+    redis_state.mark_work_complete('1')
+    return calls
+
+
+def test_default_loads_configured_cache(redis_state, loads):
+    PixivSpider(0, headless=True)
+    assert len(loads) == 1
+    assert redis_state.get_works_complete(['1', '2']) == {'1': True, '2': False}
+
+
+def test_worker_skips_cache_load(redis_state, loads):
+    PixivSpider(0, headless=True, local_cache='none')
+    assert loads == []
+    assert redis_state._local_cache is None
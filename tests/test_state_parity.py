@@ -0,0 +1,116 @@
+"""Redis与SQLite状态存储的行为一致性"""
+import subprocess
+import sys
+
+import pytest
+
+from config import RedisKeys
+from state_codec import decode_urls, encode_urls
+
+
+def test_image_and_work_state(state):
+    assert state.get_works_complete(['1', '2']) == {'1': False, '2': False}
+    state.mark_image_downloaded('1', 0, size=10, stored=10)
+    state.mark_image_downloaded('1', 0, size=10, stored=10)  # 重复标记不重复计数
+    state.mark_image_downloaded('1', 2, size=5, stored=0)
+
+    assert state.is_image_downloaded('1', 0)
+    assert not state.is_image_downloaded('1', 1)
+    assert state.get_downloaded_pages('1', 3) == {0, 2}
+
+    state.complete_work('1', 3)
+    state.complete_work('1', 3)
+    assert state.is_work_complete('1')
+    assert state.get_total_pages('1') == 3
+    assert state.get_works_complete(['1', '2']) == {'1': True, '2': False}
+    assert state.get_db_stats() == {
+        RedisKeys.STAT_WORKS: 1,
+        RedisKeys.STAT_IMAGES: 2,
+        RedisKeys.STAT_BYTES: 15,
+        RedisKeys.STAT_STORED: 10,
+    }
+
+
+def test_unmark_and_rebuild_stats(state):
+    state.mark_images_downloaded([('1', 0, 3, True), ('1', 1, 3, False), ('2', 0, 4, True)])
+    state.mark_work_complete('2')
+
+    assert state.unmark_images([('1', 1), ('3', 0)]) == 1
+    assert state.get_downloaded_pages('1', 2) == {0}
+    rebuilt = state.rebuild_stats()
+    assert rebuilt == {RedisKeys.STAT_WORKS: 1, RedisKeys.STAT_IMAGES: 2}
+
+
+def test_ranking_sync_and_user_ids(state):
+    state.complete_work('1', 1)
+    assert state.sync_ranking_works({'1': '10', '2': '20'}) == {'1': True, '2': False}
+    assert state.get_user_id('2') == '20'
+    state.delete_user_id('2')
+    assert state.get_user_id('2') is None
+
+
+def test_backfill_checkpoints(state):
+    assert state.get_backfill_done() == set()
+    state.add_backfill_done(['daily:20240101', 'weekly:20240101'])
+    state.add_backfill_done(['daily:20240101'])
+    assert state.get_backfill_done() == {'daily:20240101', 'weekly:20240101'}
+
+
+def test_export_roundtrip(state):
+    state.mark_image_downloaded('1', 0)
+    state.set_work_fields('1', {'h0': 'abcd'})
+    states = dict(state.iter_work_states())
+    assert states['1'][RedisKeys.FIELD_PAGE.format(page=0)] == '1'
+    assert states['1']['h0'] == 'abcd'
+
+
+def test_metric_labels_match(redis_state, sqlite_state, metrics):
+    """两种后端的耗时指标使用相同的阶段和操作名，便于并列比较"""
+    def labels(client):
+        metrics.enable()
+        client.mark_image_downloaded('1', 0)
+        client.get_downloaded_pages('1', 1)
+        client.complete_work('1', 1)
+        series = metrics.snapshot()['histograms']['pixiv_stage_seconds']
+        return sorted((item['labels']['stage'], item['labels']['op']) for item in series)
+
+    assert labels(redis_state) == labels(sqlite_state) == [
+        ('state', 'complete_work'),
+        ('state', 'get_downloaded_pages'),
+        ('state', 'mark_image_downloaded'),
+    ]
+
+
+def test_sqlite_backend_does_not_import_redis():
+    code = 'import sys, sqlite_state; print("redis" in sys.modules)'
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == 'False'
+
+
+@pytest.mark.parametrize('urls, compact', [
+    (['https://i.pximg.net/img/1_p0.jpg', 'https://i.pximg.net/img/1_p1.png'], True),
+    (['https://i.pximg.net/img/1_p0.jpg', None], False),
+    (['https://i.pximg.net/img/2_p0.jpg'], False),
+])
+def test_url_codec_roundtrip(urls, compact):
+    value = encode_urls('1', urls)
+    assert value.startswith('[') is not compact
+    assert decode_urls('1', value) == urls
+
+
+def test_shared_methods_are_timed_on_both_backends():
+    """两种后端共有的方法都记录state阶段耗时(SQLite中的空实现除外)"""
+    from redis_client import RedisClient
+    from sqlite_state import SqliteStateClient
+
+    no_ops = {'enable_local_cache', 'migrate_legacy_keys'}
+
+    def timed_methods(cls):
+        return {
+            name for name in dir(cls)
+            if not name.startswith('_') and hasattr(getattr(cls, name), '__wrapped__')
+        }
+
+    shared = {name for name in dir(SqliteStateClient) if not name.startswith('_')} & set(dir(RedisClient))
+    assert (timed_methods(RedisClient) & shared) - no_ops == timed_methods(SqliteStateClient)
+    assert {'get_cookie', 'set_cookie'} <= timed_methods(SqliteStateClient)
@@ -0,0 +1,91 @@
+"""图片目录：布局记录"""
+import os
+
+import pytest
+
+import storage
+from config import DOWNLOAD_CONFIG
+from storage import ImageStore, get_store
+
+
+@pytest.fixture
+def img_dir(tmp_path, monkeypatch):
+    """临时图片目录，清空进程内共享的图片目录实例"""
+    monkeypatch.setattr(storage, '_stores', {})
+    monkeypatch.setattr(DOWNLOAD_CONFIG, 'img_dir', str(tmp_path))
+    monkeypatch.setattr(DOWNLOAD_CONFIG, 'layout', None)
+    monkeypatch.setattr(DOWNLOAD_CONFIG, 'dedup', 'none')
+    return tmp_path
+
+
+def write(store, pid, page, data=b'data'):
+    """模拟下载完成：写入文件并记录清单"""
+    relative = store.relative_path(f'{pid}_p{page}.png')
+    store.ensure_dir(relative)
+    with open(store.path(relative), 'wb') as fp:
+        fp.write(data)
+    store.record(pid, page, relative, len(data), 'x' * 64)
+    return relative
+
+
+def test_layout_is_recorded_and_reused(img_dir):
+    store = ImageStore(str(img_dir), 'id')
+    write(store, '120456789', 0)
+    store.manifest.close()
+
+    reopened = ImageStore(str(img_dir))
+    assert reopened.layout == 'id'
+    assert reopened.find('120456789', 0) == str(img_dir / '120' / '456' / '120456789_p0.png')
+
+
+def test_new_directory_defaults_to_flat(img_dir):
+    assert get_store().layout == 'flat'
+    assert not (img_dir / storage.MANIFEST_NAME).exists()
+
+
+def test_mismatched_layout_is_refused(img_dir):
+    write(get_store(), '1', 0)
+
+    with pytest.raises(ValueError, match='flat'):
+        get_store(layout='id')
+    DOWNLOAD_CONFIG.layout = 'id'
+    with pytest.raises(ValueError):
+        get_store()
+
+
+def test_relayout_persists_new_layout(img_dir):
+    write(get_store(), '120456789', 0)
+    (img_dir / '120456790_p0.png').write_bytes(b'more')
+
+    report = get_store(layout='id', check=False).migrate(workers=2)
+
+    assert report['files'] == 2
+    storage._stores.clear()
+    store = get_store()
+    assert store.layout == 'id'
+    assert os.path.exists(store.find('120456790', 0))
+    # 之后的下载写入新布局
+    assert write(store, '7', 0) == '000/000/7_p0.png'
+
+
+def test_relayout_only_from_flat(img_dir):
+    write(get_store(layout='id'), '1', 0)
+    with pytest.raises(ValueError):
+        get_store(layout='date', check=False).migrate()
+
+
+def test_hardlink_dedup_replaces_stale_temp_link(img_dir):
+    store = ImageStore(str(img_dir), 'flat', dedup='hardlink')
+    digest = 'ab' * 32
+    for name in ('1_p0.png', '2_p0.png'):
+        (img_dir / name).write_bytes(b'same')
+    assert store.store_content('1_p0.png', digest) == ('1_p0.png', True)
+
+    # 上次中断留下的临时链接
+    (img_dir / '2_p0.png.link').write_bytes(b'stale')
+    assert store.store_content('2_p0.png', digest) == ('2_p0.png', False)
+
+    blob = os.stat(store.path(store.blob_path(digest)))
+    assert os.stat(img_dir / '2_p0.png').st_ino == blob.st_ino
+    assert blob.st_nlink == 3
+    assert not (img_dir / '2_p0.png.link').exists()
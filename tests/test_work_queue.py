@@ -0,0 +1,74 @@
+"""分布式任务队列：领取、加锁、确认、失败重发和转入重试队列"""
+from dataclasses import replace
+
+import pytest
+
+from config import QUEUE_CONFIG, RETRY_CONFIG, RedisKeys
+from work_queue import QueueConsumer, WorkQueue
+
+
+@pytest.fixture
+def queue_config():
+    return replace(QUEUE_CONFIG, consumer='a', block_ms=1, claim_count=4, max_attempts=2)
+
+
+def test_lock_is_owned_by_consumer(redis_state, queue_config):
+    first = WorkQueue(redis_state, queue_config)
+    second = WorkQueue(redis_state, replace(queue_config, consumer='b'))
+    assert first.lock('1')
+    assert not second.lock('1')
+    # 非持有者不能释放锁
+    second.unlock('1')
+    assert not second.lock('1')
+    first.unlock('1')
+    assert second.lock('1')
+
+
+def test_consumer_skips_complete_and_acks(redis_state, queue_config):
+    work_queue = WorkQueue(redis_state, queue_config)
+    work_queue.ensure_group()
+    work_queue.ensure_group()
+    redis_state.complete_work('2', 1)
+    assert work_queue.publish(['1', '2', '3'], 'ranking') == 3
+
+    consumer = QueueConsumer(work_queue, log=lambda message: None, idle_exit=True)
+    works = consumer.works()
+    assert next(works) == '1'
+    assert next(works) == '3'
+    # 已完成的作品2在领取时直接确认
+    assert work_queue.pending_count() == 2
+
+    consumer.on_work_done('1', True)
+    consumer.on_work_done('3', True)
+    assert work_queue.pending_count() == 0
+    assert list(works) == []
+
+
+def test_failed_work_is_republished_until_max_attempts(redis_state, queue_config):
+    work_queue = WorkQueue(redis_state, queue_config)
+    work_queue.publish(['1'], 'ranking')
+    logs = []
+    consumer = QueueConsumer(work_queue, log=logs.append, idle_exit=True)
+
+    attempts = 0
+    for work_id in consumer.works():
+        attempts += 1
+        consumer.on_work_done(work_id, False, 'image:http_404')
+    assert attempts == queue_config.max_attempts
+    assert work_queue.pending_count() == 0
+    assert logs and '已失败 2 次，移入重试队列' in logs[0]
+    # 放弃重新发布后进入持久重试队列，失败原因一并保存
+    assert redis_state.get_retry_stats()['pending'] == 1
+    assert redis_state.client.hget(RedisKeys.RETRY_INFO, '1') is not None
+
+
+def test_exhausted_work_goes_to_dead_letters(redis_state, queue_config, monkeypatch):
+    monkeypatch.setattr(RETRY_CONFIG, 'max_attempts', 1)
+    work_queue = WorkQueue(redis_state, replace(queue_config, max_attempts=1))
+    work_queue.publish(['1'], 'ranking')
+    logs = []
+    consumer = QueueConsumer(work_queue, log=logs.append, idle_exit=True)
+    for work_id in consumer.works():
+        consumer.on_work_done(work_id, False, 'metadata:no_images')
+    assert '移入死信列表' in logs[0]
+    assert redis_state.get_retry_stats()['dead'] == 1
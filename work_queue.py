@@ -0,0 +1,268 @@
+"""基于Redis Streams的分布式作品任务队列"""
+import os
+import socket
+import threading
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import redis
+
+from config import QUEUE_CONFIG, QueueConfig, RedisKeys
+from redis_client import RedisClient
+
+# 仅当锁仍由自己持有时释放
+_UNLOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+# 仅当锁仍由自己持有时续期
+_RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+class WorkQueue:
+    """
+    作品任务流
+
+    生产者把作品ID发布到流中，工作进程通过消费者组领取任务。
+    已领取但未确认的任务超过租约时长后会被其他工作进程接管；
+    每个作品处理期间持有带过期时间的锁，避免重复发布的任务被并发处理。
+    """
+
+    def __init__(self, redis_client: RedisClient, config: QueueConfig = QUEUE_CONFIG):
+        """
+        初始化任务队列
+
+        参数:
+            redis_client: Redis客户端
+            config: 队列配置
+        """
+        self.redis = redis_client
+        self.config = config
+        self.consumer = config.consumer or f"{socket.gethostname()}-{os.getpid()}"
+        self._unlock = self.redis.client.register_script(_UNLOCK_SCRIPT)
+        self._renew = self.redis.client.register_script(_RENEW_SCRIPT)
+
+    @property
+    def _client(self) -> redis.Redis:
+        return self.redis.client
+
+    def ensure_group(self) -> None:
+        """创建消费者组(已存在时忽略)"""
+        try:
+            self._client.xgroup_create(
+                RedisKeys.QUEUE_STREAM,
+                RedisKeys.QUEUE_GROUP,
+                id='0',
+                mkstream=True
+            )
+        except redis.exceptions.ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+
+    def publish(self, work_ids: Iterable[str], source: str, attempt: int = 1) -> int:
+        """
+        批量发布作品任务(一次往返)
+
+        参数:
+            work_ids: 作品ID
+            source: 任务来源(ranking/backfill/retry)
+            attempt: 第几次尝试
+
+        返回:
+            int: 发布的任务数
+        """
+        pipe = self._client.pipeline(transaction=False)
+        count = 0
+        for work_id in work_ids:
+            pipe.xadd(RedisKeys.QUEUE_STREAM, {
+                'pid': work_id,
+                'source': source,
+                'attempt': str(attempt)
+            })
+            count += 1
+        if count:
+            pipe.execute()
+        return count
+
+    def claim(self) -> List[Tuple[str, Dict[str, str]]]:
+        """
+        领取任务：优先接管超过租约的任务，其次读取新任务
+
+        返回:
+            list: (消息ID, 字段)列表，队列为空时阻塞block_ms后返回空列表
+        """
+        cfg = self.config
+        reclaimed = self._client.xautoclaim(
+            RedisKeys.QUEUE_STREAM,
+            RedisKeys.QUEUE_GROUP,
+            self.consumer,
+            min_idle_time=cfg.lease_ms,
+            start_id='0-0',
+            count=cfg.claim_count
+        )
+        entries = [entry for entry in reclaimed[1] if entry and entry[1]]
+        if entries:
+            return entries
+
+        result = self._client.xreadgroup(
+            RedisKeys.QUEUE_GROUP,
+            self.consumer,
+            {RedisKeys.QUEUE_STREAM: '>'},
+            count=cfg.claim_count,
+            block=cfg.block_ms
+        )
+        return result[0][1] if result else []
+
+    def ack(self, entry_id: str) -> None:
+        """确认任务完成并从流中删除"""
+        pipe = self._client.pipeline(transaction=False)
+        pipe.xack(RedisKeys.QUEUE_STREAM, RedisKeys.QUEUE_GROUP, entry_id)
+        pipe.xdel(RedisKeys.QUEUE_STREAM, entry_id)
+        pipe.execute()
+
+    def lock(self, work_id: str) -> bool:
+        """尝试获取作品处理锁"""
+        key = RedisKeys.WORK_LOCK.format(pid=work_id)
+        return bool(self._client.set(key, self.consumer, nx=True, px=self.config.lease_ms))
+
+    def unlock(self, work_id: str) -> None:
+        """释放自己持有的作品处理锁"""
+        self._unlock(
+            keys=[RedisKeys.WORK_LOCK.format(pid=work_id)],
+            args=[self.consumer],
+            client=self._client
+        )
+
+    def heartbeat(self, leases: Dict[str, str]) -> None:
+        """
+        续期正在处理的任务：重置待确认消息的空闲时间并延长作品锁
+
+        参数:
+            leases: 作品ID到消息ID的映射
+        """
+        if not leases:
+            return
+        self._client.xclaim(
+            RedisKeys.QUEUE_STREAM,
+            RedisKeys.QUEUE_GROUP,
+            self.consumer,
+            min_idle_time=0,
+            message_ids=list(leases.values()),
+            justid=True
+        )
+        for work_id in leases:
+            self._renew(
+                keys=[RedisKeys.WORK_LOCK.format(pid=work_id)],
+                args=[self.consumer, self.config.lease_ms],
+                client=self._client
+            )
+
+    def pending_count(self) -> int:
+        """已领取但未确认的任务数"""
+        try:
+            return self._client.xpending(RedisKeys.QUEUE_STREAM, RedisKeys.QUEUE_GROUP)['pending']
+        except redis.exceptions.ResponseError:
+            return 0
+
+
+class QueueConsumer:
+    """
+    工作进程的任务来源
+
+    作为下载流水线的作品输入，领取任务、过滤已完成和正被其他进程处理的作品，
+    并在作品处理结束时确认任务或按尝试次数重新发布。
+    """
+
+    def __init__(self, work_queue: WorkQueue, log: Callable[[str], None], idle_exit: bool = False):
+        """
+        初始化消费者
+
+        参数:
+            work_queue: 任务队列
+            log: 日志输出函数
+            idle_exit: 队列为空时是否退出
+        """
+        self.queue = work_queue
+        self.redis = work_queue.redis
+        self.log = log
+        self.idle_exit = idle_exit
+        self._leases: Dict[str, Tuple[str, int]] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def _heartbeat_loop(self) -> None:
+        """定期续期正在处理的任务"""
+        interval = self.queue.config.lease_ms / 3000
+        while not self._stop.wait(interval):
+            with self._lock:
+                leases = {work_id: entry_id for work_id, (entry_id, _) in self._leases.items()}
+            try:
+                self.queue.heartbeat(leases)
+            except redis.exceptions.RedisError as e:
+                self.log(f'[red]任务续期失败：{str(e)}[/red]')
+
+    def works(self) -> Iterable[str]:
+        """
+        持续领取任务并生成待处理的作品ID
+
+        生成:
+            str: 已加锁且未完成的作品ID
+        """
+        self.queue.ensure_group()
+        heartbeat = threading.Thread(target=self._heartbeat_loop, name="queue-heartbeat", daemon=True)
+        heartbeat.start()
+        try:
+            while True:
+                entries = self.queue.claim()
+                if not entries and self.idle_exit:
+                    break
+                for entry_id, fields in entries:
+                    work_id = fields.get('pid')
+                    if not work_id:
+                        self.queue.ack(entry_id)
+                        continue
+                    # 正被其他进程处理：暂不确认，租约到期后重新领取时再判断
+                    if not self.queue.lock(work_id):
+                        continue
+                    # 重复发布或已被其他进程完成的任务直接确认
+                    if self.redis.is_work_complete(work_id):
+                        self.queue.ack(entry_id)
+                        self.queue.unlock(work_id)
+                        continue
+                    with self._lock:
+                        self._leases[work_id] = (entry_id, int(fields.get('attempt', 1)))
+                    yield work_id
+        finally:
+            self._stop.set()
+
+    def on_work_done(self, work_id: str, success: bool, cause: Optional[str] = None) -> None:
+        """
+        作品处理结束：成功时确认任务，失败时按尝试次数重新发布，
+        达到最大尝试次数后写入持久重试队列(或死信列表)，由retry模式稍后处理
+
+        参数:
+            work_id: 作品ID
+            success: 是否成功
+            cause: 失败原因
+        """
+        with self._lock:
+            lease = self._leases.pop(work_id, None)
+        if lease is None:
+            return
+        entry_id, attempt = lease
+        if not success:
+            if attempt < self.queue.config.max_attempts:
+                self.queue.publish([work_id], 'retry', attempt + 1)
+            else:
+                result = self.redis.schedule_retries({work_id: cause or 'unknown'})
+                target = '死信列表' if result['dead'] else '重试队列'
+                self.log(f'[yellow]作品 {work_id} 已失败 {attempt} 次，移入{target}[/yellow]')
+        self.queue.ack(entry_id)
+        self.queue.unlock(work_id)